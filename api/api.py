@@ -1,57 +1,153 @@
 from fastapi import FastAPI, Request, Response, HTTPException
-import requests
+from fastapi.responses import JSONResponse, StreamingResponse
 import json
 import os
-from pymongo import MongoClient
-from datetime import datetime, timedelta
-import re
-import asyncio
+import uuid
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional, Any, Union
-import redis
+import redis.asyncio as aioredis
 from dotenv import load_dotenv
 
+from worker.stream import REDIS_STREAM_KEY, REDIS_STREAM_MAXLEN
+from worker.jobs import JobStore, JobEvents, TERMINAL_STATES
+from worker.metrics import span, render, CONTENT_TYPE_LATEST
+from worker.loopwatch import start_watchdog, get_watchdog
+
 from .parse_message import parse_message
 
 load_dotenv()
 
-app = FastAPI()
+API_REDIS_POOL_SIZE = int(os.getenv("API_REDIS_POOL_SIZE", "64"))
+API_MAX_BATCH = int(os.getenv("API_MAX_BATCH", "500"))
+JOB_WAIT_MAX = float(os.getenv("JOB_WAIT_MAX", "60"))
+JOB_SSE_MAX = float(os.getenv("JOB_SSE_MAX", "300"))
 
 redis_client = None
 
+@asynccontextmanager
+async def lifespan(app):
+        watchdog = start_watchdog()
+        yield
+        if watchdog:
+                await watchdog.stop()
+        await job_events.close()
+        if redis_client is not None:
+                await redis_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
 def get_redis_client():
         global redis_client
         if redis_client is None:
-                redis_client = redis.Redis(host=os.getenv("REDIS_HOST"), port=6379, db=0)
+                # Blocking pool: a burst waits for a free connection instead of failing.
+                pool = aioredis.BlockingConnectionPool(
+                        host=os.getenv("REDIS_HOST"), port=6379, db=0,
+                        max_connections=API_REDIS_POOL_SIZE, timeout=5, socket_timeout=5,
+                )
+                redis_client = aioredis.Redis(connection_pool=pool)
         return redis_client
 
-def push_message(message):
-        try:
-                r = get_redis_client()
-                r.lpush(os.getenv("REDIS_QUEUE_KEY"), message)
-                print(f"Message pushed: {message}")
-        except Exception as e:
-                print(f"Error pushing message: {e}")
+job_store = JobStore(get_redis_client)
+job_events = JobEvents(job_store)
+
+def build_message(body: dict, lane: str = None) -> dict:
+        user_message, chat_id = parse_message(body)
+
+        message = {
+                "job_id": uuid.uuid4().hex,
+                "input": user_message,
+                "chat_id": chat_id,
+                "session_id": f"{chat_id}_session"
+        }
+        # Optional per-request pipeline: "agent" or "fast"
+        if body.get("mode"):
+                message["mode"] = body["mode"]
+        # Scheduling lane: batches are bulk, single messages interactive unless stated.
+        lane = lane or body.get("lane")
+        if lane:
+                message["lane"] = lane
+        return message
+
+async def push_messages(messages: List[dict]):
+        # One round trip for the whole batch.
+        async with get_redis_client().pipeline(transaction=False) as pipe:
+                for message in messages:
+                        job_store.add_queued(pipe, message)
+                        pipe.xadd(
+                                REDIS_STREAM_KEY,
+                                {"data": json.dumps(message, ensure_ascii=False)},
+                                maxlen=REDIS_STREAM_MAXLEN, approximate=True,
+                        )
+                await pipe.execute()
 
 # Настраиваем выполнение запросов
 @app.post(f"/{os.getenv('API_KEY')}")
 async def handle_webhook(request: Request):
+        """Queue one message, or a JSON array of messages, and answer 202 with job ids."""
         try:
-                body = await request.json() 
-                
-                user_message, chat_id = parse_message(body)
-
-                message = {
-                        "input": user_message,
-                        "chat_id": chat_id,
-                        "session_id": f"{chat_id}_session"
-                }
-
-                push_message(json.dumps(message, ensure_ascii=False))
+                body = await request.json()
+                batch = isinstance(body, list)
+                if batch and not 0 < len(body) <= API_MAX_BATCH:
+                        raise ValueError(f"batch must hold 1..{API_MAX_BATCH} messages")
+                messages = [build_message(item, "bulk" if batch else None) for item in (body if batch else [body])]
         except Exception as e:
                 print(f"Error processing message: {e}")
-                return {"status": "error", "reason": str(e)}
+                return JSONResponse({"status": "error", "reason": str(e)}, status_code=400)
+
+        try:
+                with span("api_enqueue"):
+                        await push_messages(messages)
+        except Exception as e:
+                print(f"Error pushing message: {e}")
+                return JSONResponse({"status": "error", "reason": "queue unavailable"}, status_code=503)
+
+        if batch:
+                return JSONResponse({"status": "queued", "job_ids": [m["job_id"] for m in messages]}, status_code=202)
+        job_id = messages[0]["job_id"]
+        return JSONResponse({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"}, status_code=202)
+
+@app.get("/metrics")
+async def metrics():
+        return Response(content=render(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/debug/loop")
+async def loop_report():
+        watchdog = get_watchdog()
+        if watchdog is None:
+                raise HTTPException(status_code=404, detail="loop diagnostics are off (LOOP_DIAGNOSTICS=1)")
+        return watchdog.report()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+        job = await job_store.get(job_id)
+        if job is None:
+                raise HTTPException(status_code=404, detail="job not found")
+        return job
+
+@app.get("/jobs/{job_id}/wait")
+async def wait_job(job_id: str, timeout: float = 30):
+        """Long-poll: answers as soon as the job is done or failed, or with its state at timeout."""
+        job = await job_events.wait(job_id, max(0.0, min(timeout, JOB_WAIT_MAX)))
+        if job is None:
+                raise HTTPException(status_code=404, detail="job not found")
+        return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_event_stream(job_id: str):
+        """Server-sent events: the job on every state change until it is done or failed."""
+        if await job_store.get(job_id) is None:
+                raise HTTPException(status_code=404, detail="job not found")
+
+        async def events():
+                async for job in job_events.watch(job_id, JOB_SSE_MAX):
+                        yield f"event: {job['state']}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+                        if job["state"] in TERMINAL_STATES:
+                                return
+                yield "event: timeout\ndata: {}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # Запуск сервера
 if __name__ == "__main__":
         import uvicorn
-        uvicorn.run(app, host="0.0.0.0", port=11111)
\ No newline at end of file
+        uvicorn.run(app, host="0.0.0.0", port=11111)
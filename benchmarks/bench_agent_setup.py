@@ -0,0 +1,86 @@
+"""Per-message setup overhead of the worker agent, before and after reuse.
+
+"before" rebuilds what handle_message used to build for every message
+(ConversationBufferMemory + MongoChatMessageHistory + AgentExecutor +
+callback handler, resolving the Mongo database each time); "after" is what
+it does now: one history object plus the run input for the shared executor.
+No network is touched: pymongo connects lazily and nothing is invoked.
+
+    python -m benchmarks.bench_agent_setup [-n 2000]
+"""
+import os
+import sys
+import argparse
+import timeit
+import tracemalloc
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:1")
+os.environ.setdefault("MONGODB_KEY", "bench")
+
+from langchain.agents import AgentExecutor
+from langchain.memory import ConversationBufferMemory
+from pymongo import MongoClient
+
+from worker import agent as worker_agent
+from worker.memory import MongoChatMessageHistory
+from worker.callback import PrettyVerboseCallbackHandler
+
+_sync_client = MongoClient(os.environ["MONGODB_URI"])
+
+
+def setup_before(chat_id):
+        client = _sync_client
+        memory = ConversationBufferMemory(
+                memory_key="chat_history",
+                output_key="output",
+                return_messages=True,
+                chat_memory=MongoChatMessageHistory(
+                        session_id=chat_id,
+                        collection=client[os.getenv("MONGODB_KEY")]["chat_history"]
+                )
+        )
+        return AgentExecutor(
+                agent=worker_agent.agent,
+                tools=worker_agent.tools,
+                memory=memory,
+                verbose=False,
+                return_intermediate_steps=True,
+                callbacks=[PrettyVerboseCallbackHandler()]
+        )
+
+
+def setup_after(chat_id):
+        history = worker_agent.get_chat_history(chat_id)
+        # history.messages is left out: both variants read it once per message.
+        return worker_agent.agent_executor, {"user": "", "chat_history": history}
+
+
+def measure(fn, n):
+        per_call = min(timeit.repeat(lambda: fn(12345), number=n, repeat=3)) / n
+        tracemalloc.start()
+        for _ in range(n):
+                fn(12345)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return per_call, peak
+
+
+def main(argv=None):
+        parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+        parser.add_argument("-n", type=int, default=2000, help="setups per timing round")
+        args = parser.parse_args(argv)
+        worker_agent.build_agent()
+
+        results = {}
+        for name, fn in (("before", setup_before), ("after", setup_after)):
+                results[name] = measure(fn, args.n)
+                per_call, peak = results[name]
+                print(f"{name:>6}: {per_call * 1e6:9.1f} us/message   peak alloc {peak / 1024:9.1f} KiB over {args.n} setups")
+
+        speedup = results["before"][0] / results["after"][0]
+        print(f"setup speedup: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+        sys.exit(main())
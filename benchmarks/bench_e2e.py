@@ -0,0 +1,291 @@
+"""End-to-end worker throughput and latency on recorded fixtures, no network.
+
+Drives the real stream listener and handle_message with an in-process Redis
+stand-in (fakeredis), chat history in mongomock-motor, search hits, article
+HTML and LLM replies replayed from benchmarks/fixtures with configurable
+latency, and a fake Telegram endpoint. Messages are added to the stream at a
+fixed arrival rate. Reports msgs/sec, end-to-end and per-stage latency, peak
+RSS and event-loop lag, saves them under benchmarks/results/ and compares
+with the previous run that used the same parameters.
+
+    python -m benchmarks.bench_e2e [-n 200] [--rate 20] [--mode agent|fast]
+        [--llm-latency 0.4] [--search-latency 0.3] [--fetch-latency 0.2]
+
+Needs fakeredis and mongomock-motor (pip install fakeredis mongomock-motor).
+"""
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import resource
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+RESULTS = os.path.join(ROOT, "benchmarks", "results")
+LAG_INTERVAL = 0.05
+
+os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "MONGODB_URI": "mongodb://localhost:1",
+        "MONGODB_KEY": "bench",
+        "REDIS_HOST": "bench",
+        "REDIS_STREAM_KEY": "bench_e2e",
+        "PROGRESSIVE_DELIVERY": "0",
+        "AGENT_VERBOSE": "0",
+})
+
+import redis.asyncio
+import motor.motor_asyncio
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from mongomock_motor import AsyncMongoMockClient
+
+# Every Redis client the worker creates talks to one in-process server.
+_redis_server = FakeServer()
+redis.asyncio.Redis = lambda *args, **kwargs: FakeRedis(server=_redis_server)
+motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient()
+
+from langchain.agents import AgentExecutor, create_openai_functions_agent
+
+from worker import agent as worker_agent
+from worker import response as worker_response
+from worker.offline import install, load_fixtures, OfflineChatModel
+from worker.limiter import llm_limiter
+from worker.metrics import span, STAGE_SECONDS
+from worker.prompts import get_prompt
+from worker.tools import get_tools
+from worker.http_client import close_http_session
+from worker.extract import shutdown_extract_pool
+from worker.jobs import job_store
+
+
+class BenchChatModel(OfflineChatModel):
+        """Fixture LLM behind the same limiter and span as the production model."""
+
+        async def _agenerate(self, *args, **kwargs):
+                async with llm_limiter.acquire():
+                        with span("llm"):
+                                return await super()._agenerate(*args, **kwargs)
+
+
+def percentile(values, p):
+        if not values:
+                return 0.0
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def stage_latencies() -> dict:
+        """count, mean and bucket-interpolated p50/p95 per stage from the metrics histogram."""
+        buckets, counts, sums = {}, {}, {}
+        for metric in STAGE_SECONDS.collect():
+                for sample in metric.samples:
+                        stage = sample.labels.get("stage")
+                        if sample.name.endswith("_bucket"):
+                                buckets.setdefault(stage, []).append((float(sample.labels["le"]), sample.value))
+                        elif sample.name.endswith("_count"):
+                                counts[stage] = sample.value
+                        elif sample.name.endswith("_sum"):
+                                sums[stage] = sample.value
+
+        def quantile(stage, q):
+                target = counts[stage] * q
+                prev_bound, prev_count = 0.0, 0.0
+                for bound, count in sorted(buckets[stage]):
+                        if count >= target:
+                                if bound == float("inf"):
+                                        return prev_bound
+                                share = (target - prev_count) / (count - prev_count) if count > prev_count else 0
+                                return prev_bound + (bound - prev_bound) * share
+                        prev_bound, prev_count = bound, count
+                return prev_bound
+
+        return {
+                stage: {
+                        "count": int(counts[stage]),
+                        "mean_ms": round(sums[stage] / counts[stage] * 1000, 2),
+                        "p50_ms": round(quantile(stage, 0.5) * 1000, 2),
+                        "p95_ms": round(quantile(stage, 0.95) * 1000, 2),
+                }
+                for stage in sorted(counts) if counts[stage]
+        }
+
+
+async def sample_loop_lag(samples: list, stop: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+                start = loop.time()
+                await asyncio.sleep(LAG_INTERVAL)
+                samples.append(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+
+def setup(args):
+        fixtures = load_fixtures(args.fixtures)
+        install(search_latency=args.search_latency, fetch_latency=args.fetch_latency, fixtures=fixtures)
+        llm = BenchChatModel(
+                latency=args.llm_latency,
+                fetches=fixtures["llm"].get("fetches", 2),
+                final=fixtures["llm"].get("final", OfflineChatModel.model_fields["final"].default),
+        )
+        # Set before the first message so ensure_agent() never builds the OpenAI model.
+        worker_agent.chat_model = llm
+        worker_agent.tools = get_tools()
+        worker_agent.agent = create_openai_functions_agent(llm=llm, tools=worker_agent.tools, prompt=get_prompt())
+        worker_agent.agent_executor = AgentExecutor(
+                agent=worker_agent.agent, tools=worker_agent.tools, verbose=False, return_intermediate_steps=True,
+        )
+
+        delivered = {}
+
+        async def telegram_call(method, payload):
+                await asyncio.sleep(args.telegram_latency)
+                delivered[str(payload.get("chat_id"))] = time.perf_counter()
+                return {"ok": True, "result": {"message_id": 1}}
+
+        worker_response.telegram.call = telegram_call
+        return delivered
+
+
+async def run(args) -> dict:
+        delivered = setup(args)
+        r = FakeRedis(server=_redis_server)
+        rng = random.Random(args.seed)
+        stop_listener = asyncio.Event()
+        stop_lag = asyncio.Event()
+        lag = []
+        sent = {}
+
+        lag_task = asyncio.create_task(sample_loop_lag(lag, stop_lag))
+        listener = asyncio.create_task(worker_agent.stream_listener(stop_listener))
+
+        started = time.perf_counter()
+        for i in range(args.n):
+                chat_id = str(100000 + i)  # Telegram-style, so replies are sent
+                message = {
+                        "job_id": uuid.uuid4().hex,
+                        "input": f"Is it true that the northern tram extension was cancelled in the 2025 budget? (report {i})",
+                        "chat_id": chat_id,
+                        "session_id": f"{chat_id}_session",
+                        "mode": args.mode,
+                }
+                sent[chat_id] = time.perf_counter()
+                # Queued the way the API does it, so job updates hit a live record.
+                async with r.pipeline(transaction=False) as pipe:
+                        job_store.add_queued(pipe, message)
+                        pipe.xadd(os.environ["REDIS_STREAM_KEY"], {"data": json.dumps(message)})
+                        await pipe.execute()
+                # Poisson arrivals at the requested mean rate.
+                await asyncio.sleep(rng.expovariate(args.rate))
+
+        deadline = time.perf_counter() + args.timeout
+        while len(delivered) < args.n and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+        finished = max(delivered.values()) if delivered else time.perf_counter()
+
+        stop_listener.set()
+        await listener
+        stop_lag.set()
+        await lag_task
+        await close_http_session()
+        shutdown_extract_pool()
+
+        latencies = [delivered[c] - sent[c] for c in delivered]
+        elapsed = finished - started
+        return {
+                "delivered": len(delivered),
+                "msgs_per_sec": round(len(delivered) / elapsed, 2) if elapsed > 0 else 0.0,
+                "e2e_ms": {
+                        "p50": round(percentile(latencies, 0.50) * 1000, 1),
+                        "p95": round(percentile(latencies, 0.95) * 1000, 1),
+                        "p99": round(percentile(latencies, 0.99) * 1000, 1),
+                        "max": round(max(latencies, default=0) * 1000, 1),
+                },
+                "stages": stage_latencies(),
+                "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+                "loop_lag_ms": {
+                        "mean": round(sum(lag) / len(lag) * 1000, 2) if lag else 0.0,
+                        "p99": round(percentile(lag, 0.99) * 1000, 2),
+                        "max": round(max(lag, default=0) * 1000, 2),
+                },
+        }
+
+
+def _file_hash(path: str) -> str:
+        with open(os.path.join(ROOT, path), "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def _git_revision() -> str:
+        try:
+                return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        except Exception:
+                return ""
+
+
+def save(params: dict, results: dict) -> str:
+        os.makedirs(RESULTS, exist_ok=True)
+        revision = _git_revision()
+        record = {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "git": revision,
+                "files": {p: _file_hash(p) for p in ("worker/tools.py", "worker/agent.py")},
+                "params": params,
+                "results": results,
+        }
+        path = os.path.join(RESULTS, f"e2e-{datetime.now():%Y%m%d-%H%M%S}-{revision or 'nogit'}.json")
+        with open(path, "w", encoding="utf-8") as f:
+                json.dump(record, f, indent=2)
+        return path
+
+
+def previous(params: dict, exclude: str):
+        for path in sorted(glob.glob(os.path.join(RESULTS, "e2e-*.json")), reverse=True):
+                if path == exclude:
+                        continue
+                with open(path, encoding="utf-8") as f:
+                        record = json.load(f)
+                if record.get("params") == params:
+                        return record
+        return None
+
+
+def main(argv=None):
+        parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+        parser.add_argument("-n", type=int, default=200, help="messages to send")
+        parser.add_argument("--rate", type=float, default=20.0, help="mean arrivals per second")
+        parser.add_argument("--mode", choices=("agent", "fast"), default="agent")
+        parser.add_argument("--llm-latency", type=float, default=0.4, help="seconds per LLM call")
+        parser.add_argument("--search-latency", type=float, default=0.3, help="seconds per search engine call")
+        parser.add_argument("--fetch-latency", type=float, default=0.2, help="seconds per page fetch")
+        parser.add_argument("--telegram-latency", type=float, default=0.05, help="seconds per Telegram call")
+        parser.add_argument("--fixtures", default=FIXTURES, help="fixture directory")
+        parser.add_argument("--timeout", type=float, default=300, help="give up waiting for deliveries after this")
+        parser.add_argument("--seed", type=int, default=1)
+        args = parser.parse_args(argv)
+
+        params = {k: v for k, v in vars(args).items() if k not in ("fixtures", "timeout")}
+        results = asyncio.run(run(args))
+        path = save(params, results)
+
+        print(json.dumps(results, indent=2))
+        print(f"saved to {os.path.relpath(path, ROOT)}")
+        before = previous(params, path)
+        if before:
+                old = before["results"]
+                print(f"vs {before['git'] or '?'} ({before['timestamp']}): "
+                      f"msgs/sec {old['msgs_per_sec']} -> {results['msgs_per_sec']}, "
+                      f"p95 {old['e2e_ms']['p95']} -> {results['e2e_ms']['p95']} ms, "
+                      f"loop lag max {old['loop_lag_ms']['max']} -> {results['loop_lag_ms']['max']} ms")
+
+
+if __name__ == "__main__":
+        sys.exit(main())
@@ -0,0 +1,106 @@
+"""Webhook ingestion throughput: requests/sec and latency percentiles.
+
+Starts the API in-process with uvicorn and posts single messages and
+JSON-array batches to the webhook with a fixed number of concurrent
+clients. Needs a reachable Redis (REDIS_HOST, default localhost); entries
+go to a throwaway stream that is deleted afterwards.
+
+    python -m benchmarks.bench_ingest [-n 5000] [-c 64] [--batch 50]
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import threading
+
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("API_KEY", "bench")
+os.environ["REDIS_STREAM_KEY"] = os.getenv("BENCH_STREAM_KEY", "bench_ingest")
+
+import httpx
+import redis
+import uvicorn
+
+from api.api import app
+from worker.stream import REDIS_STREAM_KEY
+
+
+def _free_port() -> int:
+        with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                return s.getsockname()[1]
+
+
+def start_server(port: int) -> uvicorn.Server:
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+                time.sleep(0.05)
+        return server
+
+
+def percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(url, requests_total, concurrency, batch):
+        payload = {"message": "The Eiffel Tower was moved to Berlin in 2024", "chat_id": 12345}
+        body = [payload] * batch if batch > 1 else payload
+        latencies, errors = [], 0
+        queue = asyncio.Queue()
+        for _ in range(requests_total):
+                queue.put_nowait(None)
+
+        async def client_loop(client):
+                nonlocal errors
+                while not queue.empty():
+                        queue.get_nowait()
+                        start = time.perf_counter()
+                        response = await client.post(url, json=body)
+                        latencies.append(time.perf_counter() - start)
+                        if response.status_code != 202:
+                                errors += 1
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+                start = time.perf_counter()
+                await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+                elapsed = time.perf_counter() - start
+        return {
+                "rps": len(latencies) / elapsed,
+                "msgs_per_sec": len(latencies) * batch / elapsed,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "errors": errors,
+        }
+
+
+def main(argv=None):
+        parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+        parser.add_argument("-n", type=int, default=5000, help="requests per scenario")
+        parser.add_argument("-c", type=int, default=64, help="concurrent clients")
+        parser.add_argument("--batch", type=int, default=50, help="messages per batch request")
+        args = parser.parse_args(argv)
+
+        sync_redis = redis.Redis(host=os.environ["REDIS_HOST"], port=6379, db=0)
+        sync_redis.delete(REDIS_STREAM_KEY)
+        port = _free_port()
+        server = start_server(port)
+        url = f"http://127.0.0.1:{port}/{os.environ['API_KEY']}"
+        try:
+                for name, batch in (("single", 1), (f"batch x{args.batch}", args.batch)):
+                        stats = asyncio.run(run(url, args.n, args.c, batch))
+                        print(
+                                f"{name:>10}: {stats['rps']:8.0f} req/s  {stats['msgs_per_sec']:9.0f} msg/s  "
+                                f"p50 {stats['p50_ms']:6.1f} ms  p99 {stats['p99_ms']:6.1f} ms  errors {stats['errors']}"
+                        )
+        finally:
+                server.should_exit = True
+                sync_redis.delete(REDIS_STREAM_KEY)
+
+
+if __name__ == "__main__":
+        sys.exit(main())
@@ -14,7 +14,7 @@ async def send_message_to_api(payload: dict):
 
         async with httpx.AsyncClient() as client:
                 response = await client.post(url, json=payload, headers=headers)
-                if response.status_code != 200:
+                if response.status_code not in (200, 202):
                         print(f"API error {response.status_code}: {response.text}")
                 
 
@@ -10,6 +10,8 @@ from typing import Dict, List, Optional, Any, Union
 import redis
 from dotenv import load_dotenv
 
+from worker.stream import REDIS_STREAM_KEY, REDIS_STREAM_MAXLEN
+
 load_dotenv()
 
 app = FastAPI()
@@ -25,7 +27,7 @@ def get_redis_client():
 def push_message(message):
         try:
                 r = get_redis_client()
-                r.lpush(os.getenv("REDIS_QUEUE_KEY"), message)
+                r.xadd(REDIS_STREAM_KEY, {"data": message}, maxlen=REDIS_STREAM_MAXLEN, approximate=True)
                 print(f"Message pushed: {message}")
         except Exception as e:
                 print(f"Error pushing message: {e}")
@@ -0,0 +1,46 @@
+import pytest
+from fakeredis.aioredis import FakeRedis
+from mongomock_motor import AsyncMongoMockClient
+
+from worker import agent
+from worker import response
+from worker.delivery import DeliveryStore
+from worker.memory import AsyncMongoChatMessageHistory
+
+REPORT = "\n\n".join(["a" * 3000, "b" * 3000, "c" * 3000])
+
+
+@pytest.fixture
+def worker(monkeypatch):
+        redis = FakeRedis()
+        collection = AsyncMongoMockClient().db.chat_history
+        sent, runs, fail_on = [], [], set()
+
+        async def fake_send(method, payload, parse_mode):
+                if len(sent) + 1 in fail_on:
+                        fail_on.discard(len(sent) + 1)
+                        return {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+                sent.append(payload["text"])
+                return {"ok": True, "result": {"message_id": len(sent)}}
+
+        async def fake_agent(user_input, chat_history, callbacks=None):
+                runs.append(user_input)
+                return REPORT
+
+        async def no_hit(text):
+                return None
+
+        async def no_store(text, report):
+                pass
+
+        async def alone(key, fn, waiting=None):
+                return await fn()
+
+        monkeypatch.setattr(agent, "delivery_store", DeliveryStore(get_redis=lambda: redis))
+        monkeypatch.setattr(agent, "get_chat_history", lambda chat_id: AsyncMongoChatMessageHistory(chat_id, collection))
+        monkeypatch.setattr(agent, "run_agent", fake_agent)
+        monkeypatch.setattr(agent.verdict_cache, "lookup", no_hit)
+        monkeypatch.setattr(agent.verdict_cache, "store", no_store)
+        monkeypatch.setattr(agent.single_flight, "do", alone)
+        monkeypatch.setattr(response.telegram, "_with_fallback", fake_send)
+        return {"collection": collection, "sent": sent, "runs": runs, "fail_on": fail_on, "report": REPORT}
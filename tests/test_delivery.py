@@ -0,0 +1,44 @@
+import json
+import asyncio
+
+from worker import agent
+from worker import response
+from worker.memory import aflush_pending
+
+
+def test_retry_resends_only_undelivered_chunks(worker):
+        message = json.dumps({"chat_id": "42", "input": "Is the bridge closed?", "mode": "agent"})
+        worker["fail_on"].add(2)
+
+        async def run():
+                first = await agent.handle_message(message, "1-0")
+                await aflush_pending()
+                stored_after_failure = await worker["collection"].count_documents({})
+                second = await agent.handle_message(message, "1-0")
+                await aflush_pending()
+                return first, stored_after_failure, second
+
+        first, stored_after_failure, second = asyncio.run(run())
+        assert (first, second) == (False, True)
+        assert stored_after_failure == 0
+        assert worker["runs"] == ["Is the bridge closed?"]
+        assert worker["sent"] == response.split_message(worker["report"])
+        assert asyncio.run(worker["collection"].count_documents({})) == 2
+
+
+def test_permanent_failure_writes_history_once(worker, monkeypatch):
+        async def blocked(method, payload, parse_mode):
+                return {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+
+        monkeypatch.setattr(response.telegram, "_with_fallback", blocked)
+        message = json.dumps({"chat_id": "43", "input": "Is the bridge closed?", "mode": "agent"})
+
+        async def run():
+                ok = await agent.handle_message(message, "2-0")
+                await aflush_pending()
+                return ok, await agent.delivery_store.get("2-0")
+
+        ok, pending = asyncio.run(run())
+        assert ok is True
+        assert pending is None
+        assert asyncio.run(worker["collection"].count_documents({})) == 2
@@ -0,0 +1,40 @@
+import time
+import asyncio
+
+import pytest
+
+from worker import extract
+
+
+def _sleep(seconds: float) -> float:
+        time.sleep(seconds)
+        return seconds
+
+
+@pytest.fixture
+def pool(monkeypatch):
+        monkeypatch.setattr(extract, "EXTRACT_WORKERS", 2)
+        monkeypatch.setattr(extract, "EXTRACT_TIMEOUT", 1.5)
+        extract.shutdown_extract_pool()
+        yield
+        extract.shutdown_extract_pool()
+
+
+def test_timeout_kills_only_the_hung_page(pool):
+        async def run():
+                # Start the children so spawning isn't counted in either timeout.
+                await asyncio.gather(extract._run_in_pool(_sleep, 0), extract._run_in_pool(_sleep, 0))
+                hung = asyncio.create_task(extract._run_in_pool(_sleep, 30))
+                await asyncio.sleep(1.0)
+                # Still parsing when the hung page's pool is killed at 1.5s.
+                other = asyncio.create_task(extract._run_in_pool(_sleep, 0.8))
+                return await asyncio.gather(hung, other, return_exceptions=True)
+
+        hung, other = asyncio.run(run())
+        assert isinstance(hung, asyncio.TimeoutError)
+        assert other == 0.8
+
+
+def test_extract_text_async(pool):
+        text = asyncio.run(extract.extract_text_async("<html><body><p>Hello <b>world</b></p></body></html>", ""))
+        assert "Hello" in text and "world" in text
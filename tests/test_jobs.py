@@ -0,0 +1,38 @@
+import asyncio
+
+from fakeredis.aioredis import FakeRedis
+
+from worker.jobs import JobStore, job_key, JOB_TTL
+
+
+def test_update_skips_a_missing_job():
+        async def run():
+                redis = FakeRedis()
+                store = JobStore(get_redis=lambda: redis)
+                await store.update("gone", "done", report="verdict")
+                return await redis.exists(job_key("gone")), await store.get("gone")
+
+        assert asyncio.run(run()) == (0, None)
+
+
+def test_update_keeps_the_record_and_its_ttl():
+        async def run():
+                redis = FakeRedis()
+                store = JobStore(get_redis=lambda: redis)
+                async with redis.pipeline(transaction=False) as pipe:
+                        store.add_queued(pipe, {"job_id": "j1", "chat_id": None, "input": "claim"})
+                        await pipe.execute()
+                await redis.expire(job_key("j1"), 60)
+                async with redis.pubsub() as pubsub:
+                        await pubsub.subscribe("job:j1:events")
+                        await pubsub.get_message(timeout=1)
+                        await store.update("j1", "done", report="verdict", mode="fast")
+                        event = await pubsub.get_message(timeout=1)
+                return await store.get("j1"), await redis.ttl(job_key("j1")), event
+
+        job, ttl, event = asyncio.run(run())
+        assert job["state"] == "done"
+        assert job["report"] == "verdict"
+        assert job["created_at"] > 0
+        assert JOB_TTL - 5 < ttl <= JOB_TTL
+        assert event["type"] == "message"
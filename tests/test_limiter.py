@@ -0,0 +1,59 @@
+import json
+import asyncio
+
+from worker import agent
+from worker.limiter import AdaptiveLimiter
+
+
+class RateLimitError(Exception):
+        status_code = 429
+
+
+class Consumer:
+        def __init__(self):
+                self.acked = []
+
+        async def ack(self, entry_id):
+                self.acked.append(entry_id)
+
+
+def test_overload_in_handle_message_backs_off(worker, monkeypatch):
+        async def rate_limited(user_input, chat_history, callbacks=None):
+                raise RateLimitError("Rate limit reached for gpt-4o")
+
+        limiter = AdaptiveLimiter("messages", initial=8)
+        monkeypatch.setattr(agent, "message_limiter", limiter)
+        monkeypatch.setattr(agent, "run_agent", rate_limited)
+        consumer = Consumer()
+        data = json.dumps({"chat_id": "44", "input": "Is the bridge closed?", "mode": "agent"}).encode()
+
+        asyncio.run(agent.process_entry(consumer, b"3-0", data))
+        assert limiter.overloads == 1
+        assert limiter.limit == 4
+        assert consumer.acked == []
+
+
+def test_telegram_429_backs_off(worker, monkeypatch):
+        async def throttled(method, payload, parse_mode):
+                return {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 5"}
+
+        limiter = AdaptiveLimiter("messages", initial=8)
+        monkeypatch.setattr(agent, "message_limiter", limiter)
+        monkeypatch.setattr(agent.telegram, "_with_fallback", throttled)
+        data = json.dumps({"chat_id": "45", "input": "Is the bridge closed?", "mode": "agent"}).encode()
+
+        asyncio.run(agent.process_entry(Consumer(), b"4-0", data))
+        assert limiter.overloads == 1
+
+
+def test_other_errors_do_not_back_off(worker, monkeypatch):
+        async def broken(user_input, chat_history, callbacks=None):
+                raise ValueError("bad tool output")
+
+        limiter = AdaptiveLimiter("messages", initial=8)
+        monkeypatch.setattr(agent, "message_limiter", limiter)
+        monkeypatch.setattr(agent, "run_agent", broken)
+        data = json.dumps({"chat_id": "46", "input": "Is the bridge closed?", "mode": "agent"}).encode()
+
+        asyncio.run(agent.process_entry(Consumer(), b"5-0", data))
+        assert limiter.overloads == 0
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages.base import messages_to_dict
+from mongomock_motor import AsyncMongoMockClient
+
+from worker.memory import AsyncMongoChatMessageHistory, aflush_pending
+
+
+def test_sync_messages_load_from_mongo_on_cache_miss():
+        async def run():
+                collection = AsyncMongoMockClient().db.chat_history
+                now = datetime.now(timezone.utc)
+                await collection.insert_many([
+                        {"session_id": "cold", "message": m, "timestamp": now}
+                        for m in messages_to_dict([HumanMessage("claim"), AIMessage("verdict")])
+                ])
+                history = AsyncMongoChatMessageHistory("cold", collection)
+                return await asyncio.to_thread(lambda: history.messages)
+
+        assert [m.content for m in asyncio.run(run())] == ["claim", "verdict"]
+
+
+def test_sync_add_and_clear_from_a_thread():
+        async def run():
+                collection = AsyncMongoMockClient().db.chat_history
+                history = AsyncMongoChatMessageHistory("threaded", collection)
+                await asyncio.to_thread(history.add_messages, [HumanMessage("claim"), AIMessage("verdict")])
+                await asyncio.sleep(0)
+                await aflush_pending()
+                stored = await collection.count_documents({})
+                await asyncio.to_thread(history.clear)
+                return stored, await collection.count_documents({})
+
+        assert asyncio.run(run()) == (2, 0)
+
+
+def test_sync_read_on_the_loop_thread_needs_the_async_api():
+        async def run():
+                history = AsyncMongoChatMessageHistory("on-loop", AsyncMongoMockClient().db.chat_history)
+                return history.messages
+
+        with pytest.raises(RuntimeError):
+                asyncio.run(run())
+
+
+def test_sync_api_without_a_loop_raises():
+        history = AsyncMongoChatMessageHistory("no-loop", AsyncMongoMockClient().db.chat_history)
+        with pytest.raises(RuntimeError):
+                history.clear()
@@ -0,0 +1,28 @@
+import json
+
+from worker.scheduler import FairScheduler, classify, SCHED_CHAT_MAX_IN_FLIGHT
+
+
+def entry(i, **message):
+        return classify(f"{1000 + i}-0", json.dumps({"input": "claim", **message}).encode())
+
+
+def test_jobs_without_a_chat_are_not_one_queue():
+        scheduler = FairScheduler()
+        for i in range(5):
+                scheduler.push(entry(i, job_id=f"job-{i}"))
+        started = [scheduler.pop() for _ in range(5)]
+        assert all(started)
+        assert len({item.chat_id for item in started}) == 5
+
+
+def test_chatless_entries_without_job_id_use_the_entry_id():
+        assert entry(1).chat_id != entry(2).chat_id
+
+
+def test_one_chat_is_still_capped():
+        scheduler = FairScheduler()
+        for i in range(5):
+                scheduler.push(entry(i, chat_id=42))
+        started = [scheduler.pop() for _ in range(5)]
+        assert sum(item is not None for item in started) == SCHED_CHAT_MAX_IN_FLIGHT
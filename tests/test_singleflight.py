@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from worker.limiter import AdaptiveLimiter
+from worker.singleflight import SingleFlight, LeaderFailed
+
+
+def replicas(n):
+        server = FakeServer()
+        flights = []
+        for _ in range(n):
+                flight = SingleFlight()
+                flight._redis = FakeRedis(server=server)
+                flights.append(flight)
+        return flights
+
+
+def test_follower_gives_back_its_slot_and_its_wait_is_not_latency():
+        async def run():
+                (flight,) = replicas(1)
+                limiter = AdaptiveLimiter("test", initial=2, target_latency=0.5)
+                seen = {}
+
+                async def slow():
+                        await asyncio.sleep(0.2)
+                        seen["in_flight"], seen["yielded"] = limiter.in_flight, limiter.yielded
+                        await asyncio.sleep(0.8)
+                        return "report"
+
+                async def leader():
+                        async with limiter.acquire():
+                                return await flight.do("claim", slow, waiting=limiter.yield_slot)
+
+                async def follower():
+                        await asyncio.sleep(0.1)
+                        async with limiter.acquire():
+                                result = await flight.do("claim", slow, waiting=limiter.yield_slot)
+                        return result, limiter.last_latency
+
+                results = await asyncio.gather(leader(), follower())
+                return seen, results, limiter.in_flight
+
+        seen, (led, (followed, follower_latency)), in_flight = asyncio.run(run())
+        assert seen == {"in_flight": 1, "yielded": 1}
+        assert led == followed == "report"
+        assert follower_latency < 0.5
+        assert in_flight == 0
+
+
+@pytest.mark.parametrize("remote", [False, True])
+def test_followers_share_the_leaders_failure(remote):
+        async def run():
+                leader_side, *others = replicas(2)
+                follower_side = others[0] if remote else leader_side
+                follower_ran = []
+
+                async def failing():
+                        await asyncio.sleep(0.3)
+                        raise ValueError("search backend down")
+
+                async def follower_fn():
+                        follower_ran.append(True)
+                        return "own report"
+
+                async def follow():
+                        await asyncio.sleep(0.1)
+                        return await follower_side.do("claim", follower_fn)
+
+                results = await asyncio.gather(leader_side.do("claim", failing), follow(), return_exceptions=True)
+                return results, follower_ran
+
+        (led, followed), follower_ran = asyncio.run(run())
+        assert isinstance(led, ValueError)
+        assert isinstance(followed, LeaderFailed if remote else ValueError)
+        assert follower_ran == []
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+from worker import tools
+
+
+class NoCache:
+        async def get(self, key):
+                return None
+
+        async def set(self, key, value, ttl):
+                pass
+
+
+@pytest.fixture
+def engine(monkeypatch):
+        monkeypatch.setattr(tools, "search_cache", NoCache())
+        monkeypatch.setattr(tools, "SEARCH_ENGINE_THREADS", 1)
+        monkeypatch.setenv("SEARCH_TIMEOUT_HUNG", "0.2")
+        release = threading.Event()
+        yield release
+        release.set()
+
+
+def test_hung_engine_is_capped_not_queued(engine):
+        def hung(query, max_results):
+                engine.wait(5)
+                return [{"title": query}]
+
+        async def run():
+                with pytest.raises(asyncio.TimeoutError):
+                        await tools._run_engine("hung", hung, ("claim", 5), None)
+                # The first call still holds its thread: skipped at once.
+                with pytest.raises(RuntimeError):
+                        await tools._run_engine("hung", hung, ("claim", 5), None)
+                engine.set()
+                await asyncio.sleep(0.1)
+                return await tools._run_engine("hung", hung, ("claim", 5), None)
+
+        assert asyncio.run(run()) == [{"title": "claim"}]
+        assert tools._engine_threads["hung"] == 0
@@ -0,0 +1,21 @@
+import pytest
+
+from worker.cache import canonical_url
+from worker.verdict_cache import normalize_claim
+
+
+@pytest.mark.parametrize("url", ["http://[::1", "http://host:abc", "http://host:99999"])
+def test_canonical_url_malformed(url):
+        assert canonical_url(f"  {url.upper()} ") == url
+
+
+@pytest.mark.parametrize("url", ["http://[::1", "http://host:abc", "http://host:99999"])
+def test_normalize_claim_malformed_url(url):
+        assert normalize_claim(f"Is this true? {url}") == f"is this true {url}"
+
+
+def test_normalize_claim_keeps_whole_url():
+        a = normalize_claim("Check https://Example.com/a?utm_source=x")
+        b = normalize_claim("Check https://example.com/b")
+        assert a == "check https://example.com/a"
+        assert a != b
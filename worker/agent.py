@@ -1,37 +1,46 @@
-from fastapi import FastAPI, Request, Response, HTTPException
-import requests
+import time
+
+# Startup phases are reported relative to this.
+_IMPORT_STARTED = time.perf_counter()
+
 import json
 import os
-from pymongo import MongoClient
-from datetime import datetime, timedelta
-import re
 import asyncio
 import redis.asyncio as aioredis
-import uuid
-from typing import Dict, List, Optional, Any, Union
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import warnings
 import signal
+from contextlib import nullcontext
 
-from langchain_openai import ChatOpenAI
-from langchain_xai import ChatXAI
-from langchain.tools import BaseTool
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.chains import LLMChain
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langchain.memory import ConversationBufferMemory
-from pydantic import BaseModel, Field
+from langchain_core.messages import HumanMessage, AIMessage
+from aiohttp import web
 
 from .tools import get_tools
 from .prompts import get_prompt
-from .utils import remove_markdown
-from .memory import MongoChatMessageHistory, MongoSessionStepMemory
-from .response import send_response
+from .memory import AsyncMongoChatMessageHistory, aflush_pending, ensure_indexes
+from .response import send_response, close_telegram_client, telegram, delivery_failed_permanently
 from .callback import PrettyVerboseCallbackHandler
+from .http_client import close_http_session
+from .extract import extract_text_async, shutdown_extract_pool
+from .stream import StreamConsumer, STREAM_CLAIM_IDLE_MS
+from .scheduler import FairScheduler, classify, SCHED_BUFFER
+from .jobs import JobTracker, job_store, fail_dead_lettered
+from .delivery import delivery_store
+from .limiter import message_limiter, limits_snapshot, is_overload, Overloaded
+from .verdict_cache import verdict_cache, normalize_claim, claim_hash
+from .singleflight import single_flight
+from .pipeline import choose_mode, run_fast_path, extract_claim
+from .compaction import evidence_run, count_tokens
+from .progress import ProgressReporter, progressive_enabled
+from .metrics import span, metrics_handler, register_snapshot, start_metrics_server, QUEUE_WAIT_SECONDS, MESSAGES
+from .cache import search_cache, page_cache
+from .loopwatch import start_watchdog
+from .startup import StartupTimer
+from .llm import build_chat_model, router_stats
 
 try:
-        from langchain._api.deprecation import LangChainDeprecationWarning
+        from langchain_core._api.deprecation import LangChainDeprecationWarning
 except ImportError:
         LangChainDeprecationWarning = UserWarning
 
@@ -39,128 +48,444 @@ warnings.filterwarnings("ignore", category=LangChainDeprecationWarning)
 
 load_dotenv()
 
-CONCURRENT_TASKS = 5
-
-chat_model = ChatOpenAI(
-        model_name="gpt-4.1",
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        temperature=0.5,
-)
-
-tools = get_tools()
+STREAM_CLAIM_INTERVAL = 30
+LIMITS_LOG_INTERVAL = 60
+SHUTDOWN_GRACE = 30
+# Pretty-print every agent step to stdout; slow at volume, meant for debugging.
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "0") == "1"
+# Well under STREAM_CLAIM_IDLE_MS so buffered entries are never seen as stalled.
+STREAM_HEARTBEAT_INTERVAL = STREAM_CLAIM_IDLE_MS / 1000 / 3
+# Open the OpenAI and Telegram TLS connections at startup instead of on the first message.
+WARMUP_CONNECTIONS = os.getenv("WARMUP_CONNECTIONS", "1") == "1"
+WARMUP_TIMEOUT = 10
+
+# Built by build_agent(), off the event loop, while the worker already
+# consumes; langchain.agents and the provider SDKs are imported there.
+chat_model = None
+tools = None
+agent = None
+agent_executor = None
+_agent_ready = None
+
+def build_agent():
+        global chat_model, tools, agent, agent_executor
+        if agent_executor is not None:
+                return agent_executor
+        from langchain.agents import AgentExecutor, create_openai_functions_agent
+
+        if chat_model is None:
+                chat_model = build_chat_model()
+        tools = tools or get_tools()
+        agent = create_openai_functions_agent(
+                llm=chat_model,
+                tools=tools,
+                prompt=get_prompt()
+        )
+        agent_executor = AgentExecutor(
+                agent=agent,
+                tools=tools,
+                verbose=False,
+                return_intermediate_steps=True,
+                callbacks=[PrettyVerboseCallbackHandler()] if AGENT_VERBOSE else None
+        )
+        return agent_executor
+
+async def ensure_agent():
+        """Wait for build_agent(); the first caller starts it in a thread."""
+        global _agent_ready
+        if agent_executor is not None:
+                return
+        if _agent_ready is None or _agent_ready.get_loop() is not asyncio.get_running_loop():
+                _agent_ready = asyncio.ensure_future(asyncio.to_thread(build_agent))
+        try:
+                await asyncio.shield(_agent_ready)
+        except asyncio.CancelledError:
+                raise
+        except Exception:
+                # The next message tries again.
+                _agent_ready = None
+                raise
 
-agent = create_openai_functions_agent(
-        llm=chat_model,
-        tools=tools,
-        prompt=get_prompt()
-)
+def get_chat_model():
+        build_agent()
+        return chat_model
 
 mongo_client = None
+mongo_db = None
 
 def get_mongo_client():
         global mongo_client
         if mongo_client is None:
-                mongo_client = MongoClient(os.environ.get("MONGODB_URI"))
+                mongo_client = AsyncIOMotorClient(os.environ.get("MONGODB_URI"))
         return mongo_client
 
-def get_conversation_memory(chat_id):
-        session_id = str(chat_id)
-        
-        client = get_mongo_client()
-
-        return ConversationBufferMemory(
-                memory_key="chat_history",
-                output_key="output",
-                return_messages=True,
-                chat_memory=MongoChatMessageHistory(
-                        session_id=chat_id,
-                        collection=client[os.getenv("MONGODB_KEY")]["chat_history"]
-                )
+def get_mongo_db():
+        global mongo_db
+        if mongo_db is None:
+                mongo_db = get_mongo_client()[os.getenv("MONGODB_KEY")]
+        return mongo_db
+
+def is_telegram_chat(chat_id) -> bool:
+        """Job API clients may send no chat or an id of their own; only real chats get a reply."""
+        if isinstance(chat_id, int):
+                return True
+        if isinstance(chat_id, str):
+                return chat_id.lstrip("-").isdigit() or chat_id.startswith("@")
+        return False
+
+def get_chat_history(chat_id):
+        return AsyncMongoChatMessageHistory(
+                session_id=chat_id,
+                collection=get_mongo_db()["chat_history"]
         )
 
-sessions_memory = MongoSessionStepMemory(get_mongo_client()[os.getenv("MONGODB_KEY")]["step_memory_sessions"])
+async def run_agent(user_input, chat_history, callbacks=None):
+        await ensure_agent()
+        response = await agent_executor.ainvoke({
+                "user": user_input,
+                "chat_history": chat_history
+        }, config={"callbacks": callbacks or []})
+        return response["output"]
 
-async def handle_message(message):
+async def handle_message(message, entry_id=None):
         print(f"New message received from handle_message: {message}")
+        tracker = None
+        mode = "unknown"
         try:
                 message = json.loads(message)
-                
-                memory = get_conversation_memory(message["chat_id"])
-
-                agent_executor = AgentExecutor(
-                        agent=agent,
-                        tools=tools,
-                        memory=memory,
-                        verbose=False,
-                        return_intermediate_steps=True,
-                        callbacks=[PrettyVerboseCallbackHandler()]
-                )
 
-                agent_input = {
-                        "user": message['input']
-                }
+                # The executor is shared; per-chat memory travels in the run input.
+                history = get_chat_history(message["chat_id"])
+                reporter = None
+                if message.get("job_id"):
+                        tracker = JobTracker(message["job_id"], job_store)
+                telegram_chat = is_telegram_chat(message["chat_id"])
+                # A report that was finished but not fully delivered is resumed, not redone.
+                delivery_key = entry_id or message.get("job_id")
+                pending = await delivery_store.get(delivery_key) if delivery_key and telegram_chat else None
+                already_sent = 0
+
+                if pending:
+                        mode = pending["mode"]
+                        ai_response = pending["report"]
+                        already_sent = pending["sent"]
+                        print(f"Resuming delivery to chat {message['chat_id']} after {already_sent} chunk(s)")
+                else:
+                        chat_history = await history.aget_messages()
+                        # A reply that builds on this chat's earlier turns is never shared with other chats.
+                        shared = not chat_history
+                        cached = None
+                        if shared:
+                                with span("verdict_cache_lookup"):
+                                        cached = await verdict_cache.lookup(message['input'])
+                        if cached:
+                                mode = "cache"
+                                print(f"Verdict cache hit ({cached['match']}) for chat {message['chat_id']}")
+                                ai_response = cached["report"]
+                                if tracker:
+                                        await tracker.finish("done", report=ai_response, cached=cached["match"])
+                        else:
+                                mode = choose_mode(message)
+                                if progressive_enabled(message) and telegram_chat:
+                                        reporter = ProgressReporter(message["chat_id"])
+                                        await reporter.start()
+
+                                async def check():
+                                        started = time.monotonic()
+                                        with evidence_run(extract_claim(message['input'])) as budget:
+                                                callbacks = [h for h in (reporter, tracker, metrics_handler) if h]
+                                                if mode == "fast":
+                                                        await ensure_agent()
+                                                        report = await run_fast_path(chat_model, message['input'], chat_history, callbacks)
+                                                else:
+                                                        report = await run_agent(message['input'], chat_history, callbacks)
+                                        print(f"[pipeline] mode={mode} chat={message['chat_id']} total={time.monotonic() - started:.2f}s "
+                                              f"evidence_tokens={budget.spent}/{budget.total}")
+                                        if shared:
+                                                await verdict_cache.store(message['input'], report)
+                                        return report
+
+                                normalized = normalize_claim(message['input'])
+                                if shared and verdict_cache.cacheable(normalized):
+                                        # Identical claims in flight share one agent run; every
+                                        # waiting chat gets the leader's report. Chats with
+                                        # history get a report of their own.
+                                        # Waiting on a leader doesn't hold a message slot.
+                                        ai_response = await single_flight.do(claim_hash(normalized), check, waiting=message_limiter.yield_slot)
+                                else:
+                                        ai_response = await check()
+                                if tracker:
+                                        await tracker.finish("done", report=ai_response, mode=mode)
+
+                        if not telegram_chat:
+                                # Nothing to deliver to; the stored job result is the reply.
+                                await history.aadd_messages([HumanMessage(content=message['input']), AIMessage(content=ai_response)])
+                                MESSAGES.labels(mode=mode, outcome="ok").inc()
+                                return True
+                        if delivery_key:
+                                await delivery_store.save(delivery_key, ai_response, mode)
+
+                async def on_sent(count):
+                        if delivery_key:
+                                await delivery_store.mark_sent(delivery_key, count)
 
-                response = await agent_executor.ainvoke(agent_input)
-                ai_response = response["output"]
-                clean_response = remove_markdown(ai_response)
-                
                 """ Custom send """
-                await send_response(clean_response, message["chat_id"])
+                # Sent with Markdown; the client falls back to plain text if Telegram rejects it.
+                with span("send_response"):
+                        if reporter:
+                                sent = await reporter.finish(ai_response, on_sent=on_sent)
+                        else:
+                                sent = await send_response(ai_response, message["chat_id"], start=already_sent, on_sent=on_sent)
 
                 # === For testing ===
-                # print("clean_response", clean_response)
-                # return clean_response
-
+                # print("ai_response", ai_response)
+                # return ai_response
+
+                if sent and sent.get("ok"):
+                        outcome = "ok"
+                elif delivery_failed_permanently(sent):
+                        # Blocked bot, unknown chat...: re-running the check can't fix it.
+                        print(f"Giving up on delivery to chat {message['chat_id']}: {sent.get('description')}")
+                        outcome = "undeliverable"
+                else:
+                        # Network errors, 429 and 5xx: leave the entry pending; the
+                        # retry sends only the chunks that didn't go out.
+                        MESSAGES.labels(mode=mode, outcome="undelivered").inc()
+                        if (sent or {}).get("error_code") == 429:
+                                # Still rate limited after honoring retry_after.
+                                raise Overloaded(f"Telegram: {sent.get('description')}")
+                        return False
+
+                # Written once per turn, after the delivery is settled.
+                await history.aadd_messages([HumanMessage(content=message['input']), AIMessage(content=ai_response)])
+                if delivery_key:
+                        await delivery_store.drop(delivery_key)
+                MESSAGES.labels(mode=mode, outcome=outcome).inc()
+                return True
+
+        except Overloaded:
+                raise
         except Exception as e:
                 print(f"Error processing message: {e}")
+                MESSAGES.labels(mode=mode, outcome="error").inc()
+                if tracker:
+                        # The entry stays pending and runs again; the job only fails
+                        # when it is dead-lettered (jobs.fail_dead_lettered).
+                        await tracker.finish("retrying", error=str(e))
+                if is_overload(e):
+                        # message_limiter only sees what escapes; let it back off.
+                        raise Overloaded(str(e)) from e
                 # return {"status": "error", "reason": str(e)}
+                return False
 
 
-async def redis_listener(queue, stop_event):
+def _entry_key(entry_id) -> str:
+        return entry_id.decode() if isinstance(entry_id, bytes) else str(entry_id)
+
+
+async def process_entry(consumer, entry_id, data):
         try:
-                r = aioredis.Redis(host=os.getenv("REDIS_HOST"), port=6379, db=0)
-                print("Redis listener started")
-                while not stop_event.is_set():
-                        try:
-                                _, message = await asyncio.wait_for(
-                                        r.brpop(os.getenv("REDIS_QUEUE_KEY")), timeout=1
-                                )
-                                print(f"New message received from redis: {message}")
-                                await queue.put(message)
-                        except asyncio.TimeoutError:
-                                continue
-        except asyncio.CancelledError:
-                print("Redis listener cancelled")
+                print(f"New message received from stream: {entry_id}")
+                if data is None:
+                        await consumer.ack(entry_id)
+                        return
+                # Ack only once the message is finished with (delivered, or
+                # undeliverable for good); otherwise the entry stays pending
+                # and is retried via claim_stalled().
+                async with message_limiter.acquire():
+                        with span("handle_message"):
+                                ok = await handle_message(data.decode('utf-8'), _entry_key(entry_id))
+                if ok:
+                        await consumer.ack(entry_id)
+        except Overloaded as e:
+                # Left pending for a retry; the limiter has already backed off.
+                print(f"Overloaded on {entry_id}: {e}")
         except Exception as e:
-                print(f"Redis listener error: {e}")
-                await asyncio.sleep(1)
+                print(f"Error in process_entry {entry_id}: {e}")
+
+
+async def on_dead_lettered(entry_id, data):
+        await delivery_store.drop(_entry_key(entry_id))
+        await fail_dead_lettered(entry_id, data)
+
+
+async def connect_stream() -> StreamConsumer:
+        r = aioredis.Redis(host=os.getenv("REDIS_HOST"), port=6379, db=0)
+        consumer = StreamConsumer(r, on_dead=on_dead_lettered)
+        await consumer.ensure_group()
+        return consumer
+
+
+async def stream_listener(stop_event, consumer=None, on_first_read=None):
+        if consumer is None:
+                consumer = await connect_stream()
+        r = consumer.r
+        print(f"Stream consumer {consumer.name} started")
 
+        # Entries are buffered locally and started in fair order, not stream order.
+        scheduler = FairScheduler()
+        register_snapshot("scheduler", "lane", scheduler.snapshot, counters={"dispatched"})
+        in_flight = set()
+        # Entry ids of in_flight, kept alive by the heartbeat like buffered ones.
+        running = set()
+        last_claim = 0.0
+        last_heartbeat = 0.0
+        last_limits_log = 0.0
+        loop = asyncio.get_running_loop()
+
+        def start(item):
+                task = asyncio.create_task(process_entry(consumer, item.entry_id, item.data))
+                in_flight.add(task)
+                running.add(item.entry_id)
+                task.add_done_callback(in_flight.discard)
+                task.add_done_callback(lambda _: running.discard(item.entry_id))
+                task.add_done_callback(lambda _: scheduler.done(item))
+                QUEUE_WAIT_SECONDS.labels(lane=item.lane).observe(max(0.0, time.time() - item.enqueued_at))
 
-async def worker(queue, stop_event):
-        print("Worker started")
         while not stop_event.is_set():
                 try:
-                        message = await asyncio.wait_for(queue.get(), timeout=1)
+                        if loop.time() - last_limits_log > LIMITS_LOG_INTERVAL:
+                                last_limits_log = loop.time()
+                                print(f"[limits] {limits_snapshot()}")
+                                print(f"[scheduler] {scheduler.snapshot()}")
+                                print(f"[router] {router_stats()}")
+
+                        if loop.time() - last_heartbeat > STREAM_HEARTBEAT_INTERVAL:
+                                last_heartbeat = loop.time()
+                                # Running entries too: a slow run or a single-flight follower
+                                # can outlast STREAM_CLAIM_IDLE_MS and must not be claimed.
+                                await consumer.heartbeat(scheduler.entry_ids() + list(running))
+
+                        # The adaptive message limit decides how many fact-checks run at once;
+                        # single-flight followers waiting on a leader don't count.
+                        free = int(message_limiter.limit) - len(in_flight) + message_limiter.yielded
+                        while free > 0:
+                                item = scheduler.pop()
+                                if item is None:
+                                        break
+                                start(item)
+                                free -= 1
+
+                        # Only block on the stream when there is nothing else to wait for.
+                        idle = free > 0 and len(scheduler) == 0
+                        room = SCHED_BUFFER - len(scheduler)
+                        entries = []
+                        if room > 0:
+                                if loop.time() - last_claim > STREAM_CLAIM_INTERVAL:
+                                        last_claim = loop.time()
+                                        with span("stream_claim"):
+                                                entries += await consumer.claim_stalled(room)
+                                if len(entries) < room:
+                                        block_ms = 1000 if idle and not entries else None
+                                        # A blocking read mostly measures how idle we are; only time the others.
+                                        with span("stream_read") if block_ms is None else nullcontext():
+                                                entries += await consumer.read(room - len(entries), block_ms=block_ms)
+                                if on_first_read:
+                                        on_first_read()
+                                        on_first_read = None
+                        for entry_id, data in entries:
+                                scheduler.push(classify(entry_id, data))
+
+                        if not entries and not idle:
+                                # Backpressure: wait for a slot (or a capped chat) to free up.
+                                if in_flight:
+                                        await asyncio.wait(in_flight, timeout=1, return_when=asyncio.FIRST_COMPLETED)
+                                else:
+                                        await asyncio.sleep(0.1)
+                except asyncio.CancelledError:
+                        break
+                except Exception as e:
+                        print(f"Stream listener error: {e}")
+                        await asyncio.sleep(1)
+
+        # Buffered entries stay pending in the group and are reclaimed by other replicas.
+        if in_flight:
+                print(f"Waiting for {len(in_flight)} in-flight messages...")
+                _, pending = await asyncio.wait(in_flight, timeout=SHUTDOWN_GRACE)
+                for t in pending:
+                        t.cancel()
+        await r.aclose()
+
+
+async def connect_mongo():
+        try:
+                await ensure_indexes(get_mongo_db())
+        except Exception as e:
+                print(f"Error creating Mongo indexes: {e}")
+
+
+async def warm_up(timer: StartupTimer):
+        """Everything the first message would otherwise pay for, done while consuming."""
+        with timer.phase("build_agent"):
+                try:
+                        await ensure_agent()
+                except Exception as e:
+                        print(f"[startup] building the agent failed: {e!r}")
+                        return
+
+        async def timed(name, coro):
+                with timer.phase(name):
                         try:
-                                print(f"New message received from queue: {message}")
-                                await handle_message(message.decode('utf-8'))
+                                await asyncio.wait_for(coro, WARMUP_TIMEOUT)
                         except Exception as e:
-                                print(f"Error in handle_message: {e}")
-                        finally:
-                                queue.task_done()
-                except asyncio.TimeoutError:
-                        continue
-                except Exception as e:
-                        print(f"Worker error: {e}")
+                                print(f"[startup] {name} warm-up failed: {e!r}")
+
+        warm = [
+                timed("warm_extract_pool", extract_text_async("<html><body><p>warm-up</p></body></html>", "")),
+                timed("warm_tokenizer", asyncio.to_thread(count_tokens, "warm-up")),
+        ]
+        if WARMUP_CONNECTIONS:
+                warm += [
+                        timed("warm_llm", chat_model.warm_up()),
+                        timed("warm_telegram", telegram.call("getMe", {})),
+                ]
+        await asyncio.gather(*warm)
+        timer.mark("warm")
+        timer.report()
+
 
 async def main():
-        queue = asyncio.Queue()
+        timer = StartupTimer(_IMPORT_STARTED)
+        timer.mark("imports")
         stop_event = asyncio.Event()
 
+        register_snapshot("cache", "cache", lambda: {
+                "search": search_cache.stats(),
+                "page": page_cache.stats(),
+                "verdict": verdict_cache.stats(),
+        }, counters={"hits_local", "hits_redis", "hits_exact", "hits_near", "misses"})
+        register_snapshot("limiter", "limiter", limits_snapshot, counters={"completed", "overloads"})
+        register_snapshot("router", "model", router_stats, counters={
+                "calls", "errors", "fallbacks", "seconds", "input_tokens", "output_tokens", "cost_usd",
+        })
+        watchdog = start_watchdog()
+        routes = {}
+        if watchdog:
+                async def loop_report(request):
+                        return web.json_response(watchdog.report())
+                routes["/debug/loop"] = loop_report
+        metrics_runner = None
+        try:
+                metrics_runner = await start_metrics_server(routes=routes)
+        except OSError as e:
+                print(f"Metrics server not started: {e}")
+
+        # The agent is built in a thread while Mongo and Redis connect.
+        building = asyncio.create_task(ensure_agent())
+
+        async def connect(name, coro):
+                with timer.phase(name):
+                        return await coro
+
+        with timer.phase("connect"):
+                _, consumer = await asyncio.gather(
+                        connect("connect_mongo", connect_mongo()),
+                        connect("connect_redis", connect_stream()),
+                )
+
         tasks = []
-        tasks.append(asyncio.create_task(redis_listener(queue, stop_event)))
-        for _ in range(CONCURRENT_TASKS):
-                tasks.append(asyncio.create_task(worker(queue, stop_event)))
+        tasks.append(asyncio.create_task(stream_listener(stop_event, consumer, on_first_read=lambda: timer.mark("consuming"))))
+        tasks.append(asyncio.create_task(warm_up(timer)))
 
         # Функция для корректного завершения
         def shutdown():
@@ -174,10 +499,16 @@ async def main():
         await stop_event.wait()  # ждать сигнала
         print("Stop event set, shutting down tasks...")
 
-        # Корректно отменяем задачи
-        for t in tasks:
-                t.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
+        # Listener drains in-flight messages itself; unacked ones are reclaimed by other replicas
+        await asyncio.gather(*tasks, building, return_exceptions=True)
+        await aflush_pending()
+        await close_http_session()
+        await close_telegram_client()
+        shutdown_extract_pool()
+        if metrics_runner:
+                await metrics_runner.cleanup()
+        if watchdog:
+                await watchdog.stop()
         print("All tasks shut down gracefully.")
 
 def handle_exception(loop, context):
@@ -0,0 +1,297 @@
+"""Fact-check a corpus of claims from a JSONL file.
+
+Each input line is an object with the claim under "claim" (or "text",
+"input", "message") and an optional "id" (the line number otherwise).
+Results are appended to the output JSONL as they finish, so an interrupted
+run resumes where it stopped: ids already written without an error are
+skipped.
+
+    python -m worker.batch claims.jsonl -o results.jsonl [-c 8] [--offline]
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from .cache import search_cache, page_cache
+from .compaction import evidence_run
+from .pipeline import extract_claim, run_fast_path, _search, FAST_PATH_SEARCH_RESULTS
+from .verdict_cache import verdict_cache, normalize_claim
+from .http_client import close_http_session
+from .extract import shutdown_extract_pool
+
+load_dotenv()
+
+# Claims sharing at least this many entities share one search.
+BATCH_GROUP_MIN_SHARED = int(os.getenv("BATCH_GROUP_MIN_SHARED", "2"))
+BATCH_GROUP_MAX_SIZE = int(os.getenv("BATCH_GROUP_MAX_SIZE", "8"))
+BATCH_REPORT_INTERVAL = 30
+
+_TOKEN = re.compile(r"[\w'’-]+", re.U)
+_CLAIM_FIELDS = ("claim", "text", "input", "message")
+
+
+def read_claims(path: str) -> Iterator[dict]:
+        with open(path, encoding="utf-8") as f:
+                for n, line in enumerate(f, 1):
+                        line = line.strip()
+                        if not line:
+                                continue
+                        try:
+                                record = json.loads(line)
+                        except json.JSONDecodeError as e:
+                                print(f"[batch] line {n}: invalid JSON ({e}), skipped")
+                                continue
+                        if isinstance(record, str):
+                                record = {"claim": record}
+                        text = next((record[k] for k in _CLAIM_FIELDS if record.get(k)), None)
+                        if not text:
+                                print(f"[batch] line {n}: no claim, skipped")
+                                continue
+                        yield {"id": str(record.get("id", n)), "text": text, "mode": record.get("mode")}
+
+
+def completed_ids(path: str) -> set:
+        done = set()
+        if not os.path.exists(path):
+                return done
+        with open(path, encoding="utf-8") as f:
+                for line in f:
+                        try:
+                                record = json.loads(line)
+                        except json.JSONDecodeError:
+                                # A line cut off by a crash; that claim runs again.
+                                continue
+                        if not record.get("error"):
+                                done.add(str(record["id"]))
+        return done
+
+
+def claim_entities(text: str) -> List[str]:
+        """Names and numbers in the claim: capitalized words after the first, and years/figures."""
+        tokens = _TOKEN.findall(text)
+        out = []
+        for i, t in enumerate(tokens):
+                if (i > 0 and t[:1].isupper()) or (t.isdigit() and len(t) >= 3):
+                        if t.lower() not in (e.lower() for e in out):
+                                out.append(t)
+        return out
+
+
+class ClaimGroup:
+        def __init__(self, claim: dict, entities: List[str]):
+                self.claims = [claim]
+                self.shared = entities
+                self._results = None
+
+        @property
+        def query(self) -> str:
+                return " ".join(self.shared)
+
+        def try_add(self, claim: dict, entities: List[str]) -> bool:
+                if len(self.claims) >= BATCH_GROUP_MAX_SIZE:
+                        return False
+                lowered = {e.lower() for e in entities}
+                shared = [e for e in self.shared if e.lower() in lowered]
+                if len(shared) < BATCH_GROUP_MIN_SHARED:
+                        return False
+                self.claims.append(claim)
+                self.shared = shared
+                return True
+
+        async def results(self) -> Optional[List[dict]]:
+                """One search for the whole group, started by whichever claim asks first."""
+                if len(self.claims) < 2:
+                        return None
+                if self._results is None:
+                        self._results = asyncio.ensure_future(_search(self.query))
+                return await self._results
+
+
+def group_claims(claims: List[dict]) -> List[ClaimGroup]:
+        groups = []
+        for claim in claims:
+                entities = claim_entities(extract_claim(claim["text"]))
+                for group in groups:
+                        if group.try_add(claim, entities):
+                                break
+                else:
+                        groups.append(ClaimGroup(claim, entities))
+        return groups
+
+
+def rank_for_claim(results: List[dict], claim: str) -> List[dict]:
+        terms = {w.lower() for w in _TOKEN.findall(claim) if len(w) > 3}
+        def overlap(r):
+                words = {w.lower() for w in _TOKEN.findall(f"{r.get('title') or ''} {r.get('snippet') or ''}")}
+                return len(words & terms)
+        return sorted(results, key=overlap, reverse=True)[:FAST_PATH_SEARCH_RESULTS]
+
+
+class BatchRunner:
+        def __init__(self, llm, output: str, concurrency: int = 8, mode: str = "fast",
+                     use_groups: bool = True, use_verdict_cache: bool = True, claim_modes: bool = True):
+                self.llm = llm
+                self.output = output
+                self.mode = mode
+                self.use_groups = use_groups
+                self.use_verdict_cache = use_verdict_cache
+                # Offline runs have no agent model, so a claim's own "mode" is ignored.
+                self.claim_modes = claim_modes
+                self._sem = asyncio.Semaphore(concurrency)
+                self._write_lock = asyncio.Lock()
+                self._inflight = {}
+                self.started = time.monotonic()
+                self.stats = {"done": 0, "failed": 0, "skipped": 0, "duplicates": 0, "verdict_cache": 0,
+                              "groups": 0, "grouped_claims": 0}
+
+        async def _write(self, record: dict):
+                async with self._write_lock:
+                        with open(self.output, "a", encoding="utf-8") as f:
+                                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        async def _check(self, text: str, mode: str, results: Optional[List[dict]]) -> str:
+                with evidence_run(extract_claim(text)):
+                        if mode == "agent":
+                                from .agent import run_agent
+                                return await run_agent(text, [])
+                        return await run_fast_path(self.llm, text, [], results=results)
+
+        async def _report(self, text: str, mode: str, group: ClaimGroup) -> tuple:
+                """(report, how) for a claim; identical claims in the batch share one run."""
+                normalized = normalize_claim(text)
+                if normalized in self._inflight:
+                        self.stats["duplicates"] += 1
+                        return await self._inflight[normalized], "duplicate"
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[normalized] = future
+                try:
+                        if self.use_verdict_cache:
+                                cached = await verdict_cache.lookup(text)
+                                if cached:
+                                        self.stats["verdict_cache"] += 1
+                                        future.set_result(cached["report"])
+                                        return cached["report"], f"verdict_cache:{cached['match']}"
+                        results = await group.results() if self.use_groups and mode == "fast" else None
+                        if results is not None:
+                                results = rank_for_claim(results, text)
+                        report = await self._check(text, mode, results)
+                        if self.use_verdict_cache:
+                                await verdict_cache.store(text, report)
+                        future.set_result(report)
+                        return report, "grouped" if results is not None else "searched"
+                except Exception as e:
+                        future.set_exception(e)
+                        future.exception()  # retrieved here; duplicates get it too
+                        # Later duplicates retry instead of inheriting the failure.
+                        del self._inflight[normalized]
+                        raise
+
+        async def run_claim(self, claim: dict, group: ClaimGroup):
+                async with self._sem:
+                        started = time.monotonic()
+                        mode = claim.get("mode") if self.claim_modes and claim.get("mode") in ("agent", "fast") else self.mode
+                        record = {"id": claim["id"], "claim": claim["text"], "mode": mode}
+                        try:
+                                record["report"], record["source"] = await self._report(claim["text"], mode, group)
+                                self.stats["done"] += 1
+                        except Exception as e:
+                                print(f"[batch] claim {claim['id']} failed: {e}")
+                                record["error"] = str(e)
+                                self.stats["failed"] += 1
+                        record["seconds"] = round(time.monotonic() - started, 3)
+                        await self._write(record)
+
+        async def run_window(self, claims: List[dict]):
+                groups = group_claims(claims) if self.use_groups else [ClaimGroup(c, []) for c in claims]
+                for group in groups:
+                        if len(group.claims) > 1:
+                                self.stats["groups"] += 1
+                                self.stats["grouped_claims"] += len(group.claims)
+                # Created in group order: the semaphore is FIFO, so a group's claims run together.
+                await asyncio.gather(*(self.run_claim(c, g) for g in groups for c in g.claims))
+
+        def summary(self) -> dict:
+                elapsed = time.monotonic() - self.started
+                finished = self.stats["done"] + self.stats["failed"]
+                return {
+                        **self.stats,
+                        "elapsed_s": round(elapsed, 1),
+                        "claims_per_min": round(finished / elapsed * 60, 1) if elapsed else 0.0,
+                        "search_cache": search_cache.stats(),
+                        "page_cache": page_cache.stats(),
+                }
+
+
+async def run_batch(args) -> dict:
+        if args.offline:
+                from .offline import install, OfflineChatModel
+                install(search_latency=args.fake_latency, fetch_latency=args.fake_latency)
+                llm = OfflineChatModel(latency=args.fake_latency)
+        else:
+                from .agent import get_chat_model
+                llm = get_chat_model()
+
+        if args.restart and os.path.exists(args.output):
+                os.remove(args.output)
+        done = completed_ids(args.output)
+
+        runner = BatchRunner(
+                llm, args.output, concurrency=args.concurrency, mode="fast" if args.offline else args.mode,
+                use_groups=not args.no_group, use_verdict_cache=not args.offline and not args.no_verdict_cache,
+                claim_modes=not args.offline,
+        )
+
+        async def progress():
+                while True:
+                        await asyncio.sleep(BATCH_REPORT_INTERVAL)
+                        s = runner.summary()
+                        print(f"[batch] done={s['done']} failed={s['failed']} skipped={s['skipped']} "
+                              f"{s['claims_per_min']} claims/min")
+
+        reporter = asyncio.create_task(progress())
+        try:
+                window = []
+                for claim in read_claims(args.input):
+                        if claim["id"] in done:
+                                runner.stats["skipped"] += 1
+                                continue
+                        window.append(claim)
+                        if len(window) >= args.window:
+                                await runner.run_window(window)
+                                window = []
+                if window:
+                        await runner.run_window(window)
+        finally:
+                reporter.cancel()
+                await close_http_session()
+                shutdown_extract_pool()
+        return runner.summary()
+
+
+def main(argv=None):
+        parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+        parser.add_argument("input", help="JSONL file with one claim per line")
+        parser.add_argument("-o", "--output", default="results.jsonl", help="results JSONL (appended; also the checkpoint)")
+        parser.add_argument("-c", "--concurrency", type=int, default=8, help="claims checked at once")
+        parser.add_argument("--window", type=int, default=256, help="claims read and grouped at a time")
+        parser.add_argument("--mode", choices=("fast", "agent"), default="fast", help="pipeline for claims without their own mode")
+        parser.add_argument("--no-group", action="store_true", help="search every claim separately")
+        parser.add_argument("--no-verdict-cache", action="store_true", help="don't read or write the shared verdict cache")
+        parser.add_argument("--restart", action="store_true", help="discard the output file instead of resuming")
+        parser.add_argument("--offline", action="store_true", help="fake search, pages and LLM; no network (fast mode for every claim)")
+        parser.add_argument("--fake-latency", type=float, default=0.0, help="seconds each offline search/fetch/LLM call takes")
+        args = parser.parse_args(argv)
+
+        summary = asyncio.run(run_batch(args))
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+        sys.exit(main())
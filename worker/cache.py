@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import time
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_REDIS = os.getenv("SEARCH_CACHE_REDIS", "1") == "1"
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "512"))
+PAGE_CACHE_REDIS = os.getenv("PAGE_CACHE_REDIS", "1") == "1"
+# Within PAGE_CACHE_FRESH a cached page is served as-is; until PAGE_CACHE_RETAIN
+# it is kept for conditional revalidation (ETag / Last-Modified).
+PAGE_CACHE_FRESH = int(os.getenv("PAGE_CACHE_FRESH", "900"))
+PAGE_CACHE_RETAIN = int(os.getenv("PAGE_CACHE_RETAIN", "86400"))
+
+_TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "mc_cid", "mc_eid", "ref", "ref_src", "cmpid"}
+
+
+class TTLCache:
+        """In-process LRU where every entry carries its own expiry."""
+
+        def __init__(self, maxsize: int = 1024):
+                self.maxsize = maxsize
+                self._data = OrderedDict()
+
+        def get(self, key: str) -> Optional[Any]:
+                item = self._data.get(key)
+                if item is None:
+                        return None
+                expires_at, value = item
+                if expires_at < time.monotonic():
+                        del self._data[key]
+                        return None
+                self._data.move_to_end(key)
+                return value
+
+        def set(self, key: str, value: Any, ttl: float):
+                self._data[key] = (time.monotonic() + ttl, value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                        self._data.popitem(last=False)
+
+        def __len__(self):
+                return len(self._data)
+
+
+class TieredCache:
+        """Local LRU in front of an optional Redis tier shared by all replicas.
+
+        Values must be JSON-serializable. Redis failures are logged and treated
+        as misses so a flaky cache never breaks the lookup it fronts.
+        """
+
+        def __init__(self, prefix: str, maxsize: int = 1024, use_redis: bool = True):
+                self.prefix = prefix
+                self.local = TTLCache(maxsize)
+                self.use_redis = use_redis and bool(os.getenv("REDIS_HOST"))
+                self._redis = None
+                self.hits_local = 0
+                self.hits_redis = 0
+                self.misses = 0
+
+        def _get_redis(self):
+                if self._redis is None:
+                        self._redis = aioredis.Redis(
+                                host=os.getenv("REDIS_HOST"), port=6379, db=0,
+                                socket_timeout=0.5, socket_connect_timeout=0.5,
+                        )
+                return self._redis
+
+        async def get(self, key: str) -> Optional[Any]:
+                value = self.local.get(key)
+                if value is not None:
+                        self.hits_local += 1
+                        return value
+                if self.use_redis:
+                        try:
+                                async with self._get_redis().pipeline(transaction=False) as pipe:
+                                        pipe.get(self.prefix + key)
+                                        pipe.ttl(self.prefix + key)
+                                        raw, ttl = await pipe.execute()
+                                if raw is not None:
+                                        value = json.loads(raw)
+                                        if ttl and ttl > 0:
+                                                self.local.set(key, value, ttl)
+                                        self.hits_redis += 1
+                                        return value
+                        except Exception as e:
+                                print(f"[cache:{self.prefix}] redis get failed: {e}")
+                self.misses += 1
+                return None
+
+        async def set(self, key: str, value: Any, ttl: float):
+                self.local.set(key, value, ttl)
+                if self.use_redis:
+                        try:
+                                await self._get_redis().set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=int(ttl))
+                        except Exception as e:
+                                print(f"[cache:{self.prefix}] redis set failed: {e}")
+
+        def stats(self) -> dict:
+                hits = self.hits_local + self.hits_redis
+                total = hits + self.misses
+                return {
+                        "hits_local": self.hits_local,
+                        "hits_redis": self.hits_redis,
+                        "misses": self.misses,
+                        "hit_rate": round(hits / total, 3) if total else 0.0,
+                        "size": len(self.local),
+                }
+
+
+def normalize_query(query: str) -> str:
+        query = unicodedata.normalize("NFKC", query).lower()
+        query = re.sub(r"\s+", " ", query)
+        return query.strip(" \t\n\"'«»“”„.,!?;:")
+
+
+def search_cache_key(engine: str, query: str, max_results: int, days: Optional[int]) -> str:
+        raw = json.dumps([engine, normalize_query(query), max_results, days], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def search_ttl(days: Optional[int]) -> int:
+        """Short-window news goes stale fast; wider windows can be reused longer."""
+        if days is not None and days <= 1:
+                return int(os.getenv("SEARCH_CACHE_TTL_DAY", "600"))
+        if days is not None and days <= 7:
+                return int(os.getenv("SEARCH_CACHE_TTL_WEEK", "3600"))
+        return int(os.getenv("SEARCH_CACHE_TTL_LONG", "21600"))
+
+
+def canonical_url(url: str) -> str:
+        try:
+                parts = urlsplit(url.strip())
+                port = parts.port
+        except ValueError:
+                # Unbalanced IPv6 bracket or a non-numeric / out-of-range port.
+                return url.strip().lower()
+        host = (parts.hostname or "").lower()
+        if port and port not in (80, 443):
+                host = f"{host}:{port}"
+        query = [
+                (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+        ]
+        return urlunsplit((parts.scheme.lower(), host, parts.path or "/", urlencode(sorted(query)), ""))
+
+
+def page_cache_key(url: str) -> str:
+        return hashlib.sha256(canonical_url(url).encode("utf-8")).hexdigest()
+
+
+search_cache = TieredCache("search:", maxsize=SEARCH_CACHE_SIZE, use_redis=SEARCH_CACHE_REDIS)
+page_cache = TieredCache("page:", maxsize=PAGE_CACHE_SIZE, use_redis=PAGE_CACHE_REDIS)
@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Total evidence tokens one fact-check may put into the scratchpad, and the
+# share a single fetched page may take of it.
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", "6000"))
+EVIDENCE_TOKENS_PER_SOURCE = int(os.getenv("EVIDENCE_TOKENS_PER_SOURCE", "700"))
+EVIDENCE_DUP_THRESHOLD = 0.7
+# Only this much of a page is split and scored; evidence past it is rarely worth the CPU.
+EVIDENCE_SCAN_CHARS = int(os.getenv("EVIDENCE_SCAN_CHARS", "100000"))
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?…])\s+(?=[\"'«“(\[]?[A-ZА-ЯЁ0-9])")
+_WORD = re.compile(r"\w+", re.U)
+_DATE = re.compile(
+        r"\b(?:\d{4}-\d{2}-\d{2}|\d{1,2}[./]\d{1,2}[./]\d{2,4}|(?:19|20)\d{2})\b"
+        r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}\b"
+        r"|\b\d{1,2}\s+(?:янв|фев|мар|апр|ма[йя]|июн|июл|авг|сен|окт|ноя|дек)[а-я]*",
+        re.I,
+)
+_NUMBER = re.compile(r"\d")
+_MIN_SENTENCE_TOKENS = 8
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+        """Tokens as gpt-4.1 counts them; falls back to ~4 chars/token without tiktoken."""
+        global _encoding
+        if _encoding is None:
+                try:
+                        import tiktoken
+                        _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                        _encoding = False
+        if _encoding is False:
+                return len(text) // 4 + 1
+        return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _words(text: str) -> List[str]:
+        return [w.lower() for w in _WORD.findall(text)]
+
+
+def _entities(text: str) -> set:
+        # Capitalized words that don't start a sentence: names, places, organizations.
+        tokens = text.split()
+        return {t.strip(".,:;!?\"'«»()").lower() for t in tokens[1:] if t[:1].isupper()}
+
+
+def split_sentences(text: str) -> List[str]:
+        return [s.strip() for s in _SENTENCE_SPLIT.split(text or "") if s.strip()]
+
+
+def _trigrams(words: List[str]) -> set:
+        if len(words) < 3:
+                return {" ".join(words)}
+        return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+class EvidenceBudget:
+        """Per-run evidence state: the claim, the token budget and what was already kept.
+
+        Shared by every tool call of one fact-check through a ContextVar, so a
+        passage already returned by one source is not paid for again.
+        """
+
+        def __init__(self, claim: str = "", total: int = EVIDENCE_TOKEN_BUDGET):
+                self.claim = claim
+                self.total = total
+                self.spent = 0
+                self.claim_terms = {w for w in _words(claim) if len(w) > 3 or w.isdigit()}
+                self.claim_entities = _entities(claim) | {w for w in self.claim_terms if w.isdigit()}
+                self._kept = []
+                # compact() runs in worker threads; one run may fetch several pages at once.
+                self._lock = threading.Lock()
+
+        @property
+        def remaining(self) -> int:
+                return max(0, self.total - self.spent)
+
+        def score(self, sentence: str) -> float:
+                words = set(_words(sentence))
+                score = 2.0 * len(words & self.claim_terms)
+                score += 1.5 * len(_entities(sentence) & self.claim_entities)
+                if _DATE.search(sentence):
+                        score += 1.0
+                if _NUMBER.search(sentence):
+                        score += 0.5
+                return score
+
+        def is_duplicate(self, sentence: str) -> bool:
+                grams = _trigrams(_words(sentence))
+                for kept in self._kept:
+                        union = len(grams | kept)
+                        if union and len(grams & kept) / union >= EVIDENCE_DUP_THRESHOLD:
+                                return True
+                return False
+
+        def keep(self, sentence: str, tokens: int):
+                self._kept.append(_trigrams(_words(sentence)))
+                self.spent += tokens
+
+        def compact(self, text: str, max_tokens: int) -> str:
+                """Best-scoring, not-yet-seen sentences of text within max_tokens, in page order.
+
+                CPU-bound on long pages: call it through asyncio.to_thread from the loop.
+                """
+                with self._lock:
+                        return self._compact(text[:EVIDENCE_SCAN_CHARS], max_tokens)
+
+        def _compact(self, text: str, max_tokens: int) -> str:
+                limit = min(max_tokens, self.remaining)
+                if limit <= 0:
+                        return ""
+                sentences = split_sentences(text)
+                scores = [self.score(s) for s in sentences]
+                ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+                # Sentences with nothing claim-related only fill in when nothing on the page matched.
+                has_match = bool(scores) and max(scores) > 0
+                chosen, used = [], 0
+                for i in ranked:
+                        if has_match and scores[i] <= 0:
+                                break
+                        sentence = sentences[i]
+                        tokens = count_tokens(sentence)
+                        if used + tokens > limit or self.is_duplicate(sentence):
+                                continue
+                        self.keep(sentence, tokens)
+                        chosen.append(i)
+                        used += tokens
+                        if limit - used < _MIN_SENTENCE_TOKENS:
+                                # Full: the rest would each be counted and rejected.
+                                break
+                return " ".join(sentences[i] for i in sorted(chosen))
+
+
+_current = ContextVar("evidence_budget", default=None)
+
+
+def current_budget() -> EvidenceBudget:
+        budget = _current.get()
+        if budget is None:
+                # Tool used outside a fact-check run: give it a budget of its own.
+                budget = EvidenceBudget()
+                _current.set(budget)
+        return budget
+
+
+@contextmanager
+def evidence_run(claim: str, total: Optional[int] = None):
+        token = _current.set(EvidenceBudget(claim, total or EVIDENCE_TOKEN_BUDGET))
+        try:
+                yield _current.get()
+        finally:
+                _current.reset(token)
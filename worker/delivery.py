@@ -0,0 +1,75 @@
+import os
+from typing import Optional
+
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Must outlive the stream's retries of an entry (claim interval x dead-letter attempts).
+DELIVERY_TTL = int(os.getenv("DELIVERY_TTL", "86400"))
+
+_PREFIX = "delivery:"
+
+
+def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+
+class DeliveryStore:
+        """Finished reports waiting to reach Telegram, one hash per stream entry.
+
+        The report is saved before the first chunk is sent and "sent" counts
+        the chunks Telegram has accepted, so a redelivered entry resends only
+        the rest instead of running the check (and writing history) again.
+        The record is dropped once the entry is done with.
+        """
+
+        def __init__(self, get_redis=None):
+                self._get_redis = get_redis
+                self._redis = None
+
+        def redis(self) -> aioredis.Redis:
+                if self._get_redis is not None:
+                        return self._get_redis()
+                if self._redis is None:
+                        self._redis = aioredis.Redis(host=os.getenv("REDIS_HOST"), port=6379, db=0, socket_timeout=5)
+                return self._redis
+
+        async def get(self, key: str) -> Optional[dict]:
+                try:
+                        raw = await self.redis().hgetall(f"{_PREFIX}{key}")
+                except Exception as e:
+                        print(f"[delivery] get {key} failed: {e}")
+                        return None
+                if not raw:
+                        return None
+                data = {_decode(k): _decode(v) for k, v in raw.items()}
+                return {"report": data.get("report", ""), "mode": data.get("mode", "unknown"), "sent": int(data.get("sent") or 0)}
+
+        async def save(self, key: str, report: str, mode: str):
+                try:
+                        async with self.redis().pipeline(transaction=False) as pipe:
+                                pipe.hset(f"{_PREFIX}{key}", mapping={"report": report, "mode": mode, "sent": 0})
+                                pipe.expire(f"{_PREFIX}{key}", DELIVERY_TTL)
+                                await pipe.execute()
+                except Exception as e:
+                        print(f"[delivery] save {key} failed: {e}")
+
+        async def mark_sent(self, key: str, sent: int):
+                try:
+                        async with self.redis().pipeline(transaction=False) as pipe:
+                                pipe.hset(f"{_PREFIX}{key}", "sent", sent)
+                                pipe.expire(f"{_PREFIX}{key}", DELIVERY_TTL)
+                                await pipe.execute()
+                except Exception as e:
+                        print(f"[delivery] mark {key} failed: {e}")
+
+        async def drop(self, key: str):
+                try:
+                        await self.redis().delete(f"{_PREFIX}{key}")
+                except Exception as e:
+                        print(f"[delivery] drop {key} failed: {e}")
+
+
+delivery_store = DeliveryStore()
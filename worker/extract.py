@@ -0,0 +1,138 @@
+import os
+import re
+import importlib.util
+import asyncio
+import multiprocessing
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Only the pool children parse HTML, so only they import trafilatura.
+_HAS_TRAF = importlib.util.find_spec("trafilatura") is not None
+_trafilatura = None
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "10"))
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", str(2 * 1024 * 1024)))
+
+_pool = None
+_slots = None
+_slots_loop = None
+# Pools killed over a timeout; their other pages are retried once.
+_killed_pools = weakref.WeakSet()
+
+
+def _load_trafilatura():
+        global _trafilatura, _HAS_TRAF
+        if _trafilatura is None and _HAS_TRAF:
+                try:
+                        import trafilatura
+                        _trafilatura = trafilatura
+                except Exception:
+                        _HAS_TRAF = False
+        return _trafilatura
+
+
+def extract_text(html: str, url: str) -> str:
+        trafilatura = _load_trafilatura()
+        if trafilatura:
+                txt = trafilatura.extract(html, include_comments=False, include_tables=False, favor_recall=True, url=url)
+                if txt:
+                        return " ".join(txt.split())
+        txt = re.sub(r"<script[\s\S]*?</script>", " ", html, flags=re.I)
+        txt = re.sub(r"<style[\s\S]*?</style>", " ", txt, flags=re.I)
+        txt = re.sub(r"<[^>]+>", " ", txt)
+        txt = re.sub(r"\s+", " ", txt)
+        return txt.strip()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+        global _pool
+        if _pool is None:
+                # forkserver: children only import this module (and trafilatura),
+                # not the langchain stack or the threads of the parent.
+                context = multiprocessing.get_context("forkserver")
+                if _HAS_TRAF:
+                        # Imported once in the fork server, inherited by every child.
+                        context.set_forkserver_preload(["trafilatura"])
+                _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=context)
+        return _pool
+
+
+def _get_slots() -> asyncio.Semaphore:
+        """One slot per pool worker, so a submitted page starts parsing at once and
+        EXTRACT_TIMEOUT never counts time spent queued behind other pages."""
+        global _slots, _slots_loop
+        loop = asyncio.get_running_loop()
+        if _slots is None or _slots_loop is not loop:
+                _slots = asyncio.Semaphore(EXTRACT_WORKERS)
+                _slots_loop = loop
+        return _slots
+
+
+def _discard_pool(pool: ProcessPoolExecutor, kill: bool = False):
+        """Drop `pool`; the next call starts a fresh one."""
+        global _pool
+        if _pool is pool:
+                _pool = None
+        if kill:
+                _killed_pools.add(pool)
+                # Cancelling the future doesn't stop a child that is already parsing.
+                for process in list((getattr(pool, "_processes", None) or {}).values()):
+                        process.kill()
+                # Not cancel_futures: other pages' futures must fail as
+                # BrokenProcessPool (and be retried), not look cancelled.
+                pool.shutdown(wait=False)
+        else:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _truncate(html: str, max_bytes: int) -> str:
+        if len(html) * 4 <= max_bytes:
+                return html
+        data = html.encode("utf-8")
+        if len(data) <= max_bytes:
+                return html
+        return data[:max_bytes].decode("utf-8", "ignore")
+
+
+async def extract_text_async(html: str, url: str) -> str:
+        """Run extract_text on the process pool so parsing never blocks the event loop.
+
+        Pages above EXTRACT_MAX_BYTES are truncated before parsing; a document
+        that takes longer than EXTRACT_TIMEOUT to parse raises
+        asyncio.TimeoutError, and the pool is killed and replaced so a stuck
+        parse never keeps holding a worker.
+        """
+        return await _run_in_pool(extract_text, _truncate(html, EXTRACT_MAX_BYTES), url)
+
+
+async def _run_in_pool(fn, *args):
+        loop = asyncio.get_running_loop()
+        async with _get_slots():
+                for attempt in range(2):
+                        pool = _get_pool()
+                        try:
+                                return await asyncio.wait_for(loop.run_in_executor(pool, fn, *args), timeout=EXTRACT_TIMEOUT)
+                        except asyncio.TimeoutError:
+                                _discard_pool(pool, kill=True)
+                                raise
+                        except BrokenProcessPool:
+                                if pool in _killed_pools:
+                                        # Killed over another page's timeout; this one did
+                                        # nothing wrong, so it gets one go on the new pool.
+                                        if attempt:
+                                                raise
+                                        continue
+                                # A child died (OOM, segfault in lxml); start a fresh pool next time.
+                                _discard_pool(pool)
+                                raise
+
+
+def shutdown_extract_pool():
+        if _pool is not None:
+                _discard_pool(_pool)
@@ -0,0 +1,37 @@
+import os
+import asyncio
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "64"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "4"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+
+USER_AGENT = "Mozilla/5.0 (NewsAgent/1.0)"
+
+_session = None
+_session_loop = None
+
+def get_http_session() -> aiohttp.ClientSession:
+        """One keep-alive pool per worker process (and per event loop)."""
+        global _session, _session_loop
+        loop = asyncio.get_running_loop()
+        if _session is None or _session.closed or _session_loop is not loop:
+                connector = aiohttp.TCPConnector(
+                        limit=HTTP_POOL_SIZE,
+                        limit_per_host=HTTP_POOL_PER_HOST,
+                        ttl_dns_cache=HTTP_DNS_TTL,
+                        use_dns_cache=True,
+                )
+                _session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT})
+                _session_loop = loop
+        return _session
+
+async def close_http_session():
+        global _session
+        if _session is not None and not _session.closed:
+                await _session.close()
+        _session = None
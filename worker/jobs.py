@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import redis.asyncio as aioredis
+from langchain_core.callbacks import AsyncCallbackHandler
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_TTL = int(os.getenv("JOB_TTL", "86400"))
+# "retrying": the last attempt raised and the stream entry will be delivered
+# again; the job only fails for good when the entry is dead-lettered.
+JOB_STATES = ("queued", "searching", "fetching", "drafting", "retrying", "done", "failed")
+TERMINAL_STATES = {"done", "failed"}
+
+_PREFIX = "job:"
+_EVENTS = ":events"
+
+# Update only a job that still exists: an expired (or never queued) job must
+# not come back as a partial hash without created_at or a TTL.
+_UPDATE = """
+if redis.call("exists", KEYS[1]) == 0 then
+        return 0
+end
+redis.call("hset", KEYS[1], unpack(ARGV, 3))
+redis.call("expire", KEYS[1], ARGV[1])
+redis.call("publish", KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def job_key(job_id: str) -> str:
+        return f"{_PREFIX}{job_id}"
+
+
+def job_channel(job_id: str) -> str:
+        return f"{_PREFIX}{job_id}{_EVENTS}"
+
+
+def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+
+class JobStore:
+        """Job state in Redis: one hash per job under job:<id>, expiring after JOB_TTL.
+
+        The API writes the "queued" record in the same pipeline as the stream
+        entry; the worker moves it through searching, fetching and drafting to
+        done (with the report), or through retrying (with the last error) to
+        failed once the stream entry is dead-lettered. Every transition is
+        stamped as <state>_at and published on job:<id>:events.
+        """
+
+        def __init__(self, get_redis=None):
+                self._get_redis = get_redis
+                self._redis = None
+
+        def redis(self) -> aioredis.Redis:
+                if self._get_redis is not None:
+                        return self._get_redis()
+                if self._redis is None:
+                        self._redis = aioredis.Redis(host=os.getenv("REDIS_HOST"), port=6379, db=0, socket_timeout=5)
+                return self._redis
+
+        @staticmethod
+        def add_queued(pipe, message: dict):
+                now = time.time()
+                key = job_key(message["job_id"])
+                pipe.hset(key, mapping={
+                        "state": "queued",
+                        "chat_id": str(message.get("chat_id")),
+                        "input": message.get("input", ""),
+                        "created_at": now,
+                        "queued_at": now,
+                        "updated_at": now,
+                })
+                pipe.expire(key, JOB_TTL)
+
+        async def update(self, job_id: str, state: str, **fields):
+                now = time.time()
+                key = job_key(job_id)
+                mapping = {"state": state, f"{state}_at": now, "updated_at": now}
+                mapping.update({k: v if isinstance(v, (str, int, float)) else json.dumps(v) for k, v in fields.items() if v is not None})
+                pairs = [item for pair in mapping.items() for item in pair]
+                event = json.dumps({"job_id": job_id, "state": state, "at": now})
+                try:
+                        updated = await self.redis().eval(_UPDATE, 2, key, job_channel(job_id), JOB_TTL, event, *pairs)
+                        if not updated:
+                                print(f"[jobs] update {job_id} -> {state} skipped: job expired or unknown")
+                except Exception as e:
+                        print(f"[jobs] update {job_id} -> {state} failed: {e}")
+
+        async def get(self, job_id: str) -> Optional[dict]:
+                raw = await self.redis().hgetall(job_key(job_id))
+                if not raw:
+                        return None
+                data = {_decode(k): _decode(v) for k, v in raw.items()}
+                created = float(data.get("created_at") or 0)
+                job = {
+                        "job_id": job_id,
+                        "state": data.get("state"),
+                        "chat_id": data.get("chat_id"),
+                        "created_at": created,
+                        "updated_at": float(data.get("updated_at") or created),
+                        # Seconds from enqueue to the first time each state was entered.
+                        "timings": {
+                                s: round(float(data[f"{s}_at"]) - created, 3)
+                                for s in JOB_STATES if f"{s}_at" in data
+                        },
+                }
+                for field in ("mode", "cached", "report", "error"):
+                        if field in data:
+                                job[field] = data[field]
+                return job
+
+
+class JobEvents:
+        """Fans job events out to local waiters over one pattern subscription.
+
+        Long-poll and SSE handlers wait on an in-process queue instead of each
+        holding a Redis connection or polling the hash.
+        """
+
+        # Re-read the hash this often in case an event raced the subscription.
+        RECHECK_INTERVAL = 5.0
+
+        def __init__(self, store: JobStore):
+                self.store = store
+                self._queues = defaultdict(set)
+                self._task = None
+                self._ready = None
+
+        def _ensure_listener(self):
+                if self._task is None or self._task.done():
+                        self._ready = asyncio.Event()
+                        self._task = asyncio.create_task(self._listen())
+
+        async def _listen(self):
+                while True:
+                        pubsub = self.store.redis().pubsub()
+                        try:
+                                await pubsub.psubscribe(f"{_PREFIX}*{_EVENTS}")
+                                self._ready.set()
+                                async for msg in pubsub.listen():
+                                        if msg.get("type") != "pmessage":
+                                                continue
+                                        job_id = _decode(msg["channel"])[len(_PREFIX):-len(_EVENTS)]
+                                        queues = self._queues.get(job_id)
+                                        if queues:
+                                                event = json.loads(msg["data"])
+                                                for q in queues:
+                                                        q.put_nowait(event)
+                        except asyncio.CancelledError:
+                                raise
+                        except Exception as e:
+                                print(f"[jobs] event listener failed: {e}")
+                                await asyncio.sleep(1)
+                        finally:
+                                try:
+                                        await pubsub.aclose()
+                                except Exception:
+                                        pass
+
+        @asynccontextmanager
+        async def subscribe(self, job_id: str):
+                q = asyncio.Queue()
+                self._queues[job_id].add(q)
+                self._ensure_listener()
+                try:
+                        try:
+                                await asyncio.wait_for(self._ready.wait(), 2)
+                        except asyncio.TimeoutError:
+                                pass
+                        yield q
+                finally:
+                        self._queues[job_id].discard(q)
+                        if not self._queues[job_id]:
+                                del self._queues[job_id]
+
+        async def watch(self, job_id: str, timeout: float) -> AsyncIterator[dict]:
+                """Yield the job now and after every change until it ends or timeout passes."""
+                deadline = time.monotonic() + timeout
+                async with self.subscribe(job_id) as q:
+                        last = None
+                        while True:
+                                job = await self.store.get(job_id)
+                                if job is None:
+                                        return
+                                if (job["state"], job["updated_at"]) != last:
+                                        last = (job["state"], job["updated_at"])
+                                        yield job
+                                if job["state"] in TERMINAL_STATES:
+                                        return
+                                remaining = deadline - time.monotonic()
+                                if remaining <= 0:
+                                        return
+                                try:
+                                        await asyncio.wait_for(q.get(), min(remaining, self.RECHECK_INTERVAL))
+                                except asyncio.TimeoutError:
+                                        pass
+
+        async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+                """The job once it is done or failed, or its latest state at timeout."""
+                job = None
+                async for job in self.watch(job_id, timeout):
+                        pass
+                return job
+
+        async def close(self):
+                if self._task is not None:
+                        self._task.cancel()
+                        self._task = None
+
+
+class JobTracker(AsyncCallbackHandler):
+        """Moves a job through its states as the agent or fast path progresses.
+
+        news_search marks it searching, fetch_and_summarize fetching, and a
+        model call after evidence has come back drafting. The fast path
+        reports its stages through set_stage(). Updates are written in order
+        in the background so the run is never held up by Redis.
+        """
+
+        def __init__(self, job_id: str, store: JobStore):
+                self.job_id = job_id
+                self.store = store
+                self.state = "queued"
+                self._tools = {}
+                self._evidence = False
+                self._lock = asyncio.Lock()
+                self._tasks = set()
+
+        def set_stage(self, state: str, **fields):
+                if state == self.state and not fields:
+                        return
+                self.state = state
+                task = asyncio.create_task(self._write(state, fields))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+        async def _write(self, state: str, fields: dict):
+                async with self._lock:
+                        await self.store.update(self.job_id, state, **fields)
+
+        async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+                name = (serialized or {}).get("name") or kwargs.get("name")
+                self._tools[run_id] = name
+                if name == "news_search":
+                        self.set_stage("searching")
+                elif name == "fetch_and_summarize":
+                        self.set_stage("fetching")
+
+        async def on_tool_end(self, output, *, run_id, **kwargs):
+                if self._tools.pop(run_id, None):
+                        self._evidence = True
+
+        async def on_chat_model_start(self, serialized, messages, **kwargs):
+                if self._evidence:
+                        self.set_stage("drafting")
+
+        async def finish(self, state: str, **fields):
+                if self._tasks:
+                        await asyncio.gather(*self._tasks, return_exceptions=True)
+                self.state = state
+                await self._write(state, fields)
+
+
+job_store = JobStore()
+
+
+async def fail_dead_lettered(entry_id: str, data: bytes):
+        """StreamConsumer on_dead hook: the job's last retry was its last chance."""
+        try:
+                job_id = json.loads(data).get("job_id")
+        except Exception:
+                return
+        if not job_id:
+                return
+        job = await job_store.get(job_id)
+        error = (job or {}).get("error") or "gave up after repeated delivery failures"
+        await job_store.update(job_id, "failed", error=error)
@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Overloaded(Exception):
+        """An overload the caller already handled, re-raised so the limiter backs off."""
+
+
+def is_overload(error: BaseException) -> bool:
+        """429s and timeouts mean the upstream wants less concurrency from us."""
+        if isinstance(error, (Overloaded, asyncio.TimeoutError, TimeoutError)):
+                return True
+        status = getattr(error, "status", None) or getattr(error, "status_code", None)
+        if status == 429:
+                return True
+        name = type(error).__name__
+        return "RateLimit" in name or "Timeout" in name
+
+
+class _Permit:
+        __slots__ = ("excluded",)
+
+        def __init__(self):
+                # Seconds spent in yield_slot(), left out of the observed latency.
+                self.excluded = 0.0
+
+
+class AdaptiveLimiter:
+        """AIMD concurrency limit driven by observed latency and overload signals.
+
+        Every call that finishes under target_latency grows the limit by
+        1/limit (about +1 per full window), a call over target shrinks it by
+        `shrink`, and a 429 or timeout cuts it by `backoff`. The limit always
+        stays within [min_limit, max_limit]. A holder that only waits on other
+        work can hand its slot back for a while with yield_slot().
+        """
+
+        def __init__(self, name: str, initial: float, min_limit: float = 1, max_limit: float = 50,
+                     target_latency: float = 10.0, backoff: float = 0.5, shrink: float = 0.9):
+                self.name = name
+                self.limit = float(initial)
+                self.min_limit = float(min_limit)
+                self.max_limit = float(max_limit)
+                self.target_latency = target_latency
+                self.backoff = backoff
+                self.shrink = shrink
+                self.in_flight = 0
+                self.yielded = 0
+                self.overloads = 0
+                self.completed = 0
+                self.last_latency = 0.0
+                self._cond = asyncio.Condition()
+                self._held = contextvars.ContextVar(f"limiter_{name}_permit", default=None)
+
+        def available(self) -> int:
+                return max(0, int(self.limit) - self.in_flight)
+
+        def observe(self, latency: float, overloaded: bool = False):
+                self.last_latency = latency
+                self.completed += 1
+                if overloaded:
+                        self.overloads += 1
+                        self.limit = max(self.min_limit, self.limit * self.backoff)
+                elif latency > self.target_latency:
+                        self.limit = max(self.min_limit, self.limit * self.shrink)
+                else:
+                        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+        @asynccontextmanager
+        async def acquire(self):
+                async with self._cond:
+                        await self._cond.wait_for(lambda: self.in_flight < max(1, int(self.limit)))
+                        self.in_flight += 1
+                permit = _Permit()
+                held = self._held.set(permit)
+                start = time.monotonic()
+                overloaded = False
+                cancelled = False
+                try:
+                        yield
+                except asyncio.CancelledError:
+                        cancelled = True
+                        raise
+                except BaseException as e:
+                        overloaded = is_overload(e)
+                        raise
+                finally:
+                        self._held.reset(held)
+                        if not cancelled:
+                                self.observe(time.monotonic() - start - permit.excluded, overloaded)
+                        async with self._cond:
+                                self.in_flight -= 1
+                                self._cond.notify_all()
+
+        @asynccontextmanager
+        async def yield_slot(self):
+                """Hand this task's slot back while it only waits on someone else's work.
+
+                The time inside doesn't count toward its latency. The slot is taken
+                back without waiting on exit, as the holder is about to finish, so
+                in_flight may briefly exceed the limit. Outside acquire() this
+                does nothing.
+                """
+                permit = self._held.get()
+                if permit is None:
+                        yield
+                        return
+                async with self._cond:
+                        self.in_flight -= 1
+                        self.yielded += 1
+                        self._cond.notify_all()
+                start = time.monotonic()
+                try:
+                        yield
+                finally:
+                        self.in_flight += 1
+                        self.yielded -= 1
+                        permit.excluded += time.monotonic() - start
+
+        def snapshot(self) -> dict:
+                return {
+                        "limit": round(self.limit, 2),
+                        "in_flight": self.in_flight,
+                        "yielded": self.yielded,
+                        "completed": self.completed,
+                        "overloads": self.overloads,
+                        "last_latency": round(self.last_latency, 3),
+                }
+
+
+def _limiter(name: str, initial: int, max_limit: int, target_latency: float) -> AdaptiveLimiter:
+        prefix = f"LIMIT_{name.upper()}"
+        return AdaptiveLimiter(
+                name,
+                initial=int(os.getenv(f"{prefix}_INITIAL", initial)),
+                min_limit=int(os.getenv(f"{prefix}_MIN", 1)),
+                max_limit=int(os.getenv(f"{prefix}_MAX", max_limit)),
+                target_latency=float(os.getenv(f"{prefix}_TARGET", target_latency)),
+        )
+
+
+message_limiter = _limiter("messages", initial=5, max_limit=50, target_latency=60.0)
+llm_limiter = _limiter("llm", initial=8, max_limit=64, target_latency=20.0)
+search_limiter = _limiter("search", initial=16, max_limit=64, target_latency=6.0)
+fetch_limiter = _limiter("fetch", initial=16, max_limit=128, target_latency=8.0)
+
+LIMITERS = {l.name: l for l in (message_limiter, llm_limiter, search_limiter, fetch_limiter)}
+
+
+def limits_snapshot() -> dict:
+        return {name: l.snapshot() for name, l in LIMITERS.items()}
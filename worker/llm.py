@@ -0,0 +1,339 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatResult
+from dotenv import load_dotenv
+
+from .limiter import llm_limiter, is_overload
+from .metrics import span, LLM_SECONDS, LLM_TOKENS, LLM_COST, LLM_ROUTES
+from .progress import PROGRESSIVE_DELIVERY
+
+load_dotenv()
+
+# Provider SDKs are most of the worker's import time; each is imported by
+# build_chat_model() only if a configured model uses it.
+
+# Comma-separated provider:model lists, in fallback order. With no small
+# models every call goes to the strong ones.
+LLM_STRONG_MODELS = os.getenv("LLM_STRONG_MODELS", "openai:gpt-4.1")
+LLM_SMALL_MODELS = os.getenv("LLM_SMALL_MODELS", "openai:gpt-4.1-mini")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.5"))
+# A provider that timed out, rate-limited or 5xx'd is skipped for this long.
+LLM_FALLBACK_COOLDOWN = float(os.getenv("LLM_FALLBACK_COOLDOWN", "60"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "60"))
+
+# USD per 1M input/output tokens; LLM_PRICES="model=in/out,..." adds or overrides.
+_PRICES = {
+        "gpt-4.1": (2.00, 8.00),
+        "gpt-4.1-mini": (0.40, 1.60),
+        "gpt-4.1-nano": (0.10, 0.40),
+        "gpt-4o": (2.50, 10.00),
+        "gpt-4o-mini": (0.15, 0.60),
+        "grok-3": (3.00, 15.00),
+        "grok-3-mini": (0.30, 0.50),
+}
+for _item in filter(None, (s.strip() for s in os.getenv("LLM_PRICES", "").split(","))):
+        _model, _, _price = _item.partition("=")
+        _in, _, _out = _price.partition("/")
+        _PRICES[_model.strip()] = (float(_in), float(_out))
+
+_API_KEYS = {"openai": "OPENAI_API_KEY", "xai": "XAI_API_KEY"}
+
+# name -> monotonic time until which the candidate is skipped (process-wide).
+_cooldowns: Dict[str, float] = {}
+_stats: Dict[str, dict] = {}
+
+
+def _build(provider: str, model: str, retries: int):
+        key = os.getenv(_API_KEYS.get(provider, ""))
+        if provider == "openai":
+                from langchain_openai import ChatOpenAI
+                return ChatOpenAI(model_name=model, openai_api_key=key, temperature=LLM_TEMPERATURE,
+                                  streaming=PROGRESSIVE_DELIVERY, max_retries=retries)
+        if provider == "xai":
+                from langchain_xai import ChatXAI
+                return ChatXAI(model=model, xai_api_key=key, temperature=LLM_TEMPERATURE,
+                               streaming=PROGRESSIVE_DELIVERY, max_retries=retries)
+        raise ValueError(f"unknown LLM provider {provider!r}")
+
+
+class Candidate:
+        def __init__(self, provider: str, model: str, llm):
+                self.provider = provider
+                self.model = model
+                self.name = f"{provider}:{model}"
+                self.llm = llm
+
+
+def parse_candidates(spec: str) -> List[Candidate]:
+        entries = [s.strip() for s in spec.split(",") if s.strip()]
+        # With somewhere to fall back to, don't spend a slow provider's time on its own retries.
+        retries = 0 if len(entries) > 1 else 2
+        out = []
+        for entry in entries:
+                provider, _, model = entry.partition(":")
+                if not model:
+                        provider, model = "openai", provider
+                if not os.getenv(_API_KEYS.get(provider, "")):
+                        print(f"[router] {entry} skipped: {_API_KEYS.get(provider, provider)} is not set")
+                        continue
+                try:
+                        out.append(Candidate(provider, model, _build(provider, model, retries)))
+                except Exception as e:
+                        print(f"[router] {entry} skipped: {e!r}")
+        return out
+
+
+def _should_fall_back(error: BaseException) -> bool:
+        if is_overload(error):
+                return True
+        status = getattr(error, "status", None) or getattr(error, "status_code", None)
+        if isinstance(status, int) and status >= 500:
+                return True
+        return "Connection" in type(error).__name__
+
+
+def _is_tool_call(result: ChatResult) -> bool:
+        message = result.generations[0].message if result.generations else None
+        if message is None:
+                return False
+        return bool(message.additional_kwargs.get("function_call") or getattr(message, "tool_calls", None))
+
+
+def _usage(result: ChatResult) -> dict:
+        for g in result.generations:
+                usage = getattr(getattr(g, "message", None), "usage_metadata", None)
+                if usage:
+                        return usage
+        token_usage = (result.llm_output or {}).get("token_usage") or {}
+        return {"input_tokens": token_usage.get("prompt_tokens") or 0, "output_tokens": token_usage.get("completion_tokens") or 0}
+
+
+def _cost(model: str, usage: dict) -> float:
+        price_in, price_out = _PRICES.get(model, (0.0, 0.0))
+        return ((usage.get("input_tokens") or 0) * price_in + (usage.get("output_tokens") or 0) * price_out) / 1e6
+
+
+def _stat(name: str) -> dict:
+        return _stats.setdefault(name, {"calls": 0, "errors": 0, "fallbacks": 0, "seconds": 0.0,
+                                         "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+
+
+def router_stats() -> Dict[str, dict]:
+        now = time.monotonic()
+        return {
+                name: {**s, "cooling_down": 1 if _cooldowns.get(name, 0) > now else 0,
+                       "avg_seconds": round(s["seconds"] / s["calls"], 3) if s["calls"] else 0.0}
+                for name, s in _stats.items()
+        }
+
+
+class _TokenWatch:
+        """Passes a run manager through, noting whether any token was streamed."""
+
+        def __init__(self, run_manager, first: asyncio.Event = None):
+                self._run_manager = run_manager
+                self.first = first
+                self.emitted = False
+
+        def on_llm_new_token(self, *args, **kwargs):
+                self.emitted = True
+                if self.first is not None:
+                        self.first.set()
+                return self._run_manager.on_llm_new_token(*args, **kwargs)
+
+        def __getattr__(self, name):
+                return getattr(self._run_manager, name)
+
+
+class RoutedChatModel(BaseChatModel):
+        """Sends each call to a small or strong model, with provider fallback.
+
+        tier="auto" (the default): agent steps with tools bound go to the small
+        models. If a small model answers instead of calling a tool, that answer
+        would be the verdict, so the step is asked again of the strong model.
+        Calls without tools (the fast path's verdict) go straight to the
+        strong models. with_tier("small") pins cheap sub-tasks such as query
+        translation.
+
+        Within a tier, candidates are tried in order. One that gives no first
+        token within LLM_ATTEMPT_TIMEOUT, rate-limits or fails upstream is
+        skipped for LLM_FALLBACK_COOLDOWN; an answer that already started
+        streaming is never retried elsewhere.
+        Every attempt goes through the LLM limiter and records latency,
+        tokens and cost per model.
+        """
+
+        strong: List[Any]
+        small: List[Any] = []
+        tier: str = "auto"
+
+        @property
+        def _llm_type(self) -> str:
+                return "routed-chat"
+
+        @property
+        def _identifying_params(self) -> Dict[str, Any]:
+                return {"model_name": "router", "tier": self.tier}
+
+        def with_tier(self, tier: str) -> "RoutedChatModel":
+                return self.model_copy(update={"tier": tier})
+
+        def _tier(self, kwargs) -> str:
+                if self.tier != "auto":
+                        return self.tier
+                return "small" if self.small and (kwargs.get("functions") or kwargs.get("tools")) else "strong"
+
+        def _order(self, candidates: List[Candidate]) -> List[Candidate]:
+                # Cooling-down candidates go last rather than away: better a slow answer than none.
+                now = time.monotonic()
+                return sorted(candidates, key=lambda c: _cooldowns.get(c.name, 0) > now)
+
+        def _record(self, candidate: Candidate, elapsed: float, result: ChatResult = None):
+                stats = _stat(candidate.name)
+                stats["calls"] += 1
+                stats["seconds"] += elapsed
+                LLM_SECONDS.labels(model=candidate.model).observe(elapsed)
+                if result is None:
+                        stats["errors"] += 1
+                        return
+                usage = _usage(result)
+                cost = _cost(candidate.model, usage)
+                stats["input_tokens"] += usage.get("input_tokens") or 0
+                stats["output_tokens"] += usage.get("output_tokens") or 0
+                stats["cost_usd"] += cost
+                for kind in ("input", "output"):
+                        if usage.get(f"{kind}_tokens"):
+                                LLM_TOKENS.labels(model=candidate.model, kind=kind).inc(usage[f"{kind}_tokens"])
+                LLM_COST.labels(model=candidate.model).inc(cost)
+
+        def _fall_back(self, tier: str, candidate: Candidate, error: Exception, watch) -> bool:
+                """Put the candidate on cooldown if the next one should be tried."""
+                if not _should_fall_back(error) or (watch is not None and watch.emitted):
+                        # Once tokens reached the callbacks (the Telegram draft), a second
+                        # model's answer would be appended to the partial first one.
+                        return False
+                _cooldowns[candidate.name] = time.monotonic() + LLM_FALLBACK_COOLDOWN
+                _stat(candidate.name)["fallbacks"] += 1
+                LLM_ROUTES.labels(tier=tier, model=candidate.model, decision="fallback").inc()
+                print(f"[router] {candidate.name} failed ({type(error).__name__}: {error}); "
+                      f"cooling down {LLM_FALLBACK_COOLDOWN:.0f}s")
+                return True
+
+        def _routed(self, result: ChatResult, tier: str, candidate: Candidate, decision: str) -> ChatResult:
+                LLM_ROUTES.labels(tier=tier, model=candidate.model, decision=decision).inc()
+                # Per-model latency and tokens are recorded above; the callback handler skips routed results.
+                result.llm_output = {**(result.llm_output or {}), "model_name": candidate.model, "routed": True}
+                return result
+
+        def _escalate(self, result: ChatResult, candidate: Candidate) -> bool:
+                if self.tier == "auto" and not _is_tool_call(result) and candidate in self.small:
+                        # The small model is done planning; the verdict is the strong model's.
+                        LLM_ROUTES.labels(tier="small", model=candidate.model, decision="escalated").inc()
+                        return True
+                return False
+
+        async def _attempt(self, candidate: Candidate, messages, stop, watch, kwargs) -> ChatResult:
+                start = time.perf_counter()
+                result = None
+                try:
+                        async with llm_limiter.acquire():
+                                with span("llm"):
+                                        call = asyncio.ensure_future(
+                                                candidate.llm._agenerate(messages, stop=stop, run_manager=watch, **kwargs)
+                                        )
+                                        first = asyncio.ensure_future(watch.first.wait()) if watch is not None else None
+                                        try:
+                                                # LLM_ATTEMPT_TIMEOUT covers the wait for the first token
+                                                # (or the whole call when nothing is streamed).
+                                                done, _ = await asyncio.wait(
+                                                        [f for f in (call, first) if f is not None],
+                                                        timeout=LLM_ATTEMPT_TIMEOUT, return_when=asyncio.FIRST_COMPLETED,
+                                                )
+                                                if not done:
+                                                        raise asyncio.TimeoutError(f"no response in {LLM_ATTEMPT_TIMEOUT:g}s")
+                                                result = await call
+                                        finally:
+                                                for f in (call, first):
+                                                        if f is not None and not f.done():
+                                                                f.cancel()
+                        return result
+                finally:
+                        self._record(candidate, time.perf_counter() - start, result)
+
+        async def _run_tier(self, tier: str, candidates: List[Candidate], messages, stop, run_manager, kwargs):
+                """(result, candidate) from the first candidate that answers."""
+                last_error = None
+                for candidate in self._order(candidates):
+                        watch = _TokenWatch(run_manager, asyncio.Event()) if run_manager is not None else None
+                        try:
+                                return await self._attempt(candidate, messages, stop, watch, kwargs), candidate
+                        except asyncio.CancelledError:
+                                raise
+                        except Exception as e:
+                                if not self._fall_back(tier, candidate, e, watch):
+                                        raise
+                                last_error = e
+                raise last_error or RuntimeError(f"no {tier} LLM configured")
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+                tier = self._tier(kwargs)
+                if tier == "small":
+                        # Planning isn't shown to the user, so its tokens aren't streamed.
+                        result, candidate = await self._run_tier("small", self.small + self.strong, messages, stop, None, kwargs)
+                        if not self._escalate(result, candidate):
+                                return self._routed(result, tier, candidate, "small")
+                result, candidate = await self._run_tier("strong", self.strong, messages, stop, run_manager, kwargs)
+                return self._routed(result, tier, candidate, "strong")
+
+        def _run_tier_sync(self, tier: str, candidates: List[Candidate], messages, stop, run_manager, kwargs):
+                # No limiter or attempt timeout here: both are asyncio-based; the
+                # provider client's own request timeout applies.
+                last_error = None
+                for candidate in self._order(candidates):
+                        watch = _TokenWatch(run_manager) if run_manager is not None else None
+                        start = time.perf_counter()
+                        result = None
+                        try:
+                                with span("llm"):
+                                        result = candidate.llm._generate(messages, stop=stop, run_manager=watch, **kwargs)
+                                return result, candidate
+                        except Exception as e:
+                                if not self._fall_back(tier, candidate, e, watch):
+                                        raise
+                                last_error = e
+                        finally:
+                                self._record(candidate, time.perf_counter() - start, result)
+                raise last_error or RuntimeError(f"no {tier} LLM configured")
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+                tier = self._tier(kwargs)
+                if tier == "small":
+                        result, candidate = self._run_tier_sync("small", self.small + self.strong, messages, stop, None, kwargs)
+                        if not self._escalate(result, candidate):
+                                return self._routed(result, tier, candidate, "small")
+                result, candidate = self._run_tier_sync("strong", self.strong, messages, stop, run_manager, kwargs)
+                return self._routed(result, tier, candidate, "strong")
+
+        async def warm_up(self):
+                """Open each provider's TLS connection pool before the first message."""
+                async def ping(candidate):
+                        client = getattr(candidate.llm, "root_async_client", None)
+                        if client is not None:
+                                await client.models.list()
+                results = await asyncio.gather(*(ping(c) for c in self.small + self.strong), return_exceptions=True)
+                for candidate, result in zip(self.small + self.strong, results):
+                        if isinstance(result, Exception):
+                                print(f"[router] warm-up of {candidate.name} failed: {result!r}")
+
+
+def build_chat_model() -> RoutedChatModel:
+        strong = parse_candidates(LLM_STRONG_MODELS)
+        if not strong:
+                raise RuntimeError(f"no usable strong model in LLM_STRONG_MODELS={LLM_STRONG_MODELS!r}")
+        small = parse_candidates(LLM_SMALL_MODELS)
+        print(f"[router] strong={[c.name for c in strong]} small={[c.name for c in small]}")
+        return RoutedChatModel(strong=strong, small=small)
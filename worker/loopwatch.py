@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter, deque
+from typing import Optional
+
+from prometheus_client import Counter as PromCounter, Histogram
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOOP_DIAGNOSTICS = os.getenv("LOOP_DIAGNOSTICS", "0") == "1"
+# A callback holding the loop longer than this is reported with its stack.
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.05"))
+LOOP_REPORT_INTERVAL = float(os.getenv("LOOP_REPORT_INTERVAL", "60"))
+_KEEP_LAGS = 2048
+_KEEP_BLOCKS = 100
+_STACK_DEPTH = 12
+# Frames from these packages are "ours"; a block is attributed to the innermost one.
+_OWN_MODULES = ("worker", "api", "benchmarks", "__main__")
+
+LOOP_LAG_SECONDS = Histogram(
+        "newschecker_loop_lag_seconds", "How late the event loop ran a timer.",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_BLOCKS = PromCounter(
+        "newschecker_loop_blocks_total", "Event loop stalls over LOOP_BLOCK_THRESHOLD.", ["site"],
+)
+
+
+def _frames(frame) -> list:
+        out = []
+        while frame is not None:
+                out.append(frame)
+                frame = frame.f_back
+        return out
+
+
+def _describe(frame) -> str:
+        return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+
+def attribute(frame) -> tuple:
+        """(site, stack) for a blocked loop thread: site is module:function of the
+        innermost frame in our own code (or the innermost frame at all), stack the
+        innermost frames, outermost first."""
+        frames = _frames(frame)
+        own = next((f for f in frames if f.f_globals.get("__name__", "").split(".")[0] in _OWN_MODULES), None)
+        chosen = own or frames[0]
+        site = f"{chosen.f_globals.get('__name__', '?')}:{chosen.f_code.co_name}"
+        stack = [_describe(f) for f in reversed(frames[:_STACK_DEPTH])]
+        return site, stack
+
+
+class LoopWatchdog:
+        """Samples event-loop lag and catches the code that blocks it.
+
+        A heartbeat task on the loop measures how late its timer fires. A
+        watchdog thread notices when the heartbeat stops for longer than the
+        threshold and samples the loop thread's stack while it is stuck, so the
+        report names the function that held the loop, not just the lag.
+        """
+
+        def __init__(self, threshold: float = LOOP_BLOCK_THRESHOLD, interval: float = LOOP_LAG_INTERVAL):
+                self.threshold = threshold
+                self.interval = interval
+                self.lags = deque(maxlen=_KEEP_LAGS)
+                self.blocks = deque(maxlen=_KEEP_BLOCKS)
+                self.sites = {}
+                self._lock = threading.Lock()
+                self._episode = None
+                self._beat = time.monotonic()
+                self._loop_thread = None
+                self._stop = threading.Event()
+                self._tasks = []
+
+        def start(self):
+                loop = asyncio.get_running_loop()
+                self._loop_thread = threading.get_ident()
+                self._beat = time.monotonic()
+                self._tasks = [loop.create_task(self._heartbeat()), loop.create_task(self._log_reports())]
+                threading.Thread(target=self._watch, name="loopwatch", daemon=True).start()
+                print(f"[loopwatch] watching the event loop (threshold {self.threshold * 1000:.0f} ms)")
+
+        async def stop(self):
+                self._stop.set()
+                for task in self._tasks:
+                        task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        async def _heartbeat(self):
+                loop = asyncio.get_running_loop()
+                while True:
+                        start = loop.time()
+                        await asyncio.sleep(self.interval)
+                        lag = max(0.0, loop.time() - start - self.interval)
+                        self.lags.append(lag)
+                        LOOP_LAG_SECONDS.observe(lag)
+                        with self._lock:
+                                self._beat = time.monotonic()
+                                episode, self._episode = self._episode, None
+                        if episode is not None:
+                                self._record(episode, lag)
+
+        def _watch(self):
+                # Sample a few times per threshold so short stalls are still caught.
+                period = max(0.005, self.threshold / 4)
+                while not self._stop.wait(period):
+                        with self._lock:
+                                beat = self._beat
+                        if time.monotonic() - beat <= self.threshold + self.interval:
+                                continue
+                        frame = sys._current_frames().get(self._loop_thread)
+                        if frame is None:
+                                continue
+                        site, stack = attribute(frame)
+                        del frame
+                        with self._lock:
+                                if self._beat != beat:
+                                        # The loop moved on while we sampled; the stack isn't the stall.
+                                        continue
+                                if self._episode is None:
+                                        self._episode = {"at": time.time(), "samples": Counter(), "stacks": {}}
+                                self._episode["samples"][site] += 1
+                                self._episode["stacks"].setdefault(site, stack)
+
+        def _record(self, episode: dict, lag: float):
+                site, _ = episode["samples"].most_common(1)[0]
+                block = {
+                        "at": round(episode["at"], 3),
+                        "duration_ms": round(lag * 1000, 1),
+                        "site": site,
+                        "stack": episode["stacks"][site],
+                }
+                self.blocks.append(block)
+                stats = self.sites.setdefault(site, {"site": site, "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                stats["count"] += 1
+                stats["total_ms"] = round(stats["total_ms"] + block["duration_ms"], 1)
+                stats["max_ms"] = max(stats["max_ms"], block["duration_ms"])
+                stats["last_stack"] = block["stack"]
+                LOOP_BLOCKS.labels(site=site).inc()
+                print(f"[loopwatch] loop blocked {block['duration_ms']:.0f} ms in {site}: {block['stack'][-1]}")
+
+        def report(self, top: int = 20) -> dict:
+                lags = sorted(self.lags)
+
+                def pct(p):
+                        return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 2) if lags else 0.0
+
+                return {
+                        "threshold_ms": self.threshold * 1000,
+                        "lag_ms": {"p50": pct(0.5), "p99": pct(0.99), "max": round(lags[-1] * 1000, 2) if lags else 0.0},
+                        "blocks": sum(s["count"] for s in self.sites.values()),
+                        "sites": sorted(self.sites.values(), key=lambda s: -s["total_ms"])[:top],
+                        "recent": list(self.blocks)[-10:],
+                }
+
+        async def _log_reports(self):
+                while True:
+                        await asyncio.sleep(LOOP_REPORT_INTERVAL)
+                        report = self.report(top=5)
+                        sites = ", ".join(f"{s['site']} x{s['count']} ({s['total_ms']:.0f} ms)" for s in report["sites"]) or "none"
+                        print(f"[loopwatch] lag p50={report['lag_ms']['p50']} p99={report['lag_ms']['p99']} "
+                              f"max={report['lag_ms']['max']} ms; blocking sites: {sites}")
+
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+def start_watchdog() -> Optional[LoopWatchdog]:
+        """Start the process-wide watchdog if LOOP_DIAGNOSTICS=1."""
+        global _watchdog
+        if LOOP_DIAGNOSTICS and _watchdog is None:
+                _watchdog = LoopWatchdog()
+                _watchdog.start()
+        return _watchdog
+
+
+def get_watchdog() -> Optional[LoopWatchdog]:
+        return _watchdog
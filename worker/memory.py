@@ -1,8 +1,26 @@
-from langchain.schema import BaseChatMessageHistory
-from pymongo import MongoClient
+from langchain_core.chat_history import BaseChatMessageHistory
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
 from langchain_core.messages.base import messages_to_dict
 from langchain_core.messages.utils import messages_from_dict
 from datetime import datetime, timezone
+import asyncio
+import os
+
+from .cache import TTLCache
+
+HISTORY_LIMIT = 20
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "1024"))
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", "600"))
+HISTORY_TTL_DAYS = int(os.getenv("HISTORY_TTL_DAYS", "30"))
+
+# Newest first; _id breaks ties between messages written in the same insert_many.
+_NEWEST_FIRST = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# session_id -> last HISTORY_LIMIT messages, oldest first. Per process, so a
+# session served by several replicas may briefly miss the other replica's turns.
+_history_cache = TTLCache(HISTORY_CACHE_SESSIONS)
+_pending_writes = set()
 
 class MongoChatMessageHistory(BaseChatMessageHistory):
         def __init__(self, session_id: str, collection):
@@ -15,8 +33,8 @@ class MongoChatMessageHistory(BaseChatMessageHistory):
                         docs = list(self.collection.find(
                                 {"session_id": self.session_id},
                                 {"_id": 0}
-                        ).sort("timestamp", -1).limit(20))
-                        return messages_from_dict([doc["message"] for doc in docs])
+                        ).sort(_NEWEST_FIRST).limit(HISTORY_LIMIT))
+                        return messages_from_dict([doc["message"] for doc in reversed(docs)])
                 except Exception as e:
                         print(f"Error getting messages: {e}")
                         return []
@@ -26,7 +44,8 @@ class MongoChatMessageHistory(BaseChatMessageHistory):
                 try:
                         self.collection.insert_one({
                                 "session_id": self.session_id,
-                                "message": messages_to_dict([message])[0]
+                                "message": messages_to_dict([message])[0],
+                                "timestamp": datetime.now(timezone.utc)
                         })
                 except Exception as e:
                         print(f"Error adding message: {e}")
@@ -57,7 +76,7 @@ class MongoSessionStepMemory:
                         self.collection.find(
                                 {"session_id": session_id},
                                 {"_id": 0, "description": 1}
-                        ).sort("timestamp", -1).limit(20)
+                        ).sort(_NEWEST_FIRST).limit(HISTORY_LIMIT)
                         )
                         return "\n".join([step["description"] for step in steps])
                 except Exception as e:
@@ -82,9 +101,160 @@ class MongoSessionStepMemory:
                                 self.collection.find(
                                         {"session_id": session_id},
                                         {"_id": 0, "description": 1}
-                                ).sort("timestamp", -1).limit(20)
+                                ).sort(_NEWEST_FIRST).limit(HISTORY_LIMIT)
                         )
                         return [step["description"] for step in steps]
                 except Exception as e:
                         print(f"Error getting steps: {e}")
                         return []
+
+
+class AsyncMongoChatMessageHistory(BaseChatMessageHistory):
+        """Motor-backed chat history with a write-behind buffer.
+
+        Reads come from the per-process session cache when possible. Writes
+        update the cache immediately and reach Mongo as one insert_many per
+        call in a background task; use aflush_pending() before shutdown.
+
+        The sync API (messages, add_message(s), clear; used by LangChain's
+        sync paths) runs the Mongo call on the event loop the history was
+        created on, so it needs that loop to be running. On the loop thread
+        itself only cache hits and write-behind adds work; anything that has
+        to wait for Mongo raises RuntimeError, use the async methods there.
+        """
+
+        def __init__(self, session_id: str, collection, limit: int = HISTORY_LIMIT):
+                self.session_id = session_id
+                self.collection = collection
+                self.limit = limit
+                try:
+                        self._loop = asyncio.get_running_loop()
+                except RuntimeError:
+                        self._loop = None
+
+        @property
+        def messages(self):
+                cached = _history_cache.get(str(self.session_id))
+                if cached is not None:
+                        return list(cached)
+                return self._submit(self.aget_messages(), wait=True)
+
+        async def aget_messages(self):
+                cached = _history_cache.get(str(self.session_id))
+                if cached is not None:
+                        return list(cached)
+                try:
+                        docs = await self.collection.find(
+                                {"session_id": self.session_id},
+                                {"_id": 0}
+                        ).sort(_NEWEST_FIRST).limit(self.limit).to_list(self.limit)
+                        messages = messages_from_dict([doc["message"] for doc in reversed(docs)])
+                        _history_cache.set(str(self.session_id), messages, HISTORY_CACHE_TTL)
+                        return list(messages)
+                except Exception as e:
+                        print(f"Error getting messages: {e}")
+                        return []
+
+        def add_message(self, message):
+                self.add_messages([message])
+
+        def add_messages(self, messages):
+                docs = self._cache_messages(messages)
+                if docs:
+                        self._submit(self._write(docs), wait=False)
+
+        async def aadd_messages(self, messages):
+                docs = self._cache_messages(messages)
+                if docs:
+                        self._track(asyncio.create_task(self._write(docs)))
+
+        def _cache_messages(self, messages) -> list:
+                """Append to the cached session and return the documents to insert."""
+                messages = list(messages)
+                if not messages:
+                        return []
+                cached = _history_cache.get(str(self.session_id))
+                if cached is not None:
+                        _history_cache.set(str(self.session_id), (cached + messages)[-self.limit:], HISTORY_CACHE_TTL)
+
+                now = datetime.now(timezone.utc)
+                return [
+                        {"session_id": self.session_id, "message": m, "timestamp": now}
+                        for m in messages_to_dict(messages)
+                ]
+
+        @staticmethod
+        def _track(task):
+                _pending_writes.add(task)
+                task.add_done_callback(_pending_writes.discard)
+
+        def _submit(self, coro, wait: bool):
+                """Run `coro` from sync code on the loop that owns the Motor client."""
+                try:
+                        running = asyncio.get_running_loop()
+                except RuntimeError:
+                        running = None
+                if running is not None and not wait:
+                        self._track(running.create_task(coro))
+                        return None
+                if running is not None or self._loop is None or not self._loop.is_running():
+                        coro.close()
+                        # On the loop thread, blocking would deadlock; without the
+                        # owning loop, the Motor client can't be driven at all.
+                        raise RuntimeError("AsyncMongoChatMessageHistory: use the async methods here")
+                loop = self._loop
+                if wait:
+                        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+                # Tracked so aflush_pending() still waits for it.
+                loop.call_soon_threadsafe(lambda: self._track(loop.create_task(coro)))
+                return None
+
+        async def _write(self, docs):
+                try:
+                        await self.collection.insert_many(docs, ordered=True)
+                except Exception as e:
+                        print(f"Error adding messages: {e}")
+
+        def clear(self):
+                self._submit(self._delete(), wait=True)
+                _history_cache.set(str(self.session_id), [], HISTORY_CACHE_TTL)
+
+        async def aclear(self):
+                _history_cache.set(str(self.session_id), [], HISTORY_CACHE_TTL)
+                await self._delete()
+
+        async def _delete(self):
+                try:
+                        await self.collection.delete_many({"session_id": self.session_id})
+                except Exception as e:
+                        print(f"Error clearing messages: {e}")
+
+
+async def ensure_indexes(db, ttl_days: int = HISTORY_TTL_DAYS):
+        """Startup migration for the history collections.
+
+        Creates the (session_id, timestamp) index every history read uses,
+        stamps legacy documents that were written without a timestamp, and
+        keeps a TTL index on timestamp so old sessions expire.
+        """
+        ttl = ttl_days * 86400
+        for name in ("chat_history", "step_memory_sessions"):
+                collection = db[name]
+                await collection.create_index(
+                        [("session_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                        name="session_timestamp",
+                )
+                await collection.update_many(
+                        {"timestamp": {"$exists": False}},
+                        {"$set": {"timestamp": datetime.now(timezone.utc)}},
+                )
+                try:
+                        await collection.create_index("timestamp", name="timestamp_ttl", expireAfterSeconds=ttl)
+                except OperationFailure:
+                        # TTL changed since the index was built: update it in place.
+                        await db.command("collMod", name, index={"name": "timestamp_ttl", "expireAfterSeconds": ttl})
+
+
+async def aflush_pending():
+        if _pending_writes:
+                await asyncio.gather(*list(_pending_writes), return_exceptions=True)
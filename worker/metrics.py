@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable
+
+from aiohttp import web
+from langchain_core.callbacks import AsyncCallbackHandler
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# p50/p95/p99 come from these with histogram_quantile(); the buckets cover
+# sub-millisecond cache hits up to multi-minute agent runs.
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+        "newschecker_stage_seconds", "Time spent per pipeline stage.", ["stage"], buckets=_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+        "newschecker_stage_errors_total", "Stage executions that raised.", ["stage"],
+)
+QUEUE_WAIT_SECONDS = Histogram(
+        "newschecker_queue_wait_seconds", "From XADD to the start of processing.", ["lane"], buckets=_BUCKETS,
+)
+LLM_SECONDS = Histogram(
+        "newschecker_llm_seconds", "LLM call latency, including limiter wait.", ["model"], buckets=_BUCKETS,
+)
+LLM_TOKENS = Counter(
+        "newschecker_llm_tokens_total", "LLM tokens by direction.", ["model", "kind"],
+)
+LLM_COST = Counter(
+        "newschecker_llm_cost_usd_total", "Estimated LLM spend from token usage and list prices.", ["model"],
+)
+LLM_ROUTES = Counter(
+        "newschecker_llm_routes_total", "Model routing decisions (small, strong, escalated, fallback).",
+        ["tier", "model", "decision"],
+)
+TOOL_SECONDS = Histogram(
+        "newschecker_tool_seconds", "Agent tool call latency.", ["tool", "outcome"], buckets=_BUCKETS,
+)
+MESSAGES = Counter(
+        "newschecker_messages_total", "Fact-check messages handled.", ["mode", "outcome"],
+)
+STARTUP_SECONDS = Gauge(
+        "newschecker_startup_seconds", "How long each worker startup phase took.", ["phase"],
+)
+
+
+@contextmanager
+def span(stage: str):
+        """Time a block into newschecker_stage_seconds{stage}; errors are counted too."""
+        start = time.perf_counter()
+        try:
+                yield
+        except asyncio.CancelledError:
+                raise
+        except BaseException:
+                STAGE_ERRORS.labels(stage=stage).inc()
+                raise
+        finally:
+                STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+class SnapshotCollector:
+        """Exports a stats() style dict of dicts as labelled metrics at scrape time.
+
+        fn() returns {label_value: {field: number}}; each field becomes
+        newschecker_<name>_<field>{<label>=label_value}, a counter if the
+        field is listed in counters and a gauge otherwise.
+        """
+
+        def __init__(self, name: str, label: str, fn: Callable[[], Dict[str, dict]], counters: Iterable[str] = ()):
+                self.name = name
+                self.label = label
+                self.fn = fn
+                self.counters = set(counters)
+
+        def collect(self):
+                try:
+                        snapshot = self.fn()
+                except Exception as e:
+                        print(f"[metrics] {self.name} snapshot failed: {e}")
+                        return
+                families = {}
+                for key, fields in snapshot.items():
+                        for field, value in fields.items():
+                                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                                        continue
+                                family = families.get(field)
+                                if family is None:
+                                        metric = f"newschecker_{self.name}_{field}"
+                                        if field in self.counters:
+                                                family = CounterMetricFamily(metric, f"{self.name} {field}", labels=[self.label])
+                                        else:
+                                                family = GaugeMetricFamily(metric, f"{self.name} {field}", labels=[self.label])
+                                        families[field] = family
+                                family.add_metric([str(key)], value)
+                yield from families.values()
+
+
+_registered = set()
+
+
+def register_snapshot(name: str, label: str, fn: Callable[[], Dict[str, dict]], counters: Iterable[str] = ()):
+        # Registering is process-wide; a second call just keeps the first.
+        if name in _registered:
+                return
+        _registered.add(name)
+        REGISTRY.register(SnapshotCollector(name, label, fn, counters))
+
+
+def render() -> bytes:
+        return generate_latest(REGISTRY)
+
+
+class MetricsCallbackHandler(AsyncCallbackHandler):
+        """Records LLM latency and token usage, and tool latency, from LangChain callbacks."""
+
+        def __init__(self):
+                self._started = {}
+
+        def _model(self, serialized, kwargs) -> str:
+                params = kwargs.get("invocation_params") or {}
+                return params.get("model_name") or params.get("model") or (serialized or {}).get("name") or "unknown"
+
+        async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                self._started[run_id] = (time.perf_counter(), self._model(serialized, kwargs))
+
+        async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self._started[run_id] = (time.perf_counter(), self._model(serialized, kwargs))
+
+        async def on_llm_end(self, response, *, run_id, **kwargs):
+                start, model = self._started.pop(run_id, (None, "unknown"))
+                if (response.llm_output or {}).get("routed"):
+                        # The router already recorded latency and tokens for the model that answered.
+                        return
+                if start is not None:
+                        LLM_SECONDS.labels(model=model).observe(time.perf_counter() - start)
+                usage = {}
+                for generations in response.generations:
+                        for g in generations:
+                                usage = getattr(getattr(g, "message", None), "usage_metadata", None) or usage
+                if not usage:
+                        token_usage = (response.llm_output or {}).get("token_usage") or {}
+                        usage = {"input_tokens": token_usage.get("prompt_tokens"), "output_tokens": token_usage.get("completion_tokens")}
+                for kind in ("input", "output"):
+                        if usage.get(f"{kind}_tokens"):
+                                LLM_TOKENS.labels(model=model, kind=kind).inc(usage[f"{kind}_tokens"])
+
+        async def on_llm_error(self, error, *, run_id, **kwargs):
+                start, model = self._started.pop(run_id, (None, "unknown"))
+                STAGE_ERRORS.labels(stage="llm").inc()
+                if start is not None:
+                        LLM_SECONDS.labels(model=model).observe(time.perf_counter() - start)
+
+        async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+                name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+                self._started[run_id] = (time.perf_counter(), name)
+
+        async def on_tool_end(self, output, *, run_id, **kwargs):
+                self._tool_done(run_id, "ok")
+
+        async def on_tool_error(self, error, *, run_id, **kwargs):
+                self._tool_done(run_id, "error")
+
+        def _tool_done(self, run_id, outcome: str):
+                start, name = self._started.pop(run_id, (None, "unknown"))
+                if start is not None:
+                        TOOL_SECONDS.labels(tool=name, outcome=outcome).observe(time.perf_counter() - start)
+
+
+metrics_handler = MetricsCallbackHandler()
+
+
+async def _metrics(request):
+        return web.Response(body=render(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def start_metrics_server(port: int = METRICS_PORT, routes: Dict[str, Callable] = None) -> web.AppRunner:
+        """Serve /metrics (and any extra GET routes) from the worker's event loop."""
+        app = web.Application()
+        app.router.add_get("/metrics", _metrics)
+        for path, handler in (routes or {}).items():
+                app.router.add_get(path, handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+        print(f"Metrics on :{port}/metrics")
+        return runner
@@ -0,0 +1,173 @@
+"""Offline stand-ins for the worker's network edges.
+
+install() swaps the search engines and the page fetcher for deterministic
+fakes derived from the query or URL (or replayed from recorded fixtures),
+so search, page cache, extraction and evidence compaction all run for real
+without touching the network. OfflineChatModel replaces the LLM, including
+the function calls the agent expects. Used by the batch CLI's --offline
+mode and the end-to-end benchmark.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, FunctionMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from . import tools
+from .cache import search_cache, page_cache
+
+_SOURCES = ("reuters.com", "apnews.com", "bbc.co.uk", "theguardian.com", "dw.com", "lemonde.fr")
+_WORD = re.compile(r"\w+", re.U)
+
+
+def _digest(text: str) -> int:
+        return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def fake_search_results(engine: str, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """Stable hits for a query; engines overlap on some URLs, like real ones do."""
+        seed = _digest(query)
+        now = datetime.now(timezone.utc)
+        words = _WORD.findall(query)[:8]
+        out = []
+        for i in range(max_results):
+                # Even slots are shared by every engine, odd ones are engine-specific.
+                key = f"{seed:x}-{i}" if i % 2 == 0 else f"{seed:x}-{engine}-{i}"
+                source = _SOURCES[(seed + i) % len(_SOURCES)]
+                out.append({
+                        "title": f"{' '.join(words)} - report {i + 1}",
+                        "url": f"https://{source}/news/{key}",
+                        "snippet": f"Coverage of {' '.join(words)}. Officials commented on {words[i % len(words)] if words else 'the story'} on day {i + 1}.",
+                        "source": source,
+                        "published_at": None if "web" in engine else (now - timedelta(days=i)).isoformat(),
+                        "engine": engine,
+                })
+        return out
+
+
+def fake_page(url: str) -> str:
+        seed = _digest(url)
+        slug = url.rsplit("/", 1)[-1]
+        paragraphs = "".join(
+                f"<p>Paragraph {i} of story {slug}. Reported figure was {seed % 1000 + i} on "
+                f"2025-0{i % 9 + 1}-1{i % 10}. Analysts said the account is {'consistent' if (seed >> i) & 1 else 'disputed'}.</p>"
+                for i in range(12)
+        )
+        return f"<html><head><title>Story {slug}</title></head><body><article>{paragraphs}</article></body></html>"
+
+
+def load_fixtures(path: str) -> dict:
+        """search.json (a list of hits), pages/*.html and llm.json from a fixture directory."""
+        with open(os.path.join(path, "search.json"), encoding="utf-8") as f:
+                search = json.load(f)
+        pages_dir = os.path.join(path, "pages")
+        pages = []
+        for name in sorted(os.listdir(pages_dir)):
+                with open(os.path.join(pages_dir, name), encoding="utf-8") as f:
+                        pages.append(f.read())
+        llm = {}
+        if os.path.exists(os.path.join(path, "llm.json")):
+                with open(os.path.join(path, "llm.json"), encoding="utf-8") as f:
+                        llm = json.load(f)
+        return {"search": search, "pages": pages, "llm": llm}
+
+
+def fixture_search_results(fixtures: dict, engine: str, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """Recorded hits for the engine, with URLs made specific to the query so
+        different claims fetch different pages, as they would live."""
+        tag = f"{_digest(query) % 0xffffff:06x}"
+        hits = [h for h in fixtures["search"] if h.get("engine") == engine] or fixtures["search"]
+        return [{**h, "url": f"{h['url'].rstrip('/')}/{tag}", "engine": engine} for h in hits[:max_results]]
+
+
+def install(search_latency: float = 0.0, fetch_latency: float = 0.0, fixtures: Optional[dict] = None):
+        """Route search and fetch to the fakes for the rest of the process."""
+
+        def engines(query: str, max_results: int, days: int) -> Dict[str, tuple]:
+                def engine(name):
+                        def run(q, n):
+                                if search_latency:
+                                        time.sleep(search_latency)
+                                if fixtures:
+                                        return fixture_search_results(fixtures, name, q, n)
+                                return fake_search_results(name, q, n)
+                        return run
+                if fixtures:
+                        names = list(dict.fromkeys(h.get("engine") or "fixture" for h in fixtures["search"]))
+                        return {name: (engine(name), (query, max_results), None if "web" in name else days) for name in names}
+                web_results = min(6, max_results)
+                return {
+                        "offline_news": (engine("offline_news"), (query, max_results), days),
+                        "offline_web": (engine("offline_web"), (query, web_results), None),
+                }
+
+        async def fetch(session, url: str, timeout: int = 15, headers: Optional[Dict[str, str]] = None, max_bytes: int = tools.FETCH_MAX_BYTES):
+                if fetch_latency:
+                        await asyncio.sleep(fetch_latency)
+                if fixtures:
+                        page = fixtures["pages"][_digest(url.rsplit("/", 1)[0]) % len(fixtures["pages"])]
+                        return 200, page[:max_bytes], {}
+                return 200, fake_page(url)[:max_bytes], {}
+
+        tools._search_engines = engines
+        tools._fetch = fetch
+        # Caches stay in-process; there is no Redis offline.
+        search_cache.use_redis = False
+        page_cache.use_redis = False
+
+
+class OfflineChatModel(BaseChatModel):
+        """Answers with a fixed-format verdict citing the URLs in the evidence.
+
+        Bound to the agent's functions it plays the agent's usual plan: one
+        news_search, `fetches` fetch_and_summarize calls on the hits, then the
+        verdict. `final` is the verdict template ({sources} is filled in).
+        """
+
+        latency: float = 0.0
+        fetches: int = 2
+        final: str = "*Verdict:* Unverified (offline run)\n\n*Sources:*\n{sources}"
+
+        @property
+        def _llm_type(self) -> str:
+                return "offline"
+
+        def _reply(self, message: AIMessage, prompt_chars: int) -> ChatResult:
+                text = message.content or json.dumps(message.additional_kwargs)
+                usage = {"input_tokens": prompt_chars // 4, "output_tokens": len(text) // 4, "total_tokens": (prompt_chars + len(text)) // 4}
+                message.usage_metadata = usage
+                return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _answer(self, messages, functions=None) -> ChatResult:
+                prompt_chars = sum(len(str(m.content)) for m in messages)
+                observations = [m for m in messages if isinstance(m, (FunctionMessage, ToolMessage))]
+                urls = list(dict.fromkeys(u for m in (observations or messages[-1:]) for u in re.findall(r'"u":"([^"]+)"', str(m.content))))
+                if functions:
+                        if not observations:
+                                question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+                                return self._reply(_function_call("news_search", {"query": str(question)[:200], "max_results": 8, "days": 30}), prompt_chars)
+                        if len(observations) <= self.fetches and len(observations) - 1 < len(urls):
+                                return self._reply(_function_call("fetch_and_summarize", {"url": urls[len(observations) - 1], "char_limit": 2000}), prompt_chars)
+                text = self.final.replace("{sources}", "\n".join(f"- {u}" for u in urls[:3]))
+                return self._reply(AIMessage(content=text), prompt_chars)
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+                if self.latency:
+                        time.sleep(self.latency)
+                return self._answer(messages, kwargs.get("functions"))
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+                if self.latency:
+                        await asyncio.sleep(self.latency)
+                return self._answer(messages, kwargs.get("functions"))
+
+
+def _function_call(name: str, arguments: dict) -> AIMessage:
+        return AIMessage(content="", additional_kwargs={"function_call": {"name": name, "arguments": json.dumps(arguments)}})
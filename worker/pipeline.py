@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from typing import List
+
+from langchain_core.messages import SystemMessage, HumanMessage
+from dotenv import load_dotenv
+
+from .tools import NewsSearchTool, FetchAndSummarizeTool, _dedupe, compact_result
+from .prompts import get_fast_path_system_prompt
+
+load_dotenv()
+
+# "agent" or "fast"; a message may override it with {"mode": ...}.
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "agent")
+# With PIPELINE_MODE=agent, this share of messages is routed to the fast path (A/B).
+FAST_PATH_RATIO = float(os.getenv("FAST_PATH_RATIO", "0"))
+FAST_PATH_TOP_K = int(os.getenv("FAST_PATH_TOP_K", "3"))
+FAST_PATH_CHAR_LIMIT = int(os.getenv("FAST_PATH_CHAR_LIMIT", "2500"))
+FAST_PATH_SEARCH_RESULTS = 10
+FAST_PATH_SEARCH_DAYS = 30
+
+_search_tool = NewsSearchTool()
+_fetch_tool = FetchAndSummarizeTool()
+
+_URL = re.compile(r"https?://\S+")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def choose_mode(message: dict) -> str:
+        mode = message.get("mode")
+        if mode in ("agent", "fast"):
+                return mode
+        if PIPELINE_MODE == "agent" and FAST_PATH_RATIO > 0 and random.random() < FAST_PATH_RATIO:
+                return "fast"
+        return PIPELINE_MODE
+
+
+def extract_claim(text: str, max_chars: int = 300) -> str:
+        """Heuristic claim for search: the question tag if present, else the first
+        sentences without URLs, emoji or markup, cut at max_chars."""
+        match = re.search(r"<USER_QUESTION>(.*?)</USER_QUESTION>", text or "", re.DOTALL)
+        text = match.group(1) if match else (text or "")
+        text = _URL.sub(" ", text)
+        text = re.sub(r"[^\w\s.,:;!?%$€£№\"'«»()\-–—/]", " ", text)
+        text = " ".join(text.split())
+        text = re.sub(r"\s+([.,:;!?])", r"\1", text)
+        text = re.sub(r"([.,:;!?])(?:[.,:;]+)", r"\1", text)
+        claim = ""
+        for sentence in _SENTENCE_END.split(text):
+                if claim and len(claim) + len(sentence) + 1 > max_chars:
+                        break
+                claim = f"{claim} {sentence}".strip()
+        return claim[:max_chars] or text[:max_chars]
+
+
+def is_english(text: str) -> bool:
+        letters = [c for c in text if c.isalpha()]
+        if not letters:
+                return True
+        return sum(1 for c in letters if c.isascii()) / len(letters) > 0.8
+
+
+async def translate_to_english(llm, claim: str) -> str:
+        if hasattr(llm, "with_tier"):
+                llm = llm.with_tier("small")
+        response = await llm.ainvoke([
+                SystemMessage(content="Translate the user's text to English for a news search query. Reply with the translation only."),
+                HumanMessage(content=claim),
+        ])
+        return response.content.strip()
+
+
+async def _search(query: str) -> List[dict]:
+        try:
+                return await _search_tool.search(query, FAST_PATH_SEARCH_RESULTS, FAST_PATH_SEARCH_DAYS)
+        except Exception as e:
+                print(f"[fast_path] search failed for {query!r}: {e}")
+                return []
+
+
+async def _translated_search(llm, claim: str) -> List[dict]:
+        try:
+                english = await translate_to_english(llm, claim)
+        except Exception as e:
+                print(f"[fast_path] translation failed: {e}")
+                return []
+        return await _search(english)
+
+
+def _pick_urls(results: List[dict], k: int) -> List[str]:
+        # Interleave dated (news) and undated (web) hits so both kinds get fetched.
+        dated = [r for r in results if r.get("published_at")]
+        undated = [r for r in results if not r.get("published_at")]
+        ordered = [r for pair in zip(dated, undated) for r in pair] + dated[len(undated):] + undated[len(dated):]
+        return [r["url"] for r in ordered if r.get("url")][:k]
+
+
+def _set_status(callbacks, status: str, stage: str = None):
+        for handler in callbacks or []:
+                if hasattr(handler, "set_status"):
+                        handler.set_status(status)
+                if stage and hasattr(handler, "set_stage"):
+                        handler.set_stage(stage)
+
+
+async def gather_evidence(llm, user_input: str, callbacks=None, results: List[dict] = None) -> dict:
+        """Search (unless results were already found, e.g. shared by a batch group), then fetch the top pages."""
+        claim = extract_claim(user_input)
+        if results is None:
+                _set_status(callbacks, "🔎 Searching news...", "searching")
+                searches = [_search(claim)]
+                if not is_english(claim):
+                        searches.append(_translated_search(llm, claim))
+                results = _dedupe([r for batch in await asyncio.gather(*searches) for r in batch])
+
+        urls = _pick_urls(results, FAST_PATH_TOP_K)
+        _set_status(callbacks, f"🔎 Found {len(results)} sources, reading {len(urls)}...", "fetching")
+        pages = await asyncio.gather(*[_fetch_tool._arun(url, FAST_PATH_CHAR_LIMIT) for url in urls])
+        return {
+                "claim": claim,
+                "search_results": [compact_result(r) for r in results[:FAST_PATH_SEARCH_RESULTS * 2]],
+                "pages": [json.loads(p) for p in pages],
+        }
+
+
+async def run_fast_path(llm, user_input: str, chat_history, callbacks=None, results: List[dict] = None) -> str:
+        """Search and fetch deterministically, then make one verdict LLM call.
+
+        Skips the agent's planning round-trips; only a non-English claim costs an
+        extra (small, concurrent with the first search) translation call.
+        """
+        started = time.monotonic()
+        evidence = await gather_evidence(llm, user_input, callbacks, results)
+        gathered = time.monotonic()
+        _set_status(callbacks, "✍️ Drafting the verdict...", "drafting")
+
+        response = await llm.ainvoke([
+                SystemMessage(content=get_fast_path_system_prompt()),
+                *chat_history,
+                HumanMessage(content=(
+                        f"{user_input}\n\n<EVIDENCE>\n"
+                        f"{json.dumps(evidence, ensure_ascii=False, separators=(',', ':'))}\n</EVIDENCE>"
+                )),
+        ], config={"callbacks": callbacks or []})
+        usage = getattr(response, "usage_metadata", None) or {}
+        print(f"[pipeline] mode=fast evidence={gathered - started:.2f}s llm={time.monotonic() - gathered:.2f}s "
+              f"urls={len(evidence['pages'])} tokens_in={usage.get('input_tokens')} tokens_out={usage.get('output_tokens')}")
+        return response.content
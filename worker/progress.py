@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import asyncio
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from dotenv import load_dotenv
+
+from .response import send_message, edit_message, send_response, split_message
+
+load_dotenv()
+
+PROGRESSIVE_DELIVERY = os.getenv("PROGRESSIVE_DELIVERY", "0") == "1"
+# Telegram allows roughly one edit per second per chat; stay under it.
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "1.5"))
+TELEGRAM_MAX_CHARS = 4096
+
+
+def progressive_enabled(message: dict) -> bool:
+        return PROGRESSIVE_DELIVERY and message.get("progress", True) and message.get("chat_id") is not None
+
+
+class ProgressReporter(AsyncCallbackHandler):
+        """Shows a fact-check's progress in a single Telegram message.
+
+        start() posts a placeholder, tool and LLM callbacks edit it with the
+        current stage, final-answer tokens are streamed into it as they arrive,
+        and finish() replaces it with the report. Edits are throttled to one
+        per PROGRESS_EDIT_INTERVAL seconds; intermediate states may be skipped,
+        the latest one is always shown.
+        """
+
+        def __init__(self, chat_id):
+                self.chat_id = chat_id
+                self.message_id = None
+                self.sources = 0
+                self.fetched = 0
+                self.status = "⏳ Checking the claim..."
+                self._tools = {}
+                self._tokens = []
+                self._shown = None
+                self._last_edit = 0.0
+                self._flush_task = None
+                self._done = False
+
+        async def start(self):
+                response = await send_message(self.status, self.chat_id)
+                if response.get("ok"):
+                        self.message_id = response["result"]["message_id"]
+                        self._shown = self.status
+                        self._last_edit = time.monotonic()
+
+        def set_status(self, status: str):
+                self.status = status
+                self._schedule()
+
+        def _render(self) -> str:
+                text = "".join(self._tokens)
+                if text:
+                        return text[-TELEGRAM_MAX_CHARS + 10:] + " ▌"
+                return self.status
+
+        def _schedule(self):
+                if self.message_id is None or self._done:
+                        return
+                delay = PROGRESS_EDIT_INTERVAL - (time.monotonic() - self._last_edit)
+                if self._flush_task is None or self._flush_task.done():
+                        self._flush_task = asyncio.create_task(self._flush(max(0.0, delay)))
+
+        async def _flush(self, delay: float):
+                if delay:
+                        await asyncio.sleep(delay)
+                # Keep going until the latest state is on screen.
+                while not self._done and self._render() != self._shown:
+                        text = self._render()
+                        self._last_edit = time.monotonic()
+                        self._shown = text
+                        await edit_message(self.chat_id, self.message_id, text)
+                        if not self._done and self._render() != self._shown:
+                                await asyncio.sleep(PROGRESS_EDIT_INTERVAL)
+
+        async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+                name = (serialized or {}).get("name") or kwargs.get("name")
+                self._tools[run_id] = name
+                if name == "news_search":
+                        self.set_status(f"🔎 Searching news... ({self.sources} sources so far)")
+                elif name == "fetch_and_summarize":
+                        self.set_status(f"📄 Reading source {self.fetched + 1}...")
+
+        async def on_tool_end(self, output, *, run_id, **kwargs):
+                name = self._tools.pop(run_id, None)
+                if name == "news_search":
+                        try:
+                                self.sources += len(json.loads(getattr(output, "content", output)))
+                        except Exception:
+                                pass
+                        self.set_status(f"🔎 Found {self.sources} sources, verifying...")
+                elif name == "fetch_and_summarize":
+                        self.fetched += 1
+                        self.set_status(f"✅ Verified {self.fetched} source(s), drafting the verdict...")
+
+        async def on_llm_start(self, serialized, prompts, **kwargs):
+                self._tokens = []
+
+        async def on_chat_model_start(self, serialized, messages, **kwargs):
+                self._tokens = []
+
+        async def on_llm_new_token(self, token, **kwargs):
+                if token:
+                        self._tokens.append(token)
+                        self._schedule()
+
+        async def finish(self, text: str, on_sent=None) -> dict:
+                """Replace the placeholder with the final report (overflow goes in new messages).
+
+                Chunks are counted as in send_response(), the edited placeholder
+                being the first, and reported through on_sent.
+                """
+                self._done = True
+                if self._flush_task is not None and not self._flush_task.done():
+                        self._flush_task.cancel()
+                if self.message_id is None:
+                        return await send_response(text, self.chat_id, on_sent=on_sent)
+                chunks = split_message(text) or [""]
+                response = await edit_message(self.chat_id, self.message_id, chunks[0], parse_mode="Markdown")
+                if not response.get("ok"):
+                        return await send_response(text, self.chat_id, on_sent=on_sent)
+                if on_sent:
+                        await on_sent(1)
+                if len(chunks) > 1:
+                        return await send_response(text, self.chat_id, start=1, on_sent=on_sent)
+                return response
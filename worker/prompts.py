@@ -78,6 +78,16 @@ Edge Cases
         return system_message
 
 
+def get_fast_path_system_prompt():
+        return get_system_prompt() + """
+FAST PATH MODE
+- Tools are NOT available in this mode. news_search and fetch_and_summarize were already run for you;
+  their results are inlined in the user message inside <EVIDENCE>.
+- Base the verdict only on that evidence (and say so if it is thin). Do not ask for more searches.
+- The ANSWER FORMAT and OUTPUT RULES above apply unchanged.
+"""
+
+
 def get_prompt():
 
         prompt = ChatPromptTemplate.from_messages([
@@ -1,21 +1,208 @@
 import os
+import time
+import asyncio
+from collections import OrderedDict
 from dotenv import load_dotenv
 import requests
 import aiohttp
 
+from .utils import remove_markdown, to_telegram_markdown
+from .metrics import span
+
 load_dotenv()
 
-async def send_response(text, chat_id):
-        try:
-                async with aiohttp.ClientSession() as session:
-                        async with session.post(
-                                f"https://api.telegram.org/bot{os.environ.get('TELEGRAM_BOT_TOKEN_CHAT')}/sendMessage",
-                                json={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
-                        ) as response:
-                                return await response.json()
-        except Exception as e:
-                print(f"Error sending response: {e}")
-                return {"status": "error", "reason": str(e)}
+TELEGRAM_MAX_CHARS = 4096
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "5"))
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))
+_CHAT_BUCKETS = 4096
+
+
+class TokenBucket:
+        def __init__(self, rate: float, capacity: float):
+                self.rate = rate
+                self.capacity = capacity
+                self.tokens = capacity
+                self.updated = time.monotonic()
+                self._lock = asyncio.Lock()
+
+        async def acquire(self):
+                # The lock keeps waiters in FIFO order instead of racing for refills.
+                async with self._lock:
+                        while True:
+                                now = time.monotonic()
+                                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                                self.updated = now
+                                if self.tokens >= 1:
+                                        self.tokens -= 1
+                                        return
+                                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+        def pause(self, seconds: float):
+                """Honor a retry_after: no tokens until it has passed."""
+                self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class TelegramClient:
+        """Outbound Bot API client shared by the whole worker.
+
+        One pooled session, a global and a per-chat token bucket in front of
+        every call, retries with backoff that honor 429 retry_after, messages
+        split at 4096 characters, and a plain-text resend when Telegram can't
+        parse the Markdown.
+        """
+
+        def __init__(self, token: str = None):
+                self.token = token or os.environ.get("TELEGRAM_BOT_TOKEN_CHAT")
+                self._session = None
+                self._session_loop = None
+                self._global = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+                self._chats = OrderedDict()
+
+        def _get_session(self):
+                loop = asyncio.get_running_loop()
+                if self._session is None or self._session.closed or self._session_loop is not loop:
+                        self._session = aiohttp.ClientSession(
+                                connector=aiohttp.TCPConnector(limit=TELEGRAM_POOL_SIZE, ttl_dns_cache=300),
+                                timeout=aiohttp.ClientTimeout(total=30),
+                        )
+                        self._session_loop = loop
+                return self._session
+
+        def _chat_bucket(self, chat_id) -> TokenBucket:
+                key = str(chat_id)
+                bucket = self._chats.get(key)
+                if bucket is None:
+                        # Negative ids are groups and channels, which have a lower limit.
+                        rate = TELEGRAM_GROUP_RATE if key.startswith("-") else TELEGRAM_CHAT_RATE
+                        bucket = self._chats[key] = TokenBucket(rate, 1)
+                        while len(self._chats) > _CHAT_BUCKETS:
+                                self._chats.popitem(last=False)
+                self._chats.move_to_end(key)
+                return bucket
+
+        async def call(self, method: str, payload: dict) -> dict:
+                chat_id = payload.get("chat_id")
+                data = {"ok": False, "description": "not sent"}
+                for attempt in range(TELEGRAM_MAX_RETRIES):
+                        if chat_id is not None:
+                                await self._chat_bucket(chat_id).acquire()
+                        await self._global.acquire()
+                        try:
+                                with span(f"telegram:{method}"):
+                                        async with self._get_session().post(
+                                                f"https://api.telegram.org/bot{self.token}/{method}",
+                                                json=payload
+                                        ) as response:
+                                                data = await response.json(content_type=None)
+                        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                                print(f"Error calling {method} (attempt {attempt + 1}): {e}")
+                                data = {"ok": False, "description": str(e)}
+                                await asyncio.sleep(min(30, 2 ** attempt))
+                                continue
+
+                        if data.get("ok"):
+                                return data
+                        code = data.get("error_code") or 0
+                        if code == 429:
+                                retry_after = (data.get("parameters") or {}).get("retry_after") or 2 ** attempt
+                                print(f"Telegram 429 on {method}, retrying after {retry_after}s")
+                                if chat_id is not None:
+                                        self._chat_bucket(chat_id).pause(retry_after)
+                                await asyncio.sleep(retry_after)
+                                continue
+                        if code >= 500:
+                                await asyncio.sleep(min(30, 2 ** attempt))
+                                continue
+                        # Other 4xx: retrying won't help.
+                        return data
+                return data
+
+        async def _with_fallback(self, method: str, payload: dict, parse_mode):
+                if parse_mode:
+                        data = await self.call(method, {**payload, "text": to_telegram_markdown(payload["text"]), "parse_mode": parse_mode})
+                        if data.get("ok") or "can't parse entities" not in (data.get("description") or ""):
+                                return data
+                        print(f"Markdown rejected for {payload.get('chat_id')}, resending as plain text")
+                        payload = {**payload, "text": remove_markdown(payload["text"])}
+                return await self.call(method, payload)
+
+        async def send_text(self, chat_id, text: str, parse_mode="Markdown", start: int = 0, on_sent=None) -> dict:
+                """Send `text` as split_message() chunks, beginning with chunk `start`.
+
+                on_sent(n) is awaited after each accepted chunk with the number of
+                chunks delivered so far, so a failed send can be resumed.
+                """
+                chunks = split_message(text)
+                if not chunks:
+                        return {"ok": False, "description": "empty message"}
+                data = {"ok": True, "result": None}
+                for i in range(start, len(chunks)):
+                        data = await self._with_fallback("sendMessage", {"chat_id": chat_id, "text": chunks[i]}, parse_mode)
+                        if not data.get("ok"):
+                                print(f"Error sending response: {data.get('description')}")
+                                return data
+                        if on_sent:
+                                await on_sent(i + 1)
+                return data
+
+        async def edit_text(self, chat_id, message_id, text: str, parse_mode=None) -> dict:
+                data = await self._with_fallback(
+                        "editMessageText",
+                        {"chat_id": chat_id, "message_id": message_id, "text": text[:TELEGRAM_MAX_CHARS]},
+                        parse_mode,
+                )
+                if "message is not modified" in (data.get("description") or ""):
+                        return {"ok": True, "result": None}
+                return data
+
+        async def close(self):
+                if self._session is not None and not self._session.closed:
+                        await self._session.close()
+                self._session = None
+
+
+def split_message(text: str, limit: int = TELEGRAM_MAX_CHARS) -> list:
+        """Split at paragraph, then line, then word boundaries so each part fits."""
+        chunks = []
+        text = text or ""
+        while len(text) > limit:
+                window = text[:limit]
+                cut = max(window.rfind("\n\n"), window.rfind("\n"))
+                if cut < limit // 2:
+                        cut = window.rfind(" ")
+                if cut < limit // 2:
+                        cut = limit
+                chunks.append(text[:cut].rstrip())
+                text = text[cut:].lstrip()
+        if text:
+                chunks.append(text)
+        return chunks
+
+
+telegram = TelegramClient()
+
+
+def delivery_failed_permanently(data: dict) -> bool:
+        """A 4xx other than 429 (bot blocked, chat not found, bad request): resending won't help."""
+        code = (data or {}).get("error_code") or 0
+        return 400 <= code < 500 and code != 429
+
+
+async def send_response(text, chat_id, start: int = 0, on_sent=None):
+        return await telegram.send_text(chat_id, text, start=start, on_sent=on_sent)
+
+async def send_message(text, chat_id, parse_mode=None):
+        return await telegram.send_text(chat_id, text, parse_mode)
+
+async def edit_message(chat_id, message_id, text, parse_mode=None):
+        return await telegram.edit_text(chat_id, message_id, text, parse_mode)
+
+async def close_telegram_client():
+        await telegram.close()
 
 def send_response_old(message, chat_id):
         url = f"https://api.telegram.org/bot{os.getenv('TELEGRAM_BOT_TOKEN_CHAT')}/sendMessage"
@@ -28,4 +215,4 @@ def send_response_old(message, chat_id):
         if response.status_code == 200:
                 return "Message sent successfully"
         else:
-                return f"Failed to send message: {response.status_code} - {response.text}"
\ No newline at end of file
+                return f"Failed to send message: {response.status_code} - {response.text}"
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _parse_weights(spec: str) -> dict:
+        weights = {}
+        for part in spec.split(","):
+                name, _, weight = part.partition("=")
+                if name.strip():
+                        weights[name.strip()] = max(1, int(weight or 1))
+        return weights
+
+
+# Lanes in priority order with their share of dispatches when both have work.
+SCHED_LANES = _parse_weights(os.getenv("SCHED_LANES", "interactive=8,bulk=1"))
+DEFAULT_LANE = next(iter(SCHED_LANES))
+# Messages buffered locally so the scheduler can choose between chats.
+SCHED_BUFFER = int(os.getenv("SCHED_BUFFER", "200"))
+SCHED_CHAT_MAX_IN_FLIGHT = int(os.getenv("SCHED_CHAT_MAX_IN_FLIGHT", "2"))
+# A message costs one unit per SCHED_COST_CHARS of input, capped at SCHED_MAX_COST.
+SCHED_COST_CHARS = int(os.getenv("SCHED_COST_CHARS", "1000"))
+SCHED_MAX_COST = int(os.getenv("SCHED_MAX_COST", "4"))
+_WAIT_SAMPLES = 512
+
+
+class Scheduled:
+        __slots__ = ("entry_id", "data", "chat_id", "lane", "cost", "enqueued_at")
+
+        def __init__(self, entry_id, data, chat_id, lane, cost, enqueued_at):
+                self.entry_id = entry_id
+                self.data = data
+                self.chat_id = chat_id
+                self.lane = lane
+                self.cost = cost
+                self.enqueued_at = enqueued_at
+
+
+def _entry_time(entry_id: str) -> float:
+        # Stream ids start with the XADD time in milliseconds.
+        try:
+                return int(entry_id.split("-", 1)[0]) / 1000
+        except ValueError:
+                return time.time()
+
+
+def classify(entry_id: str, data: Optional[bytes]) -> Scheduled:
+        try:
+                message = json.loads(data)
+                chat_id = message.get("chat_id")
+                if chat_id is None or chat_id == "":
+                        # API and batch jobs without a chat don't share one queue
+                        # (and one in-flight cap); each job is its own.
+                        chat_id = f"job:{message.get('job_id') or entry_id}"
+                else:
+                        chat_id = str(chat_id)
+                lane = message.get("lane") if message.get("lane") in SCHED_LANES else DEFAULT_LANE
+                cost = min(SCHED_MAX_COST, 1 + len(message.get("input") or "") // SCHED_COST_CHARS)
+        except Exception:
+                # process_entry deals with unreadable entries; just get them there.
+                chat_id, lane, cost = f"entry:{entry_id}", DEFAULT_LANE, 1
+        return Scheduled(entry_id, data, chat_id, lane, cost, _entry_time(entry_id))
+
+
+class _Lane:
+        """Deficit round robin over the chats that have messages in this lane."""
+
+        def __init__(self, name: str, weight: int):
+                self.name = name
+                self.weight = weight
+                self.current = 0
+                self.queues = OrderedDict()
+                self.ring = deque()
+                self.deficit = {}
+                self.depth = 0
+                self.dispatched = 0
+                self.waits = deque(maxlen=_WAIT_SAMPLES)
+
+        def push(self, item: Scheduled):
+                queue = self.queues.get(item.chat_id)
+                if queue is None:
+                        queue = self.queues[item.chat_id] = deque()
+                        self.ring.append(item.chat_id)
+                        self.deficit[item.chat_id] = 0
+                queue.append(item)
+                self.depth += 1
+
+        def pop(self, in_flight: dict) -> Optional[Scheduled]:
+                blocked = 0
+                while self.ring and blocked < len(self.ring):
+                        chat_id = self.ring[0]
+                        if in_flight.get(chat_id, 0) >= SCHED_CHAT_MAX_IN_FLIGHT:
+                                # Capped chats neither run nor bank credit.
+                                self.ring.rotate(-1)
+                                blocked += 1
+                                continue
+                        blocked = 0
+                        queue = self.queues[chat_id]
+                        if self.deficit[chat_id] < queue[0].cost:
+                                self.deficit[chat_id] += 1
+                                self.ring.rotate(-1)
+                                continue
+                        item = queue.popleft()
+                        self.deficit[chat_id] -= item.cost
+                        self.depth -= 1
+                        if not queue:
+                                self.ring.popleft()
+                                del self.queues[chat_id]
+                                del self.deficit[chat_id]
+                        return item
+                return None
+
+        def snapshot(self) -> dict:
+                waits = sorted(self.waits)
+                return {
+                        "depth": self.depth,
+                        "chats": len(self.queues),
+                        "dispatched": self.dispatched,
+                        "wait_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                        "wait_p95": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+                        "wait_max": round(waits[-1], 3) if waits else 0.0,
+                }
+
+
+class FairScheduler:
+        """Chooses which buffered stream entry runs next.
+
+        Lanes share dispatches by smooth weighted round robin (SCHED_LANES),
+        so bulk jobs still progress while interactive chats go first. Inside
+        a lane, chats take turns by deficit round robin weighted by message
+        cost, and a chat never has more than SCHED_CHAT_MAX_IN_FLIGHT
+        messages running: one chat pasting fifty headlines no longer holds
+        up everyone behind it.
+        """
+
+        def __init__(self, lanes: dict = None):
+                self.lanes = {name: _Lane(name, weight) for name, weight in (lanes or SCHED_LANES).items()}
+                self.in_flight = {}
+                self._entries = {}
+
+        def __len__(self) -> int:
+                return len(self._entries)
+
+        def push(self, item: Scheduled):
+                self._entries[item.entry_id] = item
+                self.lanes.get(item.lane, self.lanes[DEFAULT_LANE]).push(item)
+
+        def pop(self) -> Optional[Scheduled]:
+                candidates = [lane for lane in self.lanes.values() if lane.depth]
+                if not candidates:
+                        return None
+                total = sum(lane.weight for lane in candidates)
+                for lane in candidates:
+                        lane.current += lane.weight
+                for lane in sorted(candidates, key=lambda l: -l.current):
+                        item = lane.pop(self.in_flight)
+                        if item is None:
+                                continue
+                        lane.current -= total
+                        lane.dispatched += 1
+                        lane.waits.append(max(0.0, time.time() - item.enqueued_at))
+                        self.in_flight[item.chat_id] = self.in_flight.get(item.chat_id, 0) + 1
+                        del self._entries[item.entry_id]
+                        return item
+                # Everything buffered belongs to capped chats.
+                for lane in candidates:
+                        lane.current -= lane.weight
+                return None
+
+        def done(self, item: Scheduled):
+                left = self.in_flight.get(item.chat_id, 0) - 1
+                if left > 0:
+                        self.in_flight[item.chat_id] = left
+                else:
+                        self.in_flight.pop(item.chat_id, None)
+
+        def entry_ids(self) -> list:
+                return list(self._entries)
+
+        def snapshot(self) -> dict:
+                return {name: lane.snapshot() for name, lane in self.lanes.items()}
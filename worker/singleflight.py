@@ -0,0 +1,149 @@
+import os
+import uuid
+import asyncio
+from contextlib import nullcontext
+
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Must outlive the slowest agent run, or a second leader may start.
+SINGLEFLIGHT_LOCK_TTL = int(os.getenv("SINGLEFLIGHT_LOCK_TTL", "300"))
+SINGLEFLIGHT_RESULT_TTL = int(os.getenv("SINGLEFLIGHT_RESULT_TTL", "120"))
+
+_PREFIX = "singleflight:"
+_FAILED = b"\x00failed"
+
+# Take the lock and drop the previous flight's result in one step, so a
+# follower never mistakes an old result (or failure) for this flight's.
+_ACQUIRE = """
+if redis.call("set", KEYS[1], ARGV[1], "NX", "EX", ARGV[2]) then
+        redis.call("del", KEYS[2])
+        return 1
+end
+return 0
+"""
+
+# Delete the lock only if we still own it.
+_RELEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderFailed(RuntimeError):
+        """The leader on another replica ran the call and it raised."""
+
+
+class SingleFlight:
+        """Coalesce concurrent calls for the same key into one execution.
+
+        Within a process, followers await the leader's future. Across replicas
+        the leader holds a Redis lock (SET NX EX); when it finishes it stores
+        the result briefly and publishes on a channel that remote followers
+        are subscribed to. When the leader's call raises, every follower
+        raises too: the leader's exception locally, LeaderFailed on other
+        replicas. Only a leader that vanishes without answering (or a Redis
+        error) makes followers run the call themselves.
+
+        `waiting` is an async context manager factory entered while a caller
+        waits as a follower, e.g. AdaptiveLimiter.yield_slot.
+        """
+
+        def __init__(self):
+                self._redis = None
+                self._local = {}
+                self.leaders = 0
+                self.followers = 0
+
+        def _get_redis(self):
+                if self._redis is None:
+                        self._redis = aioredis.Redis(host=os.getenv("REDIS_HOST"), port=6379, db=0)
+                return self._redis
+
+        async def do(self, key: str, fn, waiting=nullcontext):
+                if key in self._local:
+                        self.followers += 1
+                        async with waiting():
+                                return await asyncio.shield(self._local[key])
+
+                future = asyncio.get_running_loop().create_future()
+                self._local[key] = future
+                try:
+                        result = await self._do_shared(key, fn, waiting)
+                        future.set_result(result)
+                        return result
+                except BaseException as e:
+                        future.set_exception(e)
+                        # Nobody else may be waiting on it; don't warn about it.
+                        future.exception()
+                        raise
+                finally:
+                        self._local.pop(key, None)
+
+        async def _do_shared(self, key: str, fn, waiting):
+                r = self._get_redis()
+                lock, result_key, channel = f"{_PREFIX}lock:{key}", f"{_PREFIX}result:{key}", f"{_PREFIX}done:{key}"
+                token = uuid.uuid4().hex
+                try:
+                        is_leader = await r.eval(_ACQUIRE, 2, lock, result_key, token, SINGLEFLIGHT_LOCK_TTL)
+                except Exception as e:
+                        print(f"[singleflight] lock failed, running locally: {e}")
+                        return await fn()
+
+                if not is_leader:
+                        self.followers += 1
+                        async with waiting():
+                                result = await self._wait_for_leader(r, lock, result_key, channel)
+                        if result is _FAILED:
+                                raise LeaderFailed(f"leader for {key[:12]} failed")
+                        if result is not None:
+                                return result
+                        print(f"[singleflight] leader for {key[:12]} gave no result, running it here")
+                        return await fn()
+
+                self.leaders += 1
+                payload = _FAILED
+                try:
+                        result = await fn()
+                        payload = result.encode("utf-8")
+                        return result
+                finally:
+                        try:
+                                await r.set(result_key, payload, ex=SINGLEFLIGHT_RESULT_TTL)
+                                await r.publish(channel, payload)
+                                await r.eval(_RELEASE, 1, lock, token)
+                        except Exception as e:
+                                print(f"[singleflight] publish failed: {e}")
+
+        async def _wait_for_leader(self, r, lock: str, result_key: str, channel: str):
+                pubsub = r.pubsub()
+                try:
+                        await pubsub.subscribe(channel)
+                        # The leader may have finished before we subscribed.
+                        payload = await r.get(result_key)
+                        deadline = asyncio.get_running_loop().time() + SINGLEFLIGHT_LOCK_TTL
+                        while payload is None:
+                                remaining = deadline - asyncio.get_running_loop().time()
+                                if remaining <= 0:
+                                        return None
+                                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, 5))
+                                if message is not None:
+                                        payload = message["data"]
+                                elif not await r.exists(lock):
+                                        # Leader died without publishing.
+                                        payload = await r.get(result_key)
+                                        if payload is None:
+                                                return None
+                        return _FAILED if payload == _FAILED else payload.decode("utf-8")
+                except Exception as e:
+                        print(f"[singleflight] wait failed: {e}")
+                        return None
+                finally:
+                        await pubsub.aclose()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,36 @@
+import time
+from contextlib import contextmanager
+
+from .metrics import STARTUP_SECONDS
+
+
+class StartupTimer:
+        """Wall time of each startup phase, relative to when the worker began importing.
+
+        Phases may overlap (connections and warm-up run concurrently); each
+        records its own duration and "ready" marks are offsets from the start.
+        """
+
+        def __init__(self, started: float):
+                self.started = started
+                self.phases = {}
+
+        def record(self, name: str, seconds: float):
+                self.phases[name] = seconds
+                STARTUP_SECONDS.labels(phase=name).set(seconds)
+
+        def mark(self, name: str):
+                """Record how long after process start `name` happened."""
+                self.record(name, time.perf_counter() - self.started)
+
+        @contextmanager
+        def phase(self, name: str):
+                start = time.perf_counter()
+                try:
+                        yield
+                finally:
+                        self.record(name, time.perf_counter() - start)
+
+        def report(self, title: str = "startup"):
+                phases = " ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases.items())
+                print(f"[{title}] {phases}")
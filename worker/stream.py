@@ -0,0 +1,101 @@
+import os
+import socket
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_STREAM_KEY = os.getenv("REDIS_STREAM_KEY", "fact_checks")
+REDIS_STREAM_GROUP = os.getenv("REDIS_STREAM_GROUP", "workers")
+REDIS_STREAM_MAXLEN = int(os.getenv("REDIS_STREAM_MAXLEN", "100000"))
+# An entry unacked for this long is considered abandoned by a dead consumer.
+# Must stay well above the longest agent run.
+STREAM_CLAIM_IDLE_MS = int(os.getenv("STREAM_CLAIM_IDLE_MS", "300000"))
+STREAM_MAX_DELIVERIES = int(os.getenv("STREAM_MAX_DELIVERIES", "3"))
+
+Entry = Tuple[str, bytes]
+
+
+class StreamConsumer:
+        """One member of the worker consumer group on REDIS_STREAM_KEY.
+
+        Entries stay in the group's pending list until ack() is called, so a
+        crash or redeploy never loses a fact-check: after STREAM_CLAIM_IDLE_MS
+        another consumer takes it over with claim_stalled(). Entries delivered
+        more than STREAM_MAX_DELIVERIES times are moved to "<stream>:dead",
+        and on_dead(entry_id, data) is awaited for each.
+        """
+
+        def __init__(self, r: aioredis.Redis, name: str = None,
+                     on_dead: Optional[Callable[[str, bytes], Awaitable[None]]] = None):
+                self.r = r
+                self.on_dead = on_dead
+                self.name = name or os.getenv("STREAM_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+                self.key = REDIS_STREAM_KEY
+                self.group = REDIS_STREAM_GROUP
+                self._claim_cursor = "0-0"
+
+        async def ensure_group(self):
+                try:
+                        await self.r.xgroup_create(self.key, self.group, id="0", mkstream=True)
+                except ResponseError as e:
+                        if "BUSYGROUP" not in str(e):
+                                raise
+
+        async def read(self, count: int, block_ms: Optional[int] = 1000) -> List[Entry]:
+                """Up to count new entries; block_ms=None returns at once."""
+                if count <= 0:
+                        return []
+                resp = await self.r.xreadgroup(self.group, self.name, {self.key: ">"}, count=count, block=block_ms)
+                return [(_id(entry_id), fields.get(b"data")) for _, items in (resp or []) for entry_id, fields in items]
+
+        async def claim_stalled(self, count: int) -> List[Entry]:
+                if count <= 0:
+                        return []
+                self._claim_cursor, claimed, _ = await self.r.xautoclaim(
+                        self.key, self.group, self.name,
+                        min_idle_time=STREAM_CLAIM_IDLE_MS, start_id=self._claim_cursor, count=count,
+                )
+                self._claim_cursor = _id(self._claim_cursor)
+                claimed = [(_id(entry_id), fields.get(b"data")) for entry_id, fields in claimed if fields]
+                if not claimed:
+                        return []
+
+                pending = await self.r.xpending_range(
+                        self.key, self.group, min=claimed[0][0], max=claimed[-1][0],
+                        count=len(claimed), consumername=self.name,
+                )
+                deliveries = {_id(p["message_id"]): p["times_delivered"] for p in pending}
+                out = []
+                for entry_id, data in claimed:
+                        if deliveries.get(entry_id, 0) > STREAM_MAX_DELIVERIES:
+                                print(f"[stream] {entry_id} exceeded {STREAM_MAX_DELIVERIES} deliveries, dead-lettering")
+                                await self.r.xadd(f"{self.key}:dead", {"data": data, "id": entry_id}, maxlen=REDIS_STREAM_MAXLEN, approximate=True)
+                                await self.ack(entry_id)
+                                if self.on_dead is not None:
+                                        try:
+                                                await self.on_dead(entry_id, data)
+                                        except Exception as e:
+                                                print(f"[stream] on_dead for {entry_id} failed: {e}")
+                                continue
+                        out.append((entry_id, data))
+                return out
+
+        async def heartbeat(self, entry_ids: List[str]):
+                """Reset the idle time of entries we hold, buffered or running.
+
+                XCLAIM JUSTID to ourselves doesn't count as a delivery, and keeps
+                claim_stalled() on other consumers away from entries we still own.
+                """
+                if entry_ids:
+                        await self.r.xclaim(self.key, self.group, self.name, min_idle_time=0, message_ids=entry_ids, justid=True)
+
+        async def ack(self, entry_id: str):
+                await self.r.xack(self.key, self.group, entry_id)
+
+
+def _id(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
@@ -1,35 +1,51 @@
-from langchain.tools import BaseTool
+from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Type, List, Dict, Any, Optional
 import os
 import json
 import asyncio
 import re
-from datetime import datetime, timedelta
-
-from serpapi import GoogleSearch
+import time
+import codecs
+import importlib.util
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
 import aiohttp
 from dotenv import load_dotenv
 
+from .cache import search_cache, search_cache_key, search_ttl, page_cache, page_cache_key, PAGE_CACHE_FRESH, PAGE_CACHE_RETAIN
+from .http_client import get_http_session
+from .extract import extract_text_async, EXTRACT_MAX_BYTES
+from .limiter import search_limiter, fetch_limiter
+from .compaction import current_budget, count_tokens, EVIDENCE_TOKENS_PER_SOURCE
+from .metrics import span
+
 load_dotenv(override=True)
 
-try:
-        from duckduckgo_search import DDGS
-        _HAS_DDG = True
-except Exception:
-        _HAS_DDG = False
+# The search SDKs are imported by the first search that needs them.
+_HAS_DDG = importlib.util.find_spec("duckduckgo_search") is not None
+_HAS_SERP = importlib.util.find_spec("serpapi") is not None
 
-try:
-        _HAS_SERP = True
-except Exception:
-        _HAS_SERP = False
+SEARCH_ENGINE_TIMEOUT = float(os.getenv("SEARCH_ENGINE_TIMEOUT", "8"))
+SEARCH_TOTAL_TIMEOUT = float(os.getenv("SEARCH_TOTAL_TIMEOUT", "12"))
+SEARCH_THREADS = int(os.getenv("SEARCH_THREADS", "16"))
+# Calls one engine may have in _search_pool at once, counting timed-out ones
+# still stuck in their thread; past that the engine is skipped, not queued.
+SEARCH_ENGINE_THREADS = int(os.getenv("SEARCH_ENGINE_THREADS", str(max(1, SEARCH_THREADS // 4))))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(EXTRACT_MAX_BYTES)))
+FETCH_CHUNK_BYTES = 64 * 1024
 
-try:
-        import trafilatura
-        _HAS_TRAF = True
-except Exception:
-        _HAS_TRAF = False
+_TEXT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/xml", "application/xml")
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([A-Za-z0-9_.:-]+)""", re.I)
+
+# Blocking SDK calls (serpapi, duckduckgo_search) run here so a hung engine
+# can't starve the default executor used by asyncio.to_thread elsewhere.
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="news_search")
+_engine_threads = defaultdict(int)
+_engine_threads_lock = threading.Lock()
 
 """ INIT Inputs """
 class NewsSearchInput(BaseModel):
@@ -73,26 +89,87 @@ def _dedupe(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                 out.append(r)
         return out
 
-async def _fetch(session: aiohttp.ClientSession, url: str, timeout: int = 15) -> str:
-        async with session.get(url, timeout=timeout, headers={"User-Agent": "Mozilla/5.0 (NewsAgent/1.0)"}) as resp:
+def _sniff_charset(head: bytes) -> Optional[str]:
+        if head.startswith(codecs.BOM_UTF8):
+                return "utf-8-sig"
+        match = _META_CHARSET.search(head[:4096])
+        return match.group(1).decode("ascii") if match else None
+
+def _decoder_for(charset: Optional[str]):
+        try:
+                return codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+        except LookupError:
+                return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+async def _fetch(session: aiohttp.ClientSession, url: str, timeout: int = 15, headers: Optional[Dict[str, str]] = None, max_bytes: int = FETCH_MAX_BYTES):
+        """Stream at most max_bytes of a text page, decoding as it arrives.
+
+        Non-text responses (PDFs, images, ...) are refused from the headers alone;
+        anything beyond the byte budget is never downloaded.
+        """
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout), headers=headers) as resp:
+                if resp.status == 304:
+                        return resp.status, "", resp.headers
                 resp.raise_for_status()
-                return await resp.text()
+                mime = (resp.content_type or "").lower()
+                if resp.headers.get("Content-Type") and mime not in _TEXT_TYPES:
+                        raise ValueError(f"unsupported:{mime}")
+                if resp.content_length and resp.content_length > max_bytes:
+                        print(f"[fetch] {url} is {resp.content_length} bytes, reading first {max_bytes}")
+
+                decoder = None
+                parts = []
+                received = 0
+                async for chunk in resp.content.iter_chunked(FETCH_CHUNK_BYTES):
+                        if decoder is None:
+                                if chunk.startswith(b"%PDF-"):
+                                        raise ValueError("unsupported:application/pdf")
+                                decoder = _decoder_for(resp.charset or _sniff_charset(chunk))
+                        chunk = chunk[:max_bytes - received]
+                        received += len(chunk)
+                        parts.append(decoder.decode(chunk))
+                        if received >= max_bytes:
+                                break
+                if decoder is not None:
+                        parts.append(decoder.decode(b"", final=True))
+                return resp.status, "".join(parts), resp.headers
 
-def _extract_text(html: str, url: str) -> str:
-        if _HAS_TRAF:
-                txt = trafilatura.extract(html, include_comments=False, include_tables=False, favor_recall=True, url=url)
-                if txt:
-                        return " ".join(txt.split())
-        txt = re.sub(r"<script[\s\S]*?</script>", " ", html, flags=re.I)
-        txt = re.sub(r"<style[\s\S]*?</style>", " ", txt, flags=re.I)
-        txt = re.sub(r"<[^>]+>", " ", txt)
-        txt = re.sub(r"\s+", " ", txt)
-        return txt.strip()
+async def _fetch_text(url: str) -> str:
+        """Fetch and extract a page through the shared pool and the page cache."""
+        key = page_cache_key(url)
+        entry = await page_cache.get(key)
+        if entry and entry["fresh_until"] > time.time():
+                return entry["text"]
+
+        validators = {}
+        if entry and entry.get("etag"):
+                validators["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+                validators["If-Modified-Since"] = entry["last_modified"]
+
+        async with fetch_limiter.acquire():
+                with span("fetch"):
+                        status, html, headers = await _fetch(get_http_session(), url, headers=validators)
+        if status == 304 and entry:
+                text = entry["text"]
+        else:
+                # Timed here: extract.py is imported by the pool's children and stays lean.
+                with span("extract"):
+                        text = await extract_text_async(html, url)
+        if text:
+                await page_cache.set(key, {
+                        "text": text,
+                        "etag": headers.get("ETag") or (entry or {}).get("etag"),
+                        "last_modified": headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+                        "fresh_until": time.time() + PAGE_CACHE_FRESH,
+                }, PAGE_CACHE_RETAIN)
+        return text
 
 
 def _ddg_news(query: str, max_results: int, days: int) -> List[Dict[str, Any]]:
         if not _HAS_DDG:
                 return []
+        from duckduckgo_search import DDGS
         tl = "d" if days <= 1 else ("w" if days <= 7 else "m")
         out = []
         with DDGS() as ddgs:
@@ -110,6 +187,7 @@ def _ddg_news(query: str, max_results: int, days: int) -> List[Dict[str, Any]]:
 def _ddg_web(query: str, max_results: int) -> List[Dict[str, Any]]:
         if not _HAS_DDG:
                 return []
+        from duckduckgo_search import DDGS
         out = []
         with DDGS() as ddgs:
                 for r in ddgs.text(query, max_results=max_results, region="wt-wt", safesearch="off"):
@@ -135,6 +213,7 @@ def _serp_google_news(query: str, max_results: int, days: int) -> List[Dict[str,
                 "api_key": os.environ["SERPAPI_API_KEY"]
         }
         cutoff = datetime.utcnow() - timedelta(days=days)
+        from serpapi import GoogleSearch
         search = GoogleSearch(params)
         data = search.get_dict() or {}
         articles = data.get("news_results", []) or data.get("articles", [])
@@ -166,6 +245,7 @@ def _serp_google_web(query: str, max_results: int) -> List[Dict[str, Any]]:
                 "num": max_results,
                 "api_key": os.environ["SERPAPI_API_KEY"]
         }
+        from serpapi import GoogleSearch
         search = GoogleSearch(params)
         data = search.get_dict() or {}
         out = []
@@ -181,6 +261,101 @@ def _serp_google_web(query: str, max_results: int) -> List[Dict[str, Any]]:
         return out
 
 
+def _search_engines(query: str, max_results: int, days: int) -> Dict[str, tuple]:
+        web_results = min(6, max_results)
+        # name -> (fn, args, days used for the cache key; web engines ignore days)
+        return {
+                "google_news_serpapi": (_serp_google_news, (query, max_results, days), days),
+                "google_web_serpapi": (_serp_google_web, (query, web_results), None),
+                "duckduckgo_news": (_ddg_news, (query, max_results, days), days),
+                "duckduckgo_web": (_ddg_web, (query, web_results), None),
+        }
+
+def _engine_timeout(name: str) -> float:
+        return float(os.getenv(f"SEARCH_TIMEOUT_{name.upper()}", SEARCH_ENGINE_TIMEOUT))
+
+def _release_engine_thread(name: str):
+        with _engine_threads_lock:
+                _engine_threads[name] -= 1
+
+def _submit_engine(name: str, fn, args: tuple) -> asyncio.Future:
+        """Run a blocking engine call on _search_pool, at most SEARCH_ENGINE_THREADS per engine.
+
+        A timed-out call can't be stopped and keeps its thread until the SDK
+        returns; the cap keeps one hung engine from taking every thread.
+        """
+        with _engine_threads_lock:
+                if _engine_threads[name] >= SEARCH_ENGINE_THREADS:
+                        raise RuntimeError(f"{_engine_threads[name]} earlier calls still running")
+                _engine_threads[name] += 1
+        try:
+                future = _search_pool.submit(fn, *args)
+        except BaseException:
+                _release_engine_thread(name)
+                raise
+        # Fires when the thread finishes, or when a queued call is cancelled.
+        future.add_done_callback(lambda _: _release_engine_thread(name))
+        return asyncio.wrap_future(future)
+
+async def _run_engine(name: str, fn, args: tuple, days: Optional[int]) -> List[Dict[str, Any]]:
+        key = search_cache_key(name, args[0], args[1], days)
+        cached = await search_cache.get(key)
+        if cached is not None:
+                return cached
+        async with search_limiter.acquire():
+                with span(f"search:{name}"):
+                        results = await asyncio.wait_for(_submit_engine(name, fn, args), timeout=_engine_timeout(name))
+        # Empty lists are usually a throttled or disabled backend, not a real answer.
+        if results:
+                await search_cache.set(key, results, search_ttl(days))
+        return results
+
+async def _search_all(query: str, max_results: int, days: int, total_timeout: float = SEARCH_TOTAL_TIMEOUT):
+        """Fan out to every engine at once and collect what arrives before the deadline.
+
+        Returns the merged results (in engine order, so dedupe keeps the same
+        preference as before) and a report of which engines were ok, slow or failed.
+        """
+        engines = _search_engines(query, max_results, days)
+        tasks = {name: asyncio.create_task(_run_engine(name, fn, args, key_days)) for name, (fn, args, key_days) in engines.items()}
+        done, pending = await asyncio.wait(tasks.values(), timeout=total_timeout)
+        for task in pending:
+                task.cancel()
+
+        results = []
+        report = {"ok": [], "slow": [], "failed": []}
+        for name, task in tasks.items():
+                if task in pending:
+                        report["slow"].append(name)
+                        continue
+                try:
+                        results += task.result()
+                        report["ok"].append(name)
+                except asyncio.TimeoutError:
+                        report["slow"].append(name)
+                except Exception as e:
+                        report["failed"].append(f"{name}: {e}")
+        return results, report
+
+
+def compact_result(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Short-key form of a search hit; drops empty fields and trims the snippet to the budget."""
+        budget = current_budget()
+        out = {"t": item.get("title"), "u": item.get("url"), "src": item.get("source")}
+        if item.get("published_at"):
+                out["d"] = item["published_at"][:10]
+        snippet = " ".join((item.get("snippet") or "").split())
+        if snippet and not budget.is_duplicate(snippet):
+                tokens = count_tokens(snippet)
+                if tokens <= budget.remaining:
+                        budget.keep(snippet, tokens)
+                        out["s"] = snippet
+        return {k: v for k, v in out.items() if v}
+
+def _compact_json(data) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
 """ Tools """
 class NewsSearchTool(BaseTool):
         name: str = "news_search"
@@ -188,38 +363,44 @@ class NewsSearchTool(BaseTool):
                 "Searches for the most relevant and recent news articles and web results "
                 "related to a given query. Combines multiple sources (Google News, Google Web, "
                 "DuckDuckGo News, DuckDuckGo Web), removes duplicates, sorts results by "
-                "publication date, and returns the top matches in JSON format."
+                "publication date, and returns the top matches as a compact JSON list with keys "
+                "t (title), u (url), src (source), d (publication date, YYYY-MM-DD) and s (snippet)."
         )
         args_schema: Type[BaseModel] = NewsSearchInput
 
         def _run(self, query: str, max_results: int = 8, days: int = 7) -> str:
-                results = []
-                results += _serp_google_news(query, max_results=max_results, days=days)
-                results += _serp_google_web(query, max_results=min(6, max_results))
-                results += _ddg_news(query, max_results=max_results, days=days)
-                results += _ddg_web(query, max_results=min(6, max_results))
+                return asyncio.run(self._arun(query, max_results, days))
+
+        async def _arun(self, query: str, max_results: int = 8, days: int = 7) -> str:
+                results = await self.search(query, max_results=max_results, days=days)
+                return _compact_json([compact_result(r) for r in results])
+
+        async def search(self, query: str, max_results: int = 8, days: int = 7) -> List[Dict[str, Any]]:
+                results, report = await _search_all(query, max_results=max_results, days=days)
                 unique = _dedupe(results)
+                epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
                 def _score(item):
                         ts = item.get("published_at")
                         try:
-                                return datetime.fromisoformat(ts.replace("Z", "+00:00")) if ts else datetime(1970, 1, 1)
+                                dt = datetime.fromisoformat(ts.replace("Z", "+00:00")) if ts else epoch
                         except Exception:
-                                return datetime(1970, 1, 1)
+                                return epoch
+                        # Undated web hits must compare with dated news hits.
+                        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
                 unique.sort(key=_score, reverse=True)
-                print(f"[news_search] Found {len(unique)} unique results for query='{query}'")
-                return json.dumps(unique[:max_results], ensure_ascii=False)
-
-        async def _arun(self, query: str, max_results: int = 8, days: int = 7) -> str:
-                return await asyncio.to_thread(self._run, query, max_results, days)
+                print(f"[news_search] Found {len(unique)} unique results for query='{query}' "
+                      f"(ok={report['ok']} slow={report['slow']} failed={report['failed']})")
+                return unique[:max_results]
 
 
 class FetchAndSummarizeTool(BaseTool):
         name: str = "fetch_and_summarize"
         description: str = (
                 "Fetches the content of a given URL, extracts clean readable text from the HTML, "
-                "and returns a JSON object containing the page URL, an optional title, "
-                "a text excerpt (up to the specified character limit), and the fetch timestamp. "
-                "If extraction fails or the page is empty, an error message is included."
+                "and returns a compact JSON object: u (page URL), t (optional title), "
+                "x (the sentences most relevant to the claim, up to the specified character limit) "
+                "and at (fetch timestamp). If extraction fails, the page is empty or only repeats "
+                "evidence already seen, err explains why."
         )
         args_schema: Type[BaseModel] = FetchAndSummarizeInput
 
@@ -231,25 +412,32 @@ class FetchAndSummarizeTool(BaseTool):
 
         async def _async_impl(self, url: str, char_limit: int) -> str:
                 try:
-                        async with aiohttp.ClientSession() as session:
-                                html = await _fetch(session, url)
-                        text = _extract_text(html, url)
+                        text = await _fetch_text(url)
                         if not text:
-                                return json.dumps({"url": url, "title": None, "excerpt": "", "error": "empty"}, ensure_ascii=False)
+                                return _compact_json({"u": url, "err": "empty"})
                         head = text.split(". ")[0].strip()
                         title = head if 5 <= len(head) <= 180 else None
+                        # Only claim-relevant, not-yet-seen sentences, within the run's token budget.
+                        budget = current_budget()
+                        excerpt = await asyncio.to_thread(
+                                budget.compact, text, min(EVIDENCE_TOKENS_PER_SOURCE, count_tokens(text[:char_limit])),
+                        )
                         payload = {
-                                "url": url,
-                                "title": title,
-                                "excerpt": text[:char_limit],
-                                "fetched_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+                                "u": url,
+                                "t": title,
+                                "x": excerpt[:char_limit],
+                                "at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
                         }
-                        return json.dumps(payload, ensure_ascii=False)
+                        if not excerpt:
+                                payload["err"] = "evidence_budget_exhausted" if budget.remaining <= 0 else "duplicate"
+                        return _compact_json(payload)
                 except aiohttp.ClientResponseError as e:
                         err = f"{e.status} {getattr(e, 'message', '')}".strip()
-                        return json.dumps({"url": url, "title": None, "excerpt": "", "error": f"blocked:{err}"}, ensure_ascii=False)
+                        return _compact_json({"u": url, "err": f"blocked:{err}"})
+                except asyncio.TimeoutError:
+                        return _compact_json({"u": url, "err": "timeout"})
                 except Exception as e:
-                        return json.dumps({"url": url, "title": None, "excerpt": "", "error": str(e)}, ensure_ascii=False)
+                        return _compact_json({"u": url, "err": str(e)})
 """ END """
 
 def get_tools():
@@ -3,3 +3,9 @@ import re
 def remove_markdown(text):
         patterns = r'(\*\*|__)|(\*|_)|(`)|(\[.*?\]\(.*?\))|(\[|\]|\(|\))'
         return re.sub(patterns, '', text)
+
+def to_telegram_markdown(text):
+        # Telegram's legacy Markdown bolds with single asterisks and has no headings.
+        text = re.sub(r'\*\*(.+?)\*\*', r'*\1*', text)
+        text = re.sub(r'__(.+?)__', r'_\1_', text)
+        return re.sub(r'(?m)^#{1,6}\s+(.*)$', r'*\1*', text)
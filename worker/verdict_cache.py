@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import unicodedata
+from datetime import datetime, timezone
+from typing import Optional
+
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+from .cache import canonical_url
+
+load_dotenv()
+
+VERDICT_CACHE_ENABLED = os.getenv("VERDICT_CACHE", "1") == "1"
+# Shorter inputs are usually follow-ups that only make sense with chat context.
+VERDICT_MIN_WORDS = int(os.getenv("VERDICT_MIN_WORDS", "5"))
+VERDICT_MIN_SIMILARITY = float(os.getenv("VERDICT_MIN_SIMILARITY", "0.8"))
+VERDICT_MAX_CANDIDATES = 64
+
+_PREFIX = "verdict:"
+_PERMUTATIONS = 32
+_BANDS = 8
+_ROWS = _PERMUTATIONS // _BANDS
+_MERSENNE = (1 << 61) - 1
+_PERM_RNG = random.Random(0x5eed)
+_PERMS = [(_PERM_RNG.randrange(1, _MERSENNE), _PERM_RNG.randrange(0, _MERSENNE)) for _ in range(_PERMUTATIONS)]
+_DATE = re.compile(r"\b(20\d{2})-(\d{2})-(\d{2})\b")
+_URL = re.compile(r"https?://[^\s<>]+", re.I)
+_NEGATIONS = {"no", "not", "never", "none", "nobody", "nothing", "neither", "nor", "without", "fake", "false", "hoax",
+              "не", "нет", "ни", "никогда", "ничего", "никто", "без", "фейк", "ложь"}
+
+
+def normalize_claim(text: str) -> str:
+        """Lowercased words without punctuation, then every URL in canonical form.
+
+        URLs are kept whole: two links on the same site are different claims.
+        """
+        text = unicodedata.normalize("NFKC", text or "")
+        urls = [canonical_url(u.rstrip(".,;:!?)]}»\"'")) for u in _URL.findall(text)]
+        text = _URL.sub(" ", text).lower()
+        text = re.sub(r"</?user_question>", " ", text)
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split() + urls)
+
+
+def claim_hash(normalized: str) -> str:
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def minhash(normalized: str) -> list:
+        """MinHash signature over word bigrams; the share of equal slots estimates Jaccard."""
+        words = normalized.split()
+        shingles = {" ".join(words[i:i + 2]) for i in range(max(1, len(words) - 1))}
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+        return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS]
+
+
+def similarity(sig_a: list, sig_b: list) -> float:
+        return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def _bands(signature: list) -> list:
+        return [
+                hashlib.blake2b(repr(signature[i * _ROWS:(i + 1) * _ROWS]).encode(), digest_size=8).hexdigest()
+                for i in range(_BANDS)
+        ]
+
+
+def polarity_tokens(normalized: str) -> list:
+        """Numbers, negations and URLs: two claims that differ here are different
+        claims, however similar the rest of the wording is."""
+        return sorted({w for w in normalized.split() if w.isdigit() or w in _NEGATIONS or "://" in w})
+
+
+def verdict_ttl(report: str, now: Optional[datetime] = None) -> int:
+        """Freshness window from the newest evidence date in the report.
+
+        Breaking stories change quickly, so their verdicts are reused briefly;
+        claims about older events stay valid much longer.
+        """
+        now = now or datetime.now(timezone.utc)
+        newest = None
+        for y, m, d in _DATE.findall(report or ""):
+                try:
+                        dt = datetime(int(y), int(m), int(d), tzinfo=timezone.utc)
+                except ValueError:
+                        continue
+                if dt <= now and (newest is None or dt > newest):
+                        newest = dt
+        if newest is None:
+                return int(os.getenv("VERDICT_TTL_UNDATED", "3600"))
+        age_days = (now - newest).days
+        if age_days <= 2:
+                return int(os.getenv("VERDICT_TTL_BREAKING", "1800"))
+        if age_days <= 7:
+                return int(os.getenv("VERDICT_TTL_RECENT", "10800"))
+        return int(os.getenv("VERDICT_TTL_OLD", "86400"))
+
+
+class VerdictCache:
+        """Recent fact-check reports, looked up by exact hash and then by MinHash.
+
+        Each verdict is stored under verdict:<sha256>; its MinHash signature is
+        indexed in LSH band sets so near-duplicates are found with one SUNION
+        instead of a scan. A candidate is a hit when its estimated Jaccard
+        similarity is at least VERDICT_MIN_SIMILARITY and it has the same
+        numbers and negations as the query.
+        """
+
+        def __init__(self):
+                self._redis = None
+                self.hits_exact = 0
+                self.hits_near = 0
+                self.misses = 0
+
+        def _get_redis(self):
+                if self._redis is None:
+                        self._redis = aioredis.Redis(host=os.getenv("REDIS_HOST"), port=6379, db=0, socket_timeout=1)
+                return self._redis
+
+        @staticmethod
+        def cacheable(normalized: str) -> bool:
+                return VERDICT_CACHE_ENABLED and len(normalized.split()) >= VERDICT_MIN_WORDS
+
+        async def lookup(self, text: str) -> Optional[dict]:
+                normalized = normalize_claim(text)
+                if not self.cacheable(normalized):
+                        return None
+                try:
+                        r = self._get_redis()
+                        raw = await r.get(_PREFIX + claim_hash(normalized))
+                        if raw is not None:
+                                self.hits_exact += 1
+                                return {**json.loads(raw), "match": "exact"}
+
+                        signature = minhash(normalized)
+                        polarity = polarity_tokens(normalized)
+                        bands = [f"{_PREFIX}band:{i}:{b}" for i, b in enumerate(_bands(signature))]
+                        candidates = list(await r.sunion(bands))[:VERDICT_MAX_CANDIDATES]
+                        if candidates:
+                                best, best_score = None, VERDICT_MIN_SIMILARITY
+                                for raw in await r.mget([_PREFIX + c.decode() for c in candidates]):
+                                        if raw is None:
+                                                continue
+                                        entry = json.loads(raw)
+                                        if entry.get("polarity") != polarity:
+                                                continue
+                                        score = similarity(entry["minhash"], signature)
+                                        if score >= best_score:
+                                                best, best_score = entry, score
+                                if best is not None:
+                                        self.hits_near += 1
+                                        return {**best, "match": f"near:{best_score:.2f}"}
+                except Exception as e:
+                        print(f"[verdict_cache] lookup failed: {e}")
+                self.misses += 1
+                return None
+
+        async def store(self, text: str, report: str):
+                normalized = normalize_claim(text)
+                if not report or not self.cacheable(normalized):
+                        return
+                key = claim_hash(normalized)
+                signature = minhash(normalized)
+                ttl = verdict_ttl(report)
+                entry = {
+                        "report": report,
+                        "minhash": signature,
+                        "polarity": polarity_tokens(normalized),
+                        "created_at": int(time.time()),
+                }
+                try:
+                        async with self._get_redis().pipeline(transaction=False) as pipe:
+                                pipe.set(_PREFIX + key, json.dumps(entry, ensure_ascii=False), ex=ttl)
+                                for i, b in enumerate(_bands(signature)):
+                                        band = f"{_PREFIX}band:{i}:{b}"
+                                        pipe.sadd(band, key)
+                                        pipe.expire(band, ttl, gt=True)
+                                        pipe.expire(band, ttl, nx=True)
+                                await pipe.execute()
+                except Exception as e:
+                        print(f"[verdict_cache] store failed: {e}")
+
+        def stats(self) -> dict:
+                total = self.hits_exact + self.hits_near + self.misses
+                return {
+                        "hits_exact": self.hits_exact,
+                        "hits_near": self.hits_near,
+                        "misses": self.misses,
+                        "hit_rate": round((self.hits_exact + self.hits_near) / total, 3) if total else 0.0,
+                }
+
+
+verdict_cache = VerdictCache()